@@ -0,0 +1,296 @@
+"""
+content-hash fingerprinting of static assets
+
+Each referenced asset, e.g. css/style.css, is copied to css/style.<hash>.css
+and every href/src in a page is rewritten to point at the copy. Since the
+name changes whenever the content changes, the copies can be cached forever.
+
+The manifest of source -> fingerprinted path is stored across builds, along
+with the size and mtime of the source; an asset whose size and mtime are
+unchanged is not rehashed.
+
+Assets smaller than a threshold can instead be inlined as data uris.
+
+The asset store deduplicates assets by content: byte-identical files
+are all referenced by (and fingerprinted as) a single canonical path.
+"""
+
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from typing import Dict, Optional
+
+import treeparser
+
+# length of hex digest used in fingerprinted names
+DIGEST_LENGTH = 10
+# attributes that reference assets
+ASSET_ATTRS = ("href", "src")
+# (tag, rel) of nodes whose reference may be inlined as a data uri; rel=None matches any
+INLINE_NODES = {"img": ("src", None), "link": ("href", "icon")}
+# selectors of the nodes handled by inline_node and rewrite_node
+INLINE_SELECTOR = ", ".join(
+    tag if rel is None else f"{tag}[rel~={rel}]"
+    for tag, (_, rel) in INLINE_NODES.items()
+)
+ASSET_SELECTOR = ", ".join(f"[{attr}]" for attr in ASSET_ATTRS)
+# name of a fingerprinted copy, e.g. style.0123456789.css
+FINGERPRINTED_NAME = re.compile(rf"\.[0-9a-f]{{{DIGEST_LENGTH}}}\.[^.]+$")
+
+
+def file_digest(filepath: str) -> str:
+    """
+    return hex digest of file content
+    """
+    hasher = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def fingerprint_path(relpath: str, digest: str) -> str:
+    """
+    example: "css/style.css", "ab12.." -> "css/style.ab12...css"
+    """
+    base, ext = posixpath.splitext(relpath)
+    return f"{base}.{digest[:DIGEST_LENGTH]}{ext}"
+
+
+def split_url(url: str) -> tuple:
+    """
+    split `url` into path and suffix, i.e. query and/or fragment
+    """
+    match = re.match(r"([^?#]*)(.*)", url, re.S)
+    return match.group(1), match.group(2)
+
+
+class AssetManifest:
+    """
+    maps asset paths (relative to `output_dir`, with "/" separators)
+    to their fingerprinted paths
+    """
+
+    def __init__(
+        self,
+        manifest_path: str,
+        output_dir: str,
+        asset_dirs: tuple,
+        fingerprint: bool = True,
+    ):
+        """
+        `fingerprint` determines whether references are rewritten to
+        fingerprinted copies; if unset, the manifest only caches digests
+        """
+        self.manifest_path = manifest_path
+        self.output_dir = output_dir
+        self.asset_dirs = asset_dirs
+        self.fingerprint = fingerprint
+        # relpath -> {"size", "mtime_ns", "digest", "path"}
+        # "path" is only set for fingerprinted assets
+        self.entries: Dict[str, dict] = {}
+        # number of assets hashed this build
+        self.hashed = 0
+        # optional content-addressed store; maps duplicates to a canonical asset
+        self.store: Optional[AssetStore] = None
+        # digest -> data uri
+        self.data_uris: Dict[str, str] = {}
+
+    @classmethod
+    def load(
+        cls,
+        manifest_path: str,
+        output_dir: str,
+        asset_dirs: tuple,
+        fingerprint: bool = True,
+    ):
+        """
+        load manifest from previous build, if any
+        """
+        manifest = cls(manifest_path, output_dir, asset_dirs, fingerprint)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as fp:
+                manifest.entries = json.load(fp)
+        return manifest
+
+    def save(self):
+        """
+        persist manifest for the next build
+        """
+        with open(self.manifest_path, "w", encoding="utf-8") as fp:
+            json.dump(self.entries, fp, indent=2, sort_keys=True)
+
+    def normalize(self, url: str) -> Optional[str]:
+        """
+        return key of the asset referenced by `url`,
+        or None if `url` isn't a local asset
+        """
+        if re.match(r"^([a-zA-Z][\w+.-]*:|//|#)", url):
+            # absolute url, data uri or fragment
+            return None
+        # generated relpaths use the os separator
+        relpath = posixpath.normpath(url.replace("\\", "/"))
+        if relpath.split("/", 1)[0] not in self.asset_dirs:
+            return None
+        if not os.path.isfile(os.path.join(self.output_dir, relpath)):
+            return None
+        return relpath
+
+    def digest(self, relpath: str) -> str:
+        """
+        return content digest of `relpath`; the asset is only
+        hashed if it is new or has changed since the last build
+        """
+        stat = os.stat(os.path.join(self.output_dir, relpath))
+        entry = self.entries.get(relpath)
+        key = (stat.st_size, stat.st_mtime_ns)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == key:
+            return entry["digest"]
+
+        digest = file_digest(os.path.join(self.output_dir, relpath))
+        self.hashed += 1
+        new_entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+        }
+        if entry is not None and "path" in entry:
+            # keep previous fingerprinted path, so a stale copy can be removed
+            new_entry["path"] = entry["path"]
+        self.entries[relpath] = new_entry
+        return digest
+
+    def lookup(self, relpath: str) -> str:
+        """
+        return fingerprinted path of `relpath`; copy
+        the asset if it is new or has changed since the last build
+        """
+        fingerprinted = fingerprint_path(relpath, self.digest(relpath))
+        entry = self.entries[relpath]
+        previous = entry.get("path")
+        if previous is not None and previous != fingerprinted:
+            # remove stale copy
+            stale = os.path.join(self.output_dir, previous)
+            if os.path.exists(stale):
+                os.remove(stale)
+
+        destpath = os.path.join(self.output_dir, fingerprinted)
+        if not os.path.exists(destpath):
+            shutil.copyfile(os.path.join(self.output_dir, relpath), destpath)
+        entry["path"] = fingerprinted
+        return fingerprinted
+
+    def resolve(self, relpath: str) -> str:
+        """
+        return the path `relpath` should be referenced by
+        """
+        if self.store is not None:
+            relpath = self.store.canonical(relpath)
+        if self.fingerprint:
+            relpath = self.lookup(relpath)
+        return relpath
+
+    def data_uri(self, relpath: str) -> str:
+        """
+        return `relpath` encoded as a base64 data uri;
+        encoded once per unique content per build
+        """
+        digest = self.digest(relpath)
+        if digest not in self.data_uris:
+            mimetype, _ = mimetypes.guess_type(relpath)
+            with open(os.path.join(self.output_dir, relpath), "rb") as fp:
+                encoded = base64.b64encode(fp.read()).decode("ascii")
+            self.data_uris[digest] = (
+                f"data:{mimetype or 'application/octet-stream'};base64,{encoded}"
+            )
+        return self.data_uris[digest]
+
+    def inline_node(self, qmnode: treeparser.QMNode, limit: int):
+        """
+        inline the reference of `qmnode`, one of INLINE_NODES, if its
+        asset is smaller than `limit` bytes
+        """
+        attr, _ = INLINE_NODES[qmnode.node.tag]
+        url = qmnode.get_attr(attr)
+        if not url:
+            return
+        path, suffix = split_url(url)
+        relpath = self.normalize(path)
+        if relpath is None or suffix:
+            return
+        if os.path.getsize(os.path.join(self.output_dir, relpath)) < limit:
+            qmnode.set_attr(attr, self.data_uri(relpath))
+
+    def rewrite_node(self, qmnode: treeparser.QMNode):
+        """
+        rewrite the asset href/src of `qmnode`
+        """
+        for attr in ASSET_ATTRS:
+            url = qmnode.get_attr(attr)
+            if not url:
+                continue
+            path, suffix = split_url(url)
+            relpath = self.normalize(path)
+            if relpath is None:
+                continue
+            resolved = self.resolve(relpath)
+            if resolved != relpath:
+                qmnode.set_attr(attr, f"{resolved}{suffix}")
+
+
+class AssetStore:
+    """
+    content-addressed view of the assets under `store_dirs`:
+    files with identical content share one canonical path, so
+    every stage downstream handles each unique blob once
+    """
+
+    def __init__(self, manifest: AssetManifest, store_dirs: tuple):
+        self.manifest = manifest
+        self.store_dirs = store_dirs
+        # digest -> canonical relpath
+        self.blobs: Dict[str, str] = {}
+        # relpath -> canonical relpath
+        self.canonical_idx: Dict[str, str] = {}
+
+    def scan(self):
+        """
+        hash every asset under `store_dirs` and pick a canonical path
+        per digest; the canonical path is the first in sorted order
+        """
+        output_dir = self.manifest.output_dir
+        relpaths = []
+        for store_dir in self.store_dirs:
+            for dirpath, _, filenames in os.walk(os.path.join(output_dir, store_dir)):
+                for filename in filenames:
+                    if FINGERPRINTED_NAME.search(filename):
+                        # a copy made by the manifest, not a source asset
+                        continue
+                    relpath = os.path.relpath(
+                        os.path.join(dirpath, filename), output_dir
+                    )
+                    relpaths.append(relpath.replace(os.sep, "/"))
+
+        for relpath in sorted(relpaths):
+            digest = self.manifest.digest(relpath)
+            canonical = self.blobs.setdefault(digest, relpath)
+            self.canonical_idx[relpath] = canonical
+            if canonical != relpath:
+                print(f"duplicate asset {relpath} is stored as {canonical}")
+
+    def canonical(self, relpath: str) -> str:
+        """
+        return canonical path of `relpath`
+        """
+        return self.canonical_idx.get(relpath, relpath)
+
+    def unique(self) -> list:
+        """
+        return the canonical path of each unique blob
+        """
+        return sorted(self.blobs.values())
@@ -0,0 +1,122 @@
+"""
+benchmark textparser.enrich_links on pathological long lines
+
+Each input is a single line, of the kind that's pasted into content, e.g.
+logs and base64 blobs, or built to make a url matcher do the most work per
+character. Lines are linked by textparser.find_urls, and by re.finditer
+with the url pattern it replaces, which checks the spans are the same.
+Each is timed at --length characters and at 4x that; for a linear
+matcher, the 4x time is about 4 times as long.
+
+usage:
+    python autolink.py --length 1000000 --output results.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import sys
+import time
+
+SELF_PATH = os.path.dirname(os.path.realpath(__file__))
+# generation modules are imported by name
+sys.path.insert(0, os.path.dirname(SELF_PATH))
+
+import textparser  # noqa: E402
+
+# the pattern enrich_links used to match with
+URL_PATTERN = re.compile(
+    r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
+)
+
+
+def make_inputs(length: int) -> dict:
+    """
+    name -> line of about `length` characters
+    """
+    rng = random.Random(0)
+    nbytes = length * 3 // 4 + 1
+    blob = base64.b64encode(rng.getrandbits(8 * nbytes).to_bytes(nbytes, "little"))
+    units = {
+        # a host run with no dot; every prefix is tried as a host
+        "no-dot": "http://" + "a" * 300 + " ",
+        # dots everywhere, none followed by a tld
+        "no-tld": "http://" + ".aaaaaaa" * 40 + " ",
+        # the same after www., which is tried with and without
+        "www-no-tld": "http://www." + ".aaaaaaa" * 40 + " ",
+        # tlds with no word boundary, i.e. followed by a paren
+        "no-boundary": "https://" + "a.((((((" * 40 + "a",
+        # many short urls, as in a log
+        "log": "GET https://example.com/a?b=1 200 http://x.io ",
+        # urls with hosts at the length limit
+        "long-host": "http://" + "h" * 255 + ".com/p ",
+        # text without urls
+        "prose": "the quick brown fox, a.k.a. http, jumps over... ",
+    }
+    lines = {name: unit * (length // len(unit) + 1) for name, unit in units.items()}
+    lines["base64"] = "data https://" + blob.decode()
+    return {name: line[:length] for name, line in lines.items()}
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(length: int) -> dict:
+    """
+    return timings, in seconds, and url counts of each input
+    """
+    results = {}
+    long_lines = make_inputs(4 * length)
+    for name, line in make_inputs(length).items():
+        long_line = long_lines[name]
+        scan, spans = timed(lambda: list(textparser.find_urls(line)))
+        scan_4x, _ = timed(lambda: list(textparser.find_urls(long_line)))
+        regex, matches = timed(lambda: [m.span() for m in URL_PATTERN.finditer(line)])
+        if spans != matches:
+            raise AssertionError(f"{name}: find_urls differs from the url pattern")
+        link, _ = timed(textparser.enrich_links, [line])
+        results[name] = {
+            "urls": len(spans),
+            "find_urls": scan,
+            "find_urls_4x": scan_4x,
+            "regex": regex,
+            "enrich_links": link,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--length", type=int, default=1000000, help="characters per line"
+    )
+    parser.add_argument("--output", help="json results file; defaults to stdout")
+    args = parser.parse_args()
+
+    results = {"length": args.length, "inputs": run(args.length)}
+    for name, result in results["inputs"].items():
+        print(
+            f"{name:<12} {result['urls']:>8} urls"
+            f"  find_urls {1000 * result['find_urls']:8.1f}ms"
+            f"  4x {1000 * result['find_urls_4x']:8.1f}ms"
+            f"  regex {1000 * result['regex']:8.1f}ms",
+            file=sys.stderr,
+        )
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
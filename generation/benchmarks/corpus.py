@@ -0,0 +1,189 @@
+"""
+generate a synthetic site corpus for benchmarking
+
+The corpus mirrors the layout of the real site, i.e.
+    <corpus>/content.yaml
+    <corpus>/sections.yaml
+    <corpus>/image_content.yaml
+    <corpus>/content/<section>/<content_id>
+    <corpus>/templates, css, img   (copied/created so pages render and transform)
+
+usage:
+    python corpus.py <corpus_dir> --pages 1000 --essay-bytes 20000
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+
+import yaml
+
+SELF_PATH = os.path.dirname(os.path.realpath(__file__))
+REPO_ROOT = os.path.normpath(os.path.join(SELF_PATH, "..", ".."))
+
+# sections must be ones the navbar in head.jinja.html has items for
+SECTIONS = ("tech-writings", "essays", "poetry", "random-thoughts")
+CONTENT_TEMPLATES = ("content-image.jinja.html", "content-no-image.jinja.html")
+LISTING_TEMPLATE = "listing-jumbotron-no-image.jinja.html"
+IMAGE_ID = "bench.jpg"
+FOOTNOTE_DIVIDER = "________________\n"
+# marks a directory as a generated corpus, i.e. safe to regenerate
+CORPUS_MARKER = ".bench-corpus"
+
+WORDS = (
+    "the of and to in is that it for as with was on be by this are or at from "
+    "freedom mind database tree parser layer choice world moral pandemic "
+    "awareness ego interface software spirituality wanderer samsara wisdom"
+).split()
+
+
+def make_paragraph(rng: random.Random, nwords: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(nwords)).capitalize() + "."
+
+
+def make_essay(
+    rng: random.Random, nbytes: int, footnotes: int, urls: int, page: int
+) -> str:
+    """
+    make an essay of roughly `nbytes`, with `footnotes` footnote markers
+    and `urls` inline links spread across the body
+    """
+    paragraphs = []
+    size = 0
+    while size < nbytes:
+        paragraph = make_paragraph(rng, rng.randint(20, 120))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+
+    # spread markers; footnote markers must appear in order
+    for fnnum in range(1, footnotes + 1):
+        idx = (fnnum - 1) * len(paragraphs) // footnotes
+        paragraphs[idx] = f"{paragraphs[idx]}[{fnnum}]"
+    for urlnum in range(urls):
+        idx = rng.randrange(len(paragraphs))
+        url = f"https://example.com/page-{page}/link-{urlnum}?q={rng.choice(WORDS)}"
+        paragraphs[idx] = f"{paragraphs[idx]} see {url} for more"
+
+    lines = []
+    for paragraph in paragraphs:
+        lines.append(f"{paragraph}\n")
+        lines.append("\n")
+    if footnotes:
+        lines.append(FOOTNOTE_DIVIDER)
+        for fnnum in range(1, footnotes + 1):
+            lines.append(f"[{fnnum}] {make_paragraph(rng, 12)}\n")
+    return "".join(lines)
+
+
+def generate(
+    corpus_dir: str,
+    pages: int = 100,
+    essay_bytes: int = 10000,
+    footnotes: int = 5,
+    urls: int = 5,
+    seed: int = 0,
+) -> dict:
+    """
+    write a corpus of `pages` content pages to `corpus_dir`;
+    returns the parameters used
+    """
+    rng = random.Random(seed)
+    if os.path.exists(corpus_dir):
+        # only ever clobber a previously generated corpus
+        if os.listdir(corpus_dir) and not os.path.exists(
+            os.path.join(corpus_dir, CORPUS_MARKER)
+        ):
+            raise FileExistsError(f"{corpus_dir} exists and is not a corpus")
+        shutil.rmtree(corpus_dir)
+    os.makedirs(corpus_dir)
+    open(os.path.join(corpus_dir, CORPUS_MARKER), "w").close()
+
+    # static inputs needed to render and transform pages
+    shutil.copytree(
+        os.path.join(REPO_ROOT, "templates"), os.path.join(corpus_dir, "templates")
+    )
+    shutil.copytree(os.path.join(REPO_ROOT, "css"), os.path.join(corpus_dir, "css"))
+    os.makedirs(os.path.join(corpus_dir, "img"))
+    with open(os.path.join(corpus_dir, "img", IMAGE_ID), "wb") as fp:
+        fp.write(bytes(rng.getrandbits(8) for _ in range(4096)))
+    shutil.copyfile(
+        os.path.join(REPO_ROOT, "index.html"), os.path.join(corpus_dir, "index.html")
+    )
+
+    content = {section: [] for section in SECTIONS}
+    date = datetime.date(2021, 1, 1)
+    for page in range(pages):
+        section = SECTIONS[page % len(SECTIONS)]
+        content_id = f"page-{page}.txt"
+        template_id = CONTENT_TEMPLATES[page % len(CONTENT_TEMPLATES)]
+        item = {
+            "title": f"Page {page}: {make_paragraph(rng, 5)}",
+            # reverse chronological
+            "date": str(date - datetime.timedelta(days=page)),
+            "content_id": content_id,
+            "template_id": template_id,
+        }
+        if template_id == "content-image.jinja.html":
+            item["image_id"] = IMAGE_ID
+            item["image_attribution"] = "synthetic"
+        content[section].append(item)
+
+        section_dir = os.path.join(corpus_dir, "content", section)
+        os.makedirs(section_dir, exist_ok=True)
+        # vary essay size around the requested size
+        nbytes = rng.randint(essay_bytes // 2, essay_bytes * 3 // 2)
+        essay = make_essay(rng, nbytes, footnotes, urls, page)
+        with open(os.path.join(section_dir, content_id), "w", encoding="utf-8") as fp:
+            fp.write(essay)
+
+    sections = {
+        section: {
+            "section_title": section.replace("-", " ").title(),
+            "subtext": "",
+            "template_id": LISTING_TEMPLATE,
+        }
+        for section in SECTIONS
+    }
+
+    with open(os.path.join(corpus_dir, "content.yaml"), "w") as fp:
+        yaml.safe_dump(content, fp)
+    with open(os.path.join(corpus_dir, "sections.yaml"), "w") as fp:
+        yaml.safe_dump(sections, fp)
+    with open(os.path.join(corpus_dir, "image_content.yaml"), "w") as fp:
+        yaml.safe_dump({}, fp)
+
+    return {
+        "pages": pages,
+        "essay_bytes": essay_bytes,
+        "footnotes": footnotes,
+        "urls": urls,
+        "seed": seed,
+    }
+
+
+def add_corpus_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--pages", type=int, default=100, help="number of content pages"
+    )
+    parser.add_argument(
+        "--essay-bytes", type=int, default=10000, help="mean size of each essay"
+    )
+    parser.add_argument("--footnotes", type=int, default=5, help="footnotes per essay")
+    parser.add_argument("--urls", type=int, default=5, help="urls per essay")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("corpus_dir")
+    add_corpus_args(parser)
+    args = parser.parse_args()
+    generate(
+        args.corpus_dir,
+        args.pages,
+        args.essay_bytes,
+        args.footnotes,
+        args.urls,
+        args.seed,
+    )
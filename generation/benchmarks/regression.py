@@ -0,0 +1,241 @@
+"""
+build performance regression gate
+
+Runs the real pipeline, i.e. pagegen.driver, on a fixed synthetic corpus
+and records wall time, peak RSS, bytes written and per-stage times, with
+the time of each kind of target within the pages stage, e.g. pages/content.
+The corpus is built several times, and each metric is the median over
+the runs. Compared against a stored baseline, a metric fails the gate if
+it regresses by more than the relative threshold and, for times, by more
+than a noise floor: the larger of a fixed minimum and the spread of that
+metric across the runs of either the baseline or the current build.
+
+usage (via pagegen):
+    python pagegen.py bench --save baseline.json
+    python pagegen.py bench --compare baseline.json
+"""
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import corpus
+import pagegen
+import profiling
+from run_benchmarks import configure
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+# the fixed corpus; changing these invalidates stored baselines
+CORPUS_PARAMS = {
+    "pages": 200,
+    "essay_bytes": 10000,
+    "footnotes": 5,
+    "urls": 5,
+    "seed": 0,
+}
+# relative regression allowed before the gate fails
+THRESHOLD = 0.10
+# time differences below this are always treated as noise
+MIN_DELTA_SECONDS = 0.05
+# fewer runs don't give a meaningful median or spread
+MIN_REPEAT = 3
+
+
+def peak_rss_kb() -> Optional[int]:
+    """
+    return peak resident set size of this process, in KB
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return maxrss // 1024 if os.uname().sysname == "Darwin" else maxrss
+
+
+def snapshot(dirpath: str) -> Dict[str, Tuple[int, int]]:
+    """
+    return relpath -> (size, mtime_ns) for all files under `dirpath`
+    """
+    result = {}
+    for root, _, filenames in os.walk(dirpath):
+        for filename in filenames:
+            filepath = os.path.join(root, filename)
+            stat = os.stat(filepath)
+            result[filepath] = (stat.st_size, stat.st_mtime_ns)
+    return result
+
+
+def stage_times(spans: List[profiling.Span]) -> Dict[str, float]:
+    """
+    return stage -> seconds, from the spans of a build; the targets within
+    the pages stage are summed per kind, as "pages/<kind>"
+    """
+    stages = {}
+    for span in spans:
+        depth = len(span.stack)
+        if depth == 1 or (depth == 2 and span.stack[0] == "pages"):
+            name = "/".join(span.stack)
+            stages[name] = stages.get(name, 0.0) + span.duration
+    return stages
+
+
+def run_build(corpus_dir: str) -> dict:
+    """
+    run the pipeline once on `corpus_dir`, and return its metrics
+    """
+    configure(corpus_dir)
+    before = snapshot(corpus_dir)
+    profiler = profiling.enable(sample=False)
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            pagegen.driver(config_dir=corpus_dir)
+    finally:
+        profiling.disable()
+    wall = time.perf_counter() - start
+    after = snapshot(corpus_dir)
+
+    stages = stage_times(profiler.spans)
+    bytes_written = sum(
+        size
+        for filepath, (size, mtime) in after.items()
+        if before.get(filepath) != (size, mtime)
+    )
+    return {
+        "wall_seconds": wall,
+        "peak_rss_kb": peak_rss_kb(),
+        "bytes_written": bytes_written,
+        "stages": stages,
+    }
+
+
+def summarize(runs: List[dict]) -> dict:
+    """
+    return the median of each metric over `runs`, and the spread
+    (max - min) of each time, i.e. wall and stage times
+    """
+    median = statistics.median
+    spread = lambda values: max(values) - min(values)
+    walls = [run["wall_seconds"] for run in runs]
+    stages = {name: [run["stages"][name] for run in runs] for name in runs[0]["stages"]}
+    return {
+        "wall_seconds": median(walls),
+        # peak rss is a process-wide high-water mark; the last run has seen all
+        "peak_rss_kb": runs[-1]["peak_rss_kb"],
+        "bytes_written": int(median([run["bytes_written"] for run in runs])),
+        "stages": {name: median(times) for name, times in stages.items()},
+        "spread": {
+            "wall_seconds": spread(walls),
+            **{f"stage:{name}": spread(times) for name, times in stages.items()},
+        },
+    }
+
+
+def run(repeat: int = MIN_REPEAT) -> dict:
+    """
+    build the fixed corpus `repeat` times from scratch; returns the
+    median of each metric
+    """
+    if repeat < MIN_REPEAT:
+        raise ValueError(f"repeat must be at least {MIN_REPEAT}")
+    runs = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_dir = os.path.join(tmpdir, "corpus")
+        for _ in range(repeat):
+            corpus.generate(corpus_dir, **CORPUS_PARAMS)
+            runs.append(run_build(corpus_dir))
+    return {"corpus": CORPUS_PARAMS, "repeat": repeat, **summarize(runs)}
+
+
+def flatten_metrics(results: dict) -> Dict[str, float]:
+    """
+    return metric name -> value, with stages as "stage:<name>"
+    """
+    metrics = {
+        key: results[key]
+        for key in ("wall_seconds", "peak_rss_kb", "bytes_written")
+        if results.get(key) is not None
+    }
+    for name, seconds in results.get("stages", {}).items():
+        metrics[f"stage:{name}"] = seconds
+    return metrics
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = THRESHOLD
+) -> Tuple[str, bool]:
+    """
+    compare `current` results against `baseline`;
+    return a readable report, and whether the gate passed
+    """
+    old_metrics = flatten_metrics(baseline)
+    new_metrics = flatten_metrics(current)
+    old_spread = baseline.get("spread", {})
+    new_spread = current.get("spread", {})
+    passed = True
+    lines = []
+    if baseline.get("corpus") != current.get("corpus"):
+        lines.append(
+            f"WARNING: corpus differs from baseline ({baseline.get('corpus')}); "
+            "the comparison may be meaningless"
+        )
+
+    lines.append(
+        f"{'metric':<28} {'baseline':>14} {'current':>14} {'change':>9}  status"
+    )
+    for name in sorted(set(old_metrics) | set(new_metrics)):
+        if name not in old_metrics or name not in new_metrics:
+            lines.append(f"{name:<28} {'-':>14} {'-':>14} {'':>9}  missing")
+            continue
+        old, new = old_metrics[name], new_metrics[name]
+        change = (new - old) / old if old else 0.0
+        is_time = name == "wall_seconds" or name.startswith("stage:")
+        floor = max(
+            MIN_DELTA_SECONDS, old_spread.get(name, 0.0), new_spread.get(name, 0.0)
+        )
+        noise = is_time and abs(new - old) <= floor
+        status = "ok"
+        if change > threshold and not noise:
+            status = "REGRESSION"
+            passed = False
+        elif change < -threshold and not noise:
+            status = "improved"
+        lines.append(
+            f"{name:<28} {old:>14.4f} {new:>14.4f} {change:>+8.1%}  {status}"
+            if is_time
+            else f"{name:<28} {old:>14} {new:>14} {change:>+8.1%}  {status}"
+        )
+
+    lines.append("")
+    lines.append(
+        "PASS" if passed else f"FAIL: metrics regressed by more than {threshold:.0%}"
+    )
+    return "\n".join(lines), passed
+
+
+def main(args) -> int:
+    """
+    run the bench command; returns process exit code
+    """
+    results = run(repeat=args.repeat)
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2)
+        print(f"results saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        report, passed = compare(baseline, results, args.threshold)
+        print(report)
+        return 0 if passed else 1
+    return 0
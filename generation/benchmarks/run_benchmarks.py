@@ -0,0 +1,221 @@
+"""
+time each stage of the generation pipeline on a synthetic corpus
+and write the results as json, so regressions can be tracked
+
+usage:
+    python run_benchmarks.py --pages 1000 --essay-bytes 20000 --output results.json
+
+stages are timed separately, in pipeline order:
+    read_content   pagegen.get_lines on each content file
+    text_to_html   textparser.text_to_html
+    render         jinja render of each content page
+    listings       pagegen.generate_listings
+    parse          pagegen.construct_trees, i.e. TreeParser
+    transform      pagegen.transform_html
+    print          treeparser.TreePrinter.mk_doc
+    treediff       treediff.compare between neighbouring pages
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from jinja2 import Environment, FileSystemLoader
+
+SELF_PATH = os.path.dirname(os.path.realpath(__file__))
+# generation modules are imported by name
+sys.path.insert(0, os.path.dirname(SELF_PATH))
+
+import corpus  # noqa: E402
+import pagegen  # noqa: E402
+import textparser  # noqa: E402
+import treediff  # noqa: E402
+import treeparser  # noqa: E402
+
+
+class StageTimer:
+    """
+    accumulates wall time per stage
+    """
+
+    def __init__(self):
+        # stage -> {"seconds", "count"}
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, count: int = 1):
+        """
+        time the enclosed block as stage `name`, over `count` items
+        """
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.stages[name] = {
+            "seconds": elapsed,
+            "count": count,
+            "per_item_ms": 1000 * elapsed / count if count else 0.0,
+        }
+
+
+def configure(corpus_dir: str):
+    """
+    point pagegen's config at the corpus; pages are written into the corpus
+    """
+    pagegen.TEMPLATE_DIR = os.path.join(corpus_dir, "templates")
+    pagegen.OUTPUT_DIR = corpus_dir
+    pagegen.CONTENT_DIR = os.path.join(corpus_dir, "content")
+    pagegen.IMG_DIR = os.path.join(corpus_dir, "img")
+    pagegen.IMG_CONTENT_DIR = os.path.join(corpus_dir, "pics")
+    pagegen.INDEX_FILE = os.path.join(corpus_dir, "index.html")
+    pagegen.ASSET_MANIFEST = os.path.join(corpus_dir, "asset-manifest.json")
+    pagegen.TREE_CACHE_DIR = os.path.join(corpus_dir, ".tree-cache")
+    pagegen.RELATED_CACHE = os.path.join(corpus_dir, ".related-cache.json")
+
+
+def run(corpus_dir: str) -> dict:
+    """
+    run each stage on the corpus at `corpus_dir`, returning stage timings
+    """
+    configure(corpus_dir)
+    timer = StageTimer()
+    listings_file = os.path.join(corpus_dir, "sections.yaml")
+    content_file = os.path.join(corpus_dir, "content.yaml")
+    image_content_file = os.path.join(corpus_dir, "image_content.yaml")
+
+    content = pagegen.CMetadata.from_file(content_file)
+    listings = pagegen.LMetadata.from_file(listings_file)
+    file_manager = pagegen.FileManager(content, output_dir=corpus_dir)
+    items = [
+        metadata for section_items in content.values() for metadata in section_items
+    ]
+
+    with timer.stage("read_content", len(items)):
+        texts = [pagegen.get_lines(metadata.get_contentpath()) for metadata in items]
+
+    with timer.stage("text_to_html", len(items)):
+        blocks = [textparser.text_to_html(lines) for lines in texts]
+
+    # mirrors generate_content, minus the write
+    with timer.stage("render", len(items)):
+        rendered = []
+        for metadata, block in zip(items, blocks):
+            env = Environment(loader=FileSystemLoader(pagegen.TEMPLATE_DIR))
+            template = env.get_template(metadata.template_id)
+            image_location = pagegen.get_relpath(
+                os.path.join(pagegen.IMG_DIR, metadata.image_id)
+            )
+            rendered.append(
+                template.render(
+                    title=metadata.title,
+                    date=metadata.date,
+                    body=block,
+                    image_location=image_location,
+                    image_attribution=metadata.image_attribution,
+                    is_content_page=True,
+                )
+            )
+
+    cfiles = defaultdict(list)
+    for metadata, page in zip(items, rendered):
+        output_filepath = file_manager.content_filepath_from_metadata(metadata)
+        with open(output_filepath, "w", encoding="utf-8") as fp:
+            fp.write(page)
+        cfiles[metadata.section].append(output_filepath)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with timer.stage("listings", len(listings)):
+            lfiles = pagegen.generate_listings(
+                listings_file, content_file, image_content_file, file_manager
+            )
+
+        with timer.stage("parse", len(items) + len(listings) + 1):
+            ltrees, ctrees, itree = pagegen.construct_trees(
+                lfiles, cfiles, pagegen.INDEX_FILE
+            )
+
+        with timer.stage("transform", len(items) + len(listings)):
+            pagegen.transform_html(cfiles, ltrees, ctrees, file_manager, listings)
+
+    trees = list(ltrees.values()) + [
+        tree for trees in ctrees.values() for tree in trees
+    ]
+    printer = treeparser.TreePrinter()
+    with timer.stage("print", len(trees)):
+        for tree in trees:
+            printer.mk_doc(tree.get_root(as_qmnode=False))
+
+    pairs = [
+        (trees[idx], trees[idx + 1])
+        for trees in ctrees.values()
+        for idx in range(len(trees) - 1)
+    ]
+    with timer.stage("treediff", len(pairs)):
+        for tree0, tree1 in pairs:
+            treediff.compare(tree0.get_root(), tree1.get_root())
+
+    return timer.stages
+
+
+def corpus_bytes(corpus_dir: str) -> int:
+    """total size of the content files"""
+    total = 0
+    for dirpath, _, filenames in os.walk(os.path.join(corpus_dir, "content")):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    corpus.add_corpus_args(parser)
+    parser.add_argument(
+        "--corpus-dir", help="where the corpus is generated; defaults to a temp dir"
+    )
+    parser.add_argument(
+        "--reuse-corpus",
+        action="store_true",
+        help="benchmark the existing corpus at --corpus-dir instead of regenerating it",
+    )
+    parser.add_argument("--output", help="json results file; defaults to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus_dir = args.corpus_dir or os.path.join(tmpdir, "corpus")
+        params = None
+        if not args.reuse_corpus:
+            params = corpus.generate(
+                corpus_dir,
+                args.pages,
+                args.essay_bytes,
+                args.footnotes,
+                args.urls,
+                args.seed,
+            )
+        stages = run(corpus_dir)
+        results = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": params,
+            "corpus_bytes": corpus_bytes(corpus_dir),
+            "stages": stages,
+            "total_seconds": sum(stage["seconds"] for stage in stages.values()),
+        }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+thin client for the build server (see buildserver.py)
+
+Only imports the standard library, so triggering a build costs little more
+than interpreter startup.
+
+usage:
+    python buildclient.py build [--full] [--verbose]
+    python buildclient.py status
+    python buildclient.py stop
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+SELF_PATH = os.path.dirname(os.path.realpath(__file__))
+# where the build server listens
+SOCKET_PATH = os.path.join(SELF_PATH, ".buildserver.sock")
+
+
+def request(command: str, socket_path: str = SOCKET_PATH, **args) -> dict:
+    """
+    send `command` to the build server, and return its response;
+    requests and responses are single lines of json
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"command": command, **args}).encode() + b"\n")
+        with sock.makefile("rb") as fp:
+            return json.loads(fp.readline())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="trigger builds on the build server")
+    parser.add_argument("command", choices=("build", "status", "stop"))
+    parser.add_argument(
+        "--full", action="store_true", help="rebuild all pages, even if unchanged"
+    )
+    parser.add_argument("--verbose", action="store_true", help="print the build log")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="server socket path")
+    args = parser.parse_args()
+
+    try:
+        response = request(args.command, args.socket, full=args.full)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(
+            "build server is not running; start it with: python buildserver.py",
+            file=sys.stderr,
+        )
+        return 2
+
+    if args.verbose and response.get("log"):
+        print(response["log"], end="")
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        return 1
+
+    if args.command == "build":
+        print(
+            f"{response['mode']} build: {len(response['pages'])} page(s)"
+            f" in {1000 * response['seconds']:.1f}ms"
+        )
+    elif args.command == "status":
+        print(
+            f"pid {response['pid']}, {response['builds']} build(s),"
+            f" up {response['uptime']:.0f}s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+dependency graph of build targets
+
+A target is a named action, with the input files it reads and the targets
+it depends on. Dependencies are added before their dependents, so the
+graph is acyclic, and the order targets were added in is a topological
+order.
+
+The graph answers which targets a change invalidates: the targets that
+read a changed file, and, transitively, their dependents. A run builds
+only what's needed: a target is built if it reads a changed file, or if a
+dependency was built and its result changed. E.g. when a page changes,
+but the critical css computed from it doesn't, the other pages using that
+css aren't rebuilt.
+
+Targets run in topological order; with an executor, each runs as soon as
+its dependencies are done, so independent targets run in parallel.
+"""
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Callable, Dict, Iterable, List
+
+
+class Target:
+    """
+    `action()` builds the target; its result is compared across runs
+    """
+
+    def __init__(self, name: str, action: Callable, inputs: tuple, deps: tuple):
+        self.name = name
+        self.action = action
+        self.inputs = inputs
+        self.deps = deps
+        # result of the last build; only compared if built before
+        self.result = None
+        self.built = False
+
+
+class BuildGraph:
+    """
+    targets by name, in the order added
+    """
+
+    def __init__(self):
+        self.targets: Dict[str, Target] = {}
+        # name -> names of targets that depend on it
+        self.dependents: Dict[str, List[str]] = defaultdict(list)
+        # input file -> names of targets that read it
+        self.readers: Dict[str, List[str]] = defaultdict(list)
+
+    def add(
+        self, name: str, action: Callable, inputs: Iterable = (), deps: Iterable = ()
+    ) -> Target:
+        """
+        add target `name`; its dependencies must have been added
+        """
+        if name in self.targets:
+            raise ValueError(f"duplicate target {name}")
+        deps = tuple(deps)
+        for dep in deps:
+            if dep not in self.targets:
+                raise ValueError(f"{name} depends on unknown target {dep}")
+            self.dependents[dep].append(name)
+        target = Target(name, action, tuple(inputs), deps)
+        for filepath in target.inputs:
+            self.readers[filepath].append(name)
+        self.targets[name] = target
+        return target
+
+    def inputs(self) -> set:
+        """
+        return all input files
+        """
+        return set(self.readers)
+
+    def stale(self, changed: Iterable[str]) -> List[str]:
+        """
+        return names of targets that read any of the `changed` files,
+        in topological order
+        """
+        names = {
+            name for filepath in changed for name in self.readers.get(filepath, ())
+        }
+        return [name for name in self.targets if name in names]
+
+    def invalidated(self, changed: Iterable[str]) -> List[str]:
+        """
+        return names of targets that the `changed` files may invalidate,
+        in topological order; a run may build fewer, see `run`
+        """
+        found = set()
+        pending = self.stale(changed)
+        while pending:
+            name = pending.pop()
+            if name not in found:
+                found.add(name)
+                pending.extend(self.dependents[name])
+        return [name for name in self.targets if name in found]
+
+    def run(self, stale: Iterable[str] = None, executor: Executor = None) -> List[str]:
+        """
+        build the `stale` targets, all if None, and the dependents of built
+        targets whose result changed. With an `executor`, targets run on it.
+        returns names of the targets built, in the order they finished
+        """
+        stale = set(self.targets if stale is None else stale)
+        # name -> whether a dependency's result changed
+        dirty = defaultdict(bool)
+        built = []
+
+        def finish(target: Target, result):
+            changed = not target.built or result != target.result
+            target.result = result
+            target.built = True
+            built.append(target.name)
+            if changed:
+                for name in self.dependents[target.name]:
+                    dirty[name] = True
+
+        def needed(target: Target) -> bool:
+            return target.name in stale or dirty[target.name]
+
+        if executor is None:
+            for target in self.targets.values():
+                if needed(target):
+                    finish(target, target.action())
+            return built
+
+        # name -> dependencies not yet done
+        waiting = {name: len(target.deps) for name, target in self.targets.items()}
+        ready = [name for name, count in waiting.items() if count == 0]
+        running = {}
+
+        def done(target: Target):
+            for name in self.dependents[target.name]:
+                waiting[name] -= 1
+                if waiting[name] == 0:
+                    ready.append(name)
+
+        while ready or running:
+            while ready:
+                target = self.targets[ready.pop(0)]
+                if needed(target):
+                    running[executor.submit(target.action)] = target
+                else:
+                    done(target)
+            if running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    target = running.pop(future)
+                    finish(target, future.result())
+                    done(target)
+        return built
@@ -0,0 +1,242 @@
+"""
+build server; keeps warm state between builds
+
+Each `python pagegen.py` pays for interpreter startup, importing jinja2 and
+yaml, compiling templates and parsing yaml before doing any work. The build
+server is a long running process, listening on a local unix socket, that
+keeps all of this in memory: the jinja environment (compiled templates), the
+parsed yaml metadata, converted content, the layout trees, and the critical
+css and asset manifest. Page trees aren't kept; a rebuilt page is checked
+on its own (see validations.PageChecks).
+
+A build only redoes what changed since the last build:
+    - if the yaml config, index.html or assets changed; all pages
+    - otherwise, the pages that read changed content or template files, and
+      what their changes invalidate; see pagegen.SiteBuild
+
+Builds are triggered with the thin client, buildclient.py
+
+usage:
+    python buildserver.py [--socket <path>]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import time
+import traceback
+from typing import List, Tuple
+
+import assets
+import buildclient
+import pagegen
+
+
+def list_files(dirpath: str) -> List[str]:
+    """
+    return paths of all files under `dirpath`
+    """
+    return [
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(dirpath)
+        for filename in filenames
+    ]
+
+
+class Builder:
+    """
+    warm build state. The first build is full; later builds are incremental
+    """
+
+    def __init__(self, config_dir: str = None):
+        # contains the yaml files
+        self.config_dir = config_dir or pagegen.SELF_PATH
+        # the last build; None if a full build is needed
+        self.site: pagegen.SiteBuild = None
+        self.transforms: pagegen.PageTransforms = None
+        self.page_parser: pagegen.PageParser = None
+        # filepath -> stat key, of inputs that affect all pages
+        self.global_keys: dict = {}
+        # filepath -> stat key, of inputs of the site's targets
+        self.input_keys: dict = {}
+        self.builds = 0
+
+    def global_inputs(self) -> dict:
+        """
+        return filepath -> stat key of inputs that affect all pages
+        """
+        filepaths = list(pagegen.get_config_files(self.config_dir))
+        filepaths.append(pagegen.INDEX_FILE)
+        for asset_dir in pagegen.ASSET_DIRS:
+            filepaths.extend(
+                filepath
+                for filepath in list_files(os.path.join(pagegen.OUTPUT_DIR, asset_dir))
+                # copies made by the manifest are outputs
+                if not assets.FINGERPRINTED_NAME.search(filepath)
+            )
+        return {filepath: pagegen.stat_key(filepath) for filepath in filepaths}
+
+    def file_keys(self, filepaths) -> dict:
+        """
+        return filepath -> stat key, for `filepaths`
+        """
+        return {filepath: pagegen.stat_key(filepath) for filepath in filepaths}
+
+    def build(self, full: bool = False) -> dict:
+        """
+        build pages changed since the last build; all pages if `full`.
+        returns a summary of the build
+        """
+        start = time.perf_counter()
+        # inputs are looked at before building, so changes made during
+        # the build are picked up by the next one
+        global_keys = self.global_inputs()
+        # a one-off build doesn't keep converted content; only ours do
+        keep_content_html = pagegen.KEEP_CONTENT_HTML
+        pagegen.KEEP_CONTENT_HTML = True
+        try:
+            full = full or self.site is None or pagegen.INTERMEDIATE_FILES
+            if full or global_keys != self.global_keys:
+                mode, pages = self.full_build()
+            else:
+                mode, pages = self.incremental_build()
+        except Exception:
+            # the state may be partially updated
+            self.site = None
+            raise
+        finally:
+            pagegen.KEEP_CONTENT_HTML = keep_content_html
+        self.global_keys = global_keys
+        self.builds += 1
+        return {
+            "mode": mode,
+            "pages": pages,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def full_build(self) -> Tuple[str, List[str]]:
+        _, content_file, _ = pagegen.get_config_files(self.config_dir)
+        content = pagegen.CMetadata.from_file(content_file)
+        # may be more than the site's inputs; only those are compared
+        inputs = [
+            metadata.get_contentpath()
+            for items in content.values()
+            for metadata in items
+        ]
+        inputs.extend(
+            os.path.normpath(filepath) for filepath in list_files(pagegen.TEMPLATE_DIR)
+        )
+        self.input_keys = self.file_keys(inputs)
+        self.transforms = pagegen.PageTransforms(pagegen.OUTPUT_DIR)
+        # layouts depend on the templates
+        self.page_parser = pagegen.PageParser()
+        self.site = pagegen.driver(self.config_dir, self.transforms, self.page_parser)
+        return "full", self.site.pages(self.site.graph.targets)
+
+    def incremental_build(self) -> Tuple[str, List[str]]:
+        site = self.site
+        input_keys = self.file_keys(site.graph.inputs())
+        changed = [
+            filepath
+            for filepath, key in input_keys.items()
+            if key != self.input_keys.get(filepath)
+        ]
+        self.input_keys = input_keys
+        if not changed:
+            return "noop", []
+
+        template_dir = os.path.normpath(pagegen.TEMPLATE_DIR)
+        if any(filepath.startswith(template_dir + os.sep) for filepath in changed):
+            # layouts are made from the templates again
+            self.page_parser.template_trees = None
+        built = site.run(site.graph.stale(changed))
+        self.transforms.finish()
+        site.file_manager.writer.finish()
+        return "incremental", site.pages(built)
+
+
+class BuildRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        response = self.server.dispatch(request)
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class BuildServer(socketserver.UnixStreamServer):
+    """
+    serves one request at a time; builds are never concurrent
+    """
+
+    def __init__(self, socket_path: str, builder: Builder):
+        if os.path.exists(socket_path):
+            try:
+                buildclient.request("status", socket_path)
+            except OSError:
+                # left behind by a server that didn't exit cleanly
+                os.remove(socket_path)
+            else:
+                raise RuntimeError(f"a build server is listening on {socket_path}")
+        super().__init__(socket_path, BuildRequestHandler)
+        self.socket_path = socket_path
+        self.builder = builder
+        self.started = time.time()
+        self.stopping = False
+
+    def dispatch(self, request: dict) -> dict:
+        command = request.get("command")
+        if command == "build":
+            # build output is returned to the client
+            log = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(log):
+                    summary = self.builder.build(full=request.get("full", False))
+            except Exception:
+                return {
+                    "ok": False,
+                    "error": traceback.format_exc(),
+                    "log": log.getvalue(),
+                }
+            return {"ok": True, **summary, "log": log.getvalue()}
+        if command == "status":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "builds": self.builder.builds,
+                "uptime": time.time() - self.started,
+            }
+        if command == "stop":
+            self.stopping = True
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown command {command!r}"}
+
+    def serve(self):
+        """
+        handle requests until stopped
+        """
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            os.remove(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--socket", default=buildclient.SOCKET_PATH, help="where to listen"
+    )
+    args = parser.parse_args()
+
+    server = BuildServer(args.socket, Builder())
+    print(f"build server listening on {args.socket}")
+    with contextlib.suppress(KeyboardInterrupt):
+        server.serve()
+
+
+if __name__ == "__main__":
+    main()
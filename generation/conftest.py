@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+
+import buildserver  # noqa: E402
+import corpus  # noqa: E402
+import pagegen  # noqa: E402
+
+
+@pytest.fixture
+def site_builder(tmp_path, monkeypatch):
+    """
+    a small generated corpus, with pagegen's paths pointed at it;
+    returns the corpus directory and a build server builder of it
+    """
+    corpus_dir = str(tmp_path / "corpus")
+    corpus.generate(corpus_dir, pages=8, essay_bytes=500)
+    for name, value in (
+        ("TEMPLATE_DIR", os.path.join(corpus_dir, "templates")),
+        ("OUTPUT_DIR", corpus_dir),
+        ("CONTENT_DIR", os.path.join(corpus_dir, "content")),
+        ("IMG_DIR", os.path.join(corpus_dir, "img")),
+        ("IMG_CONTENT_DIR", os.path.join(corpus_dir, "pics")),
+        ("INDEX_FILE", os.path.join(corpus_dir, "index.html")),
+        ("ASSET_MANIFEST", os.path.join(corpus_dir, "asset-manifest.json")),
+        ("TREE_CACHE_DIR", os.path.join(corpus_dir, ".tree-cache")),
+        ("RELATED_CACHE", os.path.join(corpus_dir, ".related-cache.json")),
+    ):
+        monkeypatch.setattr(pagegen, name, value)
+    return corpus_dir, buildserver.Builder(corpus_dir)
@@ -0,0 +1,478 @@
+"""
+compute the critical (above-the-fold) css of a page and
+inline it into the page's <head>.
+
+The stylesheets are large (bootstrap alone is ~200KB) and block rendering.
+Instead, the rules that match the first elements of the rendered tree are
+inlined into a <style> tag and the full stylesheets are loaded asynchronously.
+
+Pages rendered from the same template share the same above-the-fold
+structure, so the critical css is computed once per template and reused
+for every page rendered from that template.
+
+The selector matching is a crude subset of css; when in doubt a rule
+is included, since including too much only costs bytes, whereas
+leaving out a rule causes a flash of unstyled content.
+"""
+
+import os
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+import treeparser
+
+### Data structs
+
+# `conditions` is the tuple of enclosing conditional group preludes, e.g. ("@media (min-width: 576px)",)
+CSSRule = namedtuple("CSSRule", "selectors declarations conditions")
+
+# conditional at-rules whose bodies contain rules; any other block at-rule,
+# e.g. @font-face, @keyframes, is left to the full stylesheet
+CONDITIONAL_AT_RULES = ("@media", "@supports")
+
+# a compound selector, e.g. div.row#foo[type=button]:hover
+Compound = namedtuple("Compound", "tag ids classes attrs")
+
+_COMPOUND_PART = re.compile(
+    r"""
+    (?P<tag>\*|[a-zA-Z][\w-]*)
+    | \#(?P<id>[\w-]+)
+    | \.(?P<cls>[\w-]+)
+    | \[\s*(?P<attr>[\w-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?P<val>"[^"]*"|'[^']*'|[^\]\s]*)\s*)?[a-zA-Z]?\s*\]
+    | (?P<pseudo>::?[\w-]+(?:\((?:[^()]|\([^()]*\))*\))?)
+    """,
+    re.X,
+)
+_COMBINATOR = re.compile(r"\s*([>+~])\s*|\s+")
+_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+
+
+class UnsupportedSelector(Exception):
+    """selector uses syntax the matcher doesn't understand"""
+
+
+### Parsing
+
+
+def split_toplevel(text: str, sep: str) -> List[str]:
+    """
+    split `text` on `sep`, ignoring separators inside
+    parens, brackets or quotes
+    """
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for idx, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == sep and depth == 0:
+            parts.append(text[start:idx])
+            start = idx + 1
+    parts.append(text[start:])
+    return parts
+
+
+def find_block_end(text: str, start: int) -> int:
+    """
+    `start` is the index after an opening brace; return the index
+    of the matching closing brace
+    """
+    depth = 1
+    quote = None
+    idx = start
+    while idx < len(text):
+        char = text[idx]
+        if quote:
+            if char == "\\":
+                idx += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return idx
+        idx += 1
+    return len(text)
+
+
+def parse_rules(text: str, conditions: tuple = ()) -> List[CSSRule]:
+    """
+    parse (comment-free) css `text` into an ordered list of style rules;
+    order is preserved since it determines the cascade
+    """
+    rules = []
+    pos = 0
+    while pos < len(text):
+        brace = text.find("{", pos)
+        semi = text.find(";", pos)
+        if brace == -1:
+            break
+        if semi != -1 and semi < brace:
+            # at-statement, e.g. @charset, @import
+            pos = semi + 1
+            continue
+        prelude = text[pos:brace].strip()
+        start = brace + 1
+        end = find_block_end(text, start)
+        body = text[start:end]
+        pos = end + 1
+
+        if prelude.startswith("@"):
+            if prelude.startswith(CONDITIONAL_AT_RULES):
+                rules.extend(parse_rules(body, conditions + (prelude,)))
+            continue
+
+        selectors = [sel.strip() for sel in split_toplevel(prelude, ",")]
+        rules.append(CSSRule(selectors, body.strip(), conditions))
+    return rules
+
+
+def parse_stylesheet(text: str) -> List[CSSRule]:
+    """parse stylesheet `text` into rules"""
+    return parse_rules(_COMMENT.sub("", text))
+
+
+def parse_compound(text: str) -> Compound:
+    """
+    parse a compound selector, e.g. a.nav-link:hover
+    pseudo classes and elements are ignored, i.e. assumed to match
+    """
+    tag = None
+    ids, classes, attrs = [], [], []
+    pos = 0
+    while pos < len(text):
+        match = _COMPOUND_PART.match(text, pos)
+        if match is None:
+            raise UnsupportedSelector(text)
+        if match.group("tag"):
+            tag = match.group("tag").lower()
+        elif match.group("id"):
+            ids.append(match.group("id"))
+        elif match.group("cls"):
+            classes.append(match.group("cls"))
+        elif match.group("attr"):
+            val = match.group("val")
+            if val and val[0] in "\"'":
+                val = val[1:-1]
+            attrs.append((match.group("attr").lower(), match.group("op"), val))
+        pos = match.end()
+    return Compound(tag, ids, classes, attrs)
+
+
+def parse_selector(text: str) -> list:
+    """
+    parse selector into alternating list of compounds and combinators,
+    i.e. [compound, combinator, compound, ...]
+    where combinator is one of " ", ">", "+", "~"
+    """
+    parts = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        # a compound runs until the next top-level combinator
+        end = pos
+        depth = 0
+        while end < len(text):
+            char = text[end]
+            if char in "([":
+                depth += 1
+            elif char in ")]":
+                depth -= 1
+            elif depth == 0 and (char.isspace() or char in ">+~"):
+                break
+            end += 1
+        if end == pos:
+            raise UnsupportedSelector(text)
+        parts.append(parse_compound(text[pos:end]))
+        if end == len(text):
+            break
+        match = _COMBINATOR.match(text, end)
+        parts.append(match.group(1) or " ")
+        pos = match.end()
+    return parts
+
+
+### Matching
+
+
+class Element:
+    """
+    an element node, along with the structural context
+    needed to evaluate combinators
+    """
+
+    def __init__(self, node: treeparser.Node, parent, prev_sibling):
+        self.node = node
+        self.parent = parent
+        self.prev_sibling = prev_sibling
+        attrs = dict(node.attrs or [])
+        self.attrs = attrs
+        self.classes = set((attrs.get("class") or "").split())
+
+
+def is_element(node: treeparser.Node) -> bool:
+    return not isinstance(
+        node, (treeparser.RootNode, treeparser.DataNode, treeparser.CommentNode)
+    )
+
+
+def above_the_fold(root: treeparser.RootNode, limit: int) -> List[Element]:
+    """
+    return the first `limit` elements in document order.
+    Since this is a pre-order walk, the ancestors and previous siblings
+    of every returned element are also returned.
+    """
+    result: List[Element] = []
+
+    def walk(node, parent):
+        prev = None
+        for child in node.children:
+            if len(result) >= limit:
+                return
+            if not is_element(child):
+                continue
+            elem = Element(child, parent, prev)
+            result.append(elem)
+            walk(child, elem)
+            prev = elem
+
+    walk(root, None)
+    return result
+
+
+def compound_matches(compound: Compound, elem: Element) -> bool:
+    if compound.tag is not None and compound.tag not in ("*", elem.node.tag):
+        return False
+    for objectid in compound.ids:
+        if elem.attrs.get("id") != objectid:
+            return False
+    for classname in compound.classes:
+        if classname not in elem.classes:
+            return False
+    for attr, op, val in compound.attrs:
+        if attr not in elem.attrs:
+            return False
+        actual = elem.attrs[attr] or ""
+        if op is None:
+            continue
+        if op == "=" and actual != val:
+            return False
+        if op == "~=" and val not in actual.split():
+            return False
+        if op == "|=" and not (actual == val or actual.startswith(f"{val}-")):
+            return False
+        if op == "^=" and not actual.startswith(val):
+            return False
+        if op == "$=" and not actual.endswith(val):
+            return False
+        if op == "*=" and val not in actual:
+            return False
+    return True
+
+
+def selector_matches(parts: list, idx: int, elem: Optional[Element]) -> bool:
+    """
+    match selector right to left, starting at compound `parts[idx]`
+    """
+    if elem is None or not compound_matches(parts[idx], elem):
+        return False
+    if idx == 0:
+        return True
+    combinator = parts[idx - 1]
+    if combinator == ">":
+        return selector_matches(parts, idx - 2, elem.parent)
+    if combinator == "+":
+        return selector_matches(parts, idx - 2, elem.prev_sibling)
+    # descendant and general sibling combinators
+    step = (lambda e: e.parent) if combinator == " " else (lambda e: e.prev_sibling)
+    other = step(elem)
+    while other is not None:
+        if selector_matches(parts, idx - 2, other):
+            return True
+        other = step(other)
+    return False
+
+
+def rule_matches(rule: CSSRule, elements: List[Element]) -> bool:
+    """
+    True if any of the rule's selectors match any element
+    """
+    for selector in rule.selectors:
+        try:
+            parts = parse_selector(selector)
+        except UnsupportedSelector:
+            # be conservative
+            return True
+        last = len(parts) - 1
+        if any(selector_matches(parts, last, elem) for elem in elements):
+            return True
+    return False
+
+
+### Critical CSS
+
+
+def rebase_urls(declarations: str, css_dir: str, page_dir: str) -> str:
+    """
+    relative url(...) in a stylesheet are relative to the stylesheet;
+    once inlined, they need to be relative to the page
+    """
+
+    def rebase(match):
+        url = match.group(2)
+        if re.match(r"^([a-zA-Z][\w+.-]*:|/|#)", url):
+            # absolute, data uri or fragment
+            return match.group(0)
+        abspath = os.path.normpath(os.path.join(css_dir, url))
+        relpath = os.path.relpath(abspath, page_dir).replace(os.sep, "/")
+        return f'url("{relpath}")'
+
+    return _URL.sub(rebase, declarations)
+
+
+def format_rules(rules: List[tuple]) -> str:
+    """
+    format (rule, declarations) pairs as css text;
+    consecutive rules under the same conditions share a block
+    """
+    result = []
+    open_conditions: tuple = ()
+    for rule, declarations in rules:
+        if rule.conditions != open_conditions:
+            result.append("}" * len(open_conditions))
+            result.extend(f"{cond}{{" for cond in rule.conditions)
+            open_conditions = rule.conditions
+        result.append(f"{','.join(rule.selectors)}{{{declarations}}}")
+    result.append("}" * len(open_conditions))
+    return "".join(result)
+
+
+def is_local_stylesheet(node: treeparser.Node) -> bool:
+    attrs = dict(node.attrs or [])
+    href = attrs.get("href") or ""
+    if node.tag != "link" or attrs.get("rel") != "stylesheet" or not href:
+        return False
+    return not re.match(r"^([a-zA-Z][\w+.-]*:|//)", href)
+
+
+class CriticalCSS:
+    """
+    computes critical css, memoized per template
+    """
+
+    def __init__(self, page_dir: str, limit: int):
+        """
+        `page_dir` is the directory the pages (and hence stylesheet hrefs) are relative to
+        `limit` is the number of elements considered above the fold
+        """
+        self.page_dir = page_dir
+        self.limit = limit
+        # href -> [CSSRule]
+        self.stylesheets: Dict[str, List[CSSRule]] = {}
+        # template_id -> critical css text
+        self.templates: Dict[str, str] = {}
+
+    def get_rules(self, href: str) -> List[CSSRule]:
+        """
+        parse stylesheet once per build
+        """
+        if href not in self.stylesheets:
+            filepath = os.path.join(self.page_dir, href)
+            with open(filepath, encoding="utf-8") as fp:
+                self.stylesheets[href] = parse_stylesheet(fp.read())
+        return self.stylesheets[href]
+
+    def compute(self, tree: treeparser.Tree) -> str:
+        """
+        compute the critical css of `tree`
+        """
+        root = tree.get_root(as_qmnode=False)
+        elements = above_the_fold(root, self.limit)
+        head = tree.get_root().descendent(tag="head")
+        links = head.descendents(tag="link") if head else []
+
+        critical = []
+        for link in links:
+            if not is_local_stylesheet(link.node):
+                continue
+            href = link.get_attr("href")
+            css_dir = os.path.dirname(os.path.join(self.page_dir, href))
+            for rule in self.get_rules(href):
+                if rule_matches(rule, elements):
+                    declarations = rebase_urls(
+                        rule.declarations, css_dir, self.page_dir
+                    )
+                    declarations = re.sub(r"\s*\n\s*", " ", declarations)
+                    critical.append((rule, declarations))
+        return format_rules(critical)
+
+    def for_template(self, template_id: str, tree: treeparser.Tree) -> str:
+        """
+        return critical css for `template_id`; `tree` is
+        a page rendered from it, used only on the first call
+        """
+        if template_id not in self.templates:
+            print(f"computing critical css for {template_id}")
+            self.templates[template_id] = self.compute(tree)
+        return self.templates[template_id]
+
+    def inline(self, template_id: str, tree: treeparser.Tree) -> list:
+        """
+        inline the critical css for `template_id` into `tree`'s <head> and make
+        the local stylesheets load asynchronously. Modifies `tree` in place.
+        Returns the inserted nodes
+        """
+        css = self.for_template(template_id, tree)
+        head = tree.get_root().descendent(tag="head")
+        if head is None:
+            return []
+
+        links = [
+            link
+            for link in head.descendents(tag="link")
+            if is_local_stylesheet(link.node)
+        ]
+        if not links:
+            return []
+
+        # the inline style goes before the first stylesheet, or before the
+        # child of head it's nested in
+        first = links[0].node
+        while tree.get_parent(first) is not head.node:
+            first = tree.get_parent(first)
+        style = treeparser.OpenClosedNode("style", [])
+        style.children.append(treeparser.DataNode(css))
+        head.insert_child(style, head.node.children.index(first))
+        inserted = [style]
+
+        for link in links:
+            href = link.get_attr("href")
+            # swap to a non-blocking preload that applies itself on load
+            link.set_attr("rel", "preload")
+            link.set_attr("as", "style")
+            link.set_attr("onload", "this.onload=null;this.rel='stylesheet'")
+            # fallback when javascript is disabled
+            noscript = treeparser.OpenClosedNode("noscript", [])
+            noscript.children.append(
+                treeparser.ClosedNode(
+                    "link", attrs=[("href", href), ("rel", "stylesheet")]
+                )
+            )
+            parent = treeparser.QMNode(tree.get_parent(link.node), tree)
+            parent.insert_child(noscript, parent.node.children.index(link.node) + 1)
+            inserted.append(noscript)
+        return inserted
@@ -0,0 +1,158 @@
+"""
+atom feeds and sitemap.xml, from the content metadata
+
+A feed lists the newest content pages, of the site or of a section, by
+title and date; the sitemap lists every page. Neither depends on what's
+on the pages, only on the set, order and metadata of items, which rarely
+change. So each file records a digest of what it's made from, in a
+comment on its second line, and it's only regenerated when that differs.
+
+Files are streamed to disk as they're generated, with an XMLGenerator,
+rather than built in memory; see OutputWriter.stream.
+"""
+import datetime
+import hashlib
+import re
+from collections import namedtuple
+from typing import Callable, List, Optional
+from xml.sax.saxutils import XMLGenerator
+
+import outputwriter
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+_SOURCE = re.compile(r"<!-- source ([0-9a-f]+) -->")
+
+# a feed entry or sitemap url; `date` is None if unknown
+Entry = namedtuple("Entry", "url title date")
+
+
+def to_date(date) -> datetime.date:
+    """
+    date of a yaml date, e.g. 2020-12-25, or a string like "2021-1-26"
+    or "2019-1"; missing parts are 1
+    """
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    parts = [int(part) for part in str(date).split("-")]
+    return datetime.date(*(parts + [1, 1])[:3])
+
+
+def timestamp(date) -> str:
+    return f"{to_date(date).isoformat()}T00:00:00Z"
+
+
+def read_source(filepath: str) -> Optional[str]:
+    """
+    return the source digest recorded in the file at `filepath`
+    """
+    try:
+        with open(filepath, encoding="utf-8") as fp:
+            fp.readline()
+            match = _SOURCE.match(fp.readline())
+    except (OSError, UnicodeDecodeError):
+        return None
+    return match.group(1) if match else None
+
+
+def element(xml: XMLGenerator, name: str, text: str = None, attrs: dict = None):
+    xml.startElement(name, attrs or {})
+    if text is not None:
+        xml.characters(text)
+    xml.endElement(name)
+
+
+def write_xml(
+    filepath: str,
+    header: tuple,
+    entries: List[Entry],
+    writer: outputwriter.OutputWriter,
+    write_root: Callable,
+) -> bool:
+    """
+    stream the document, whose root element is written by
+    `write_root(xml)`, to `filepath`; unless what it's made from, `header`
+    and `entries`, is the same as the last time. returns whether the file
+    was written
+    """
+    source = hashlib.blake2b(repr(header).encode(), digest_size=16)
+    for entry in entries:
+        source.update(repr(entry).encode())
+    digest = source.hexdigest()
+    if read_source(filepath) == digest:
+        return False
+    with writer.stream(filepath) as fp:
+        xml = XMLGenerator(fp, "utf-8", short_empty_elements=True)
+        xml.startDocument()
+        fp.write(f"<!-- source {digest} -->\n")
+        write_root(xml)
+        xml.endDocument()
+        fp.write("\n")
+    return True
+
+
+def write_feed(
+    filepath: str,
+    feed_url: str,
+    site_url: str,
+    title: str,
+    author: str,
+    entries: List[Entry],
+    writer: outputwriter.OutputWriter,
+) -> bool:
+    """
+    write an atom feed of `entries`, newest first, to `filepath`, which is
+    served at `feed_url`. returns whether the file was written
+    """
+
+    def write_root(xml: XMLGenerator):
+        xml.startElement("feed", {"xmlns": ATOM_NS})
+        xml.ignorableWhitespace("\n")
+        element(xml, "id", feed_url)
+        element(xml, "title", title)
+        element(xml, "link", attrs={"href": feed_url, "rel": "self"})
+        element(xml, "link", attrs={"href": site_url})
+        dates = [to_date(entry.date) for entry in entries]
+        updated = max(dates) if dates else datetime.date(1970, 1, 1)
+        element(xml, "updated", timestamp(updated))
+        xml.startElement("author", {})
+        element(xml, "name", author)
+        xml.endElement("author")
+        xml.ignorableWhitespace("\n")
+        for entry in entries:
+            xml.startElement("entry", {})
+            element(xml, "id", entry.url)
+            element(xml, "title", entry.title)
+            element(xml, "link", attrs={"href": entry.url})
+            element(xml, "updated", timestamp(entry.date))
+            xml.endElement("entry")
+            xml.ignorableWhitespace("\n")
+        xml.endElement("feed")
+
+    header = ("atom", feed_url, site_url, title, author)
+    return write_xml(filepath, header, entries, writer, write_root)
+
+
+def write_sitemap(
+    filepath: str, entries: List[Entry], writer: outputwriter.OutputWriter
+) -> bool:
+    """
+    write a sitemap of the urls of `entries` to `filepath`; an entry's
+    date is its last modification. returns whether the file was written
+    """
+
+    def write_root(xml: XMLGenerator):
+        xml.startElement("urlset", {"xmlns": SITEMAP_NS})
+        xml.ignorableWhitespace("\n")
+        for entry in entries:
+            xml.startElement("url", {})
+            element(xml, "loc", entry.url)
+            if entry.date is not None:
+                element(xml, "lastmod", to_date(entry.date).isoformat())
+            xml.endElement("url")
+            xml.ignorableWhitespace("\n")
+        xml.endElement("urlset")
+
+    return write_xml(filepath, ("sitemap",), entries, writer, write_root)
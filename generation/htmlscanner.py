@@ -0,0 +1,137 @@
+"""
+fast scanner for well-formed html, e.g. our generated pages
+
+html.parser.HTMLParser is tolerant of any input, at the cost of trying
+several regexes and bookkeeping per token; it's most of the time spent
+parsing a page. The pages we parse are our own output, so tags are a
+small regular subset of html. This scanner matches each token with a
+single regex and calls the same handler methods as HTMLParser, i.e.
+handle_starttag, handle_endtag, handle_startendtag, handle_data,
+handle_comment and handle_decl.
+
+It only accepts input that it tokenizes exactly like HTMLParser; on
+anything else, e.g. a stray "<", a processing instruction, an attribute
+without whitespace before it or a truncated tag, it raises Unsupported
+and the caller falls back to HTMLParser. test_htmlscanner.py checks that
+both give the same tree for every page in the repo.
+"""
+import re
+from html import unescape
+
+# elements whose content is raw text, up to the end tag
+CDATA_CONTENT_ELEMENTS = ("script", "style")
+
+_ATTR = r"""
+    [a-zA-Z_:][-a-zA-Z0-9_:.]*
+    (?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>][^\s>]*))?
+"""
+_STARTTAG = re.compile(rf"""<([a-zA-Z][-a-zA-Z0-9]*)((?:\s+{_ATTR})*)\s*(/?)>""", re.X)
+_ATTRS = re.compile(
+    r"""([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'>][^\s>]*))?"""
+)
+_ENDTAG = re.compile(r"</([a-zA-Z][-.a-zA-Z0-9:_]*)\s*>")
+_DOCTYPE = re.compile(r"<!doctype", re.I)
+_CDATA_END = {
+    tag: re.compile(rf"</\s*{tag}\s*>", re.I) for tag in CDATA_CONTENT_ELEMENTS
+}
+# HTMLParser holds back trailing text with an unterminated reference
+_TRAILING_REF = re.compile(r"&[^\s;]*$")
+
+
+class Unsupported(Exception):
+    """
+    input the scanner can't tokenize exactly like HTMLParser
+    """
+
+    pass
+
+
+def parse_attrs(text: str) -> list:
+    """
+    return [(name, value)] of the attributes in `text`;
+    value is None for attributes without one
+    """
+    attrs = []
+    for name, value in _ATTRS.findall(text):
+        if not value:
+            # no "=", i.e. the value group didn't match
+            attrs.append((name.lower(), None))
+            continue
+        if value[0] in "\"'":
+            value = value[1:-1]
+        attrs.append((name.lower(), unescape(value) if value else value))
+    return attrs
+
+
+def scan(text: str, handler):
+    """
+    tokenize the whole document `text`, calling `handler`'s handle_* methods
+    raises Unsupported, possibly after calling some handler methods
+    """
+    find = text.find
+    startswith = text.startswith
+    match_starttag = _STARTTAG.match
+    match_endtag = _ENDTAG.match
+    match_doctype = _DOCTYPE.match
+    handle_data = handler.handle_data
+    pos = 0
+    end = len(text)
+    while pos < end:
+        lt = find("<", pos)
+        if lt < 0:
+            data = text[pos:]
+            if "&" in data[-34:] and _TRAILING_REF.search(data[-34:]):
+                raise Unsupported("unterminated reference at end")
+            handle_data(unescape(data) if "&" in data else data)
+            return
+        if lt > pos:
+            data = text[pos:lt]
+            handle_data(unescape(data) if "&" in data else data)
+
+        nxt = text[lt + 1] if lt + 1 < end else ""
+        if nxt == "/":
+            match = match_endtag(text, lt)
+            if match is None:
+                raise Unsupported(f"end tag at {lt}")
+            handler.handle_endtag(match.group(1).lower())
+            pos = match.end()
+        elif nxt.isalpha():
+            match = match_starttag(text, lt)
+            if match is None:
+                raise Unsupported(f"start tag at {lt}")
+            tag = match.group(1).lower()
+            attrs = parse_attrs(match.group(2)) if match.group(2) else []
+            pos = match.end()
+            if match.group(3):
+                handler.handle_startendtag(tag, attrs)
+                continue
+            handler.handle_starttag(tag, attrs)
+            if tag in CDATA_CONTENT_ELEMENTS:
+                # raw text, up to the end tag
+                close = _CDATA_END[tag].search(text, pos)
+                if close is None:
+                    raise Unsupported(f"unclosed {tag} at {lt}")
+                data_end = close.start()
+                if data_end > pos:
+                    handle_data(text[pos:data_end])
+                handler.handle_endtag(tag)
+                pos = close.end()
+        elif startswith("<!--", lt):
+            start = lt + 4
+            close = find("-->", start)
+            if close < 0:
+                raise Unsupported(f"comment at {lt}")
+            comment = text[start:close]
+            if "--" in comment:
+                raise Unsupported(f"comment at {lt}")
+            handler.handle_comment(comment)
+            pos = close + 3
+        elif match_doctype(text, lt):
+            close = find(">", lt + 9)
+            if close < 0:
+                raise Unsupported(f"doctype at {lt}")
+            start = lt + 2
+            handler.handle_decl(text[start:close])
+            pos = close + 1
+        else:
+            raise Unsupported(f"markup at {lt}")
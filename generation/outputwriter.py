@@ -0,0 +1,223 @@
+"""
+writer for generated output files
+
+Every build used to rewrite every output file, though most are
+byte-identical to the last build; that touches mtimes, shows up as changes
+in the working tree and defeats caching downstream, e.g. by a web server.
+
+OutputWriter compares the hash of a file's new content with the file on
+disk, and skips identical writes. A changed file is written to a temp file
+that replaces it with os.replace, so a reader never sees a partial file.
+The temp file is closed before the replace, since an open file can't be
+replaced on windows. Rather than syncing each file as it's written, the
+paths of replaced files are kept, and reopened and fsynced in batches,
+followed by their directories.
+
+Large files can be streamed, see OutputWriter.stream, rather than held
+in memory.
+
+BackgroundWriter does the same on a background thread, so a build goes on
+with the next page while the last is written.
+"""
+import contextlib
+import hashlib
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+# bytes read at a time when hashing existing output
+READ_CHUNK = 1024 * 1024
+
+
+def file_digest(filepath: str) -> Optional[bytes]:
+    """
+    return digest of the file at `filepath`; None if it doesn't exist
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(filepath, "rb") as fp:
+            for chunk in iter(lambda: fp.read(READ_CHUNK), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.digest()
+
+
+class OutputWriter:
+    """
+    writes text files, skipping unchanged ones; fsyncs every `fsync_batch`
+    written files, 0 disables fsync
+    """
+
+    def __init__(self, fsync_batch: int = 64):
+        self.fsync_batch = fsync_batch
+        # paths of files replaced, but not yet synced
+        self.pending: List[str] = []
+        # counts for the build summary
+        self.written = 0
+        self.bytes_written = 0
+        self.unchanged = 0
+
+    def write(self, filepath: str, text: str) -> bool:
+        """
+        write `text` to `filepath` as utf-8, as open(filepath, "w") would;
+        returns whether the file changed
+        """
+        if os.linesep != "\n":
+            text = text.replace("\n", os.linesep)
+        data = text.encode("utf-8")
+        # a file of another size differs, without reading it
+        try:
+            same_size = os.path.getsize(filepath) == len(data)
+        except OSError:
+            same_size = False
+        if same_size:
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if file_digest(filepath) == digest:
+                self.unchanged += 1
+                return False
+
+        tmppath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmppath, "wb") as fp:
+                fp.write(data)
+            os.replace(tmppath, filepath)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        self.written += 1
+        self.bytes_written += len(data)
+        self.replaced(filepath)
+        return True
+
+    @contextlib.contextmanager
+    def stream(self, filepath: str):
+        """
+        yield a text file, written like `write` would, without holding the
+        text in memory; it replaces `filepath` on exit, unless identical
+        """
+        tmppath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmppath, "w", encoding="utf-8") as fp:
+                yield fp
+            size = os.path.getsize(tmppath)
+            try:
+                same_size = os.path.getsize(filepath) == size
+            except OSError:
+                same_size = False
+            if same_size and file_digest(tmppath) == file_digest(filepath):
+                self.unchanged += 1
+                return
+            os.replace(tmppath, filepath)
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        self.written += 1
+        self.bytes_written += size
+        self.replaced(filepath)
+
+    def replaced(self, filepath: str):
+        """
+        `filepath` was replaced; sync it with the next batch
+        """
+        if self.fsync_batch:
+            self.pending.append(filepath)
+            if len(self.pending) >= self.fsync_batch:
+                self.sync()
+
+    def submit(self, fn: Callable, *args):
+        """
+        call `fn(*args)` once the files written so far are written
+        """
+        return fn(*args)
+
+    def sync(self):
+        """
+        fsync the files written since the last sync, and their directories
+        """
+        dirpaths = set()
+        for filepath in self.pending:
+            try:
+                # windows only fsyncs files open for writing
+                fd = os.open(filepath, os.O_RDWR)
+            except FileNotFoundError:
+                # removed since; nothing to sync
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            dirpaths.add(os.path.dirname(os.path.abspath(filepath)))
+        self.pending = []
+        # the replace is durable once the directory is synced;
+        # directories can't be opened on windows
+        if hasattr(os, "O_DIRECTORY"):
+            for dirpath in dirpaths:
+                fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def report(self) -> str:
+        return (
+            f"output: {self.written} files written ({self.bytes_written} bytes),"
+            f" {self.unchanged} unchanged"
+        )
+
+    def finish(self):
+        """
+        called after a build; syncs, prints and resets the counts
+        """
+        self.sync()
+        print(self.report())
+        self.written = 0
+        self.bytes_written = 0
+        self.unchanged = 0
+
+
+class BackgroundWriter(OutputWriter):
+    """
+    OutputWriter that writes on a background thread; write returns once the
+    file is queued. At most `max_queued` writes are queued, which bounds the
+    text held in memory; a failed write raises on a later call
+    """
+
+    def __init__(self, fsync_batch: int = 64, max_queued: int = 16):
+        super().__init__(fsync_batch)
+        self.max_queued = max_queued
+        # one thread, so files are written in order; started on first use
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="pagegen-writer")
+        self.queued: deque = deque()
+
+    def write(self, filepath: str, text: str):
+        self.submit(super().write, filepath, text)
+
+    def submit(self, fn: Callable, *args):
+        """
+        call `fn(*args)` on the writer thread, after the queued writes
+        """
+        self.queued.append(self.executor.submit(fn, *args))
+        while len(self.queued) > self.max_queued:
+            self.queued.popleft().result()
+
+    @contextlib.contextmanager
+    def stream(self, filepath: str):
+        # on the calling thread, once the writer thread is idle
+        self.drain()
+        with super().stream(filepath) as fp:
+            yield fp
+
+    def drain(self):
+        """
+        wait until the queued writes are done
+        """
+        while self.queued:
+            self.queued.popleft().result()
+
+    def finish(self):
+        self.drain()
+        super().finish()
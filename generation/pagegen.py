@@ -1,18 +1,34 @@
 """
 static website generation pipeline
+
+jinja2, yaml and the modules of each stage are imported where they're used,
+so commands only pay for loading what they need; see test_startup.py
 """
+
+from __future__ import annotations
+
+import argparse
+import functools
+import itertools
 import os
-import yaml
+import sys
 
-from collections import namedtuple, defaultdict
-from jinja2 import Environment, FileSystemLoader
+from collections import namedtuple, defaultdict, deque
 
-from typing import List
+from typing import Callable, Iterable, Iterator, List, TYPE_CHECKING
 
 # local imports
-import textparser
-import treeparser
-import validations
+import profiling
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from jinja2 import Environment
+
+    import outputwriter
+    import searchindex
+    import treeparser
+    import validations
 
 ###  Config
 ## Config source and output of generation
@@ -24,6 +40,14 @@ IMG_DIR = os.path.join(SELF_PATH, r"..\img")
 # IMG_CONTENT_DIR is where images produced by me are stored
 IMG_CONTENT_DIR = os.path.join(SELF_PATH, r"..\pics")
 INDEX_FILE = os.path.join(SELF_PATH, r"..\index.html")
+# records fingerprinted asset names across builds
+ASSET_MANIFEST = os.path.join(SELF_PATH, "asset-manifest.json")
+# where --profile output is written
+PROFILE_DIR = os.path.join(SELF_PATH, "profile")
+# parsed trees of unchanged pages are loaded from here, instead of re-parsed
+TREE_CACHE_DIR = os.path.join(SELF_PATH, ".tree-cache")
+# term counts of content, for related posts, are cached here across builds
+RELATED_CACHE = os.path.join(SELF_PATH, ".related-cache.json")
 
 ## Config Generation pipeline
 # whether intermediate files are stored; for normal run set `True`
@@ -33,6 +57,86 @@ INTERMEDIATE_FILES = False
 # on listing pages, I show the first line of content
 # truncate the line if longer limit
 PREVIEW_LINE_LIMIT = 135
+# items per listing page; later pages are <section>-listing-<n>.html.
+# 0 puts all items on one page
+LISTING_PAGE_SIZE = 20
+# whether sections with more than one listing page also get a page per year,
+# i.e. <section>-archive-<year>.html
+ARCHIVE_YEARS = True
+# whether above-the-fold css is inlined, and the stylesheets loaded async
+CRITICAL_CSS = True
+# number of elements (in document order) considered above the fold
+ABOVE_THE_FOLD_ELEMENTS = 80
+# whether referenced assets are copied to content-hashed names, e.g. style.<hash>.css
+FINGERPRINT_ASSETS = True
+# directories (relative to OUTPUT_DIR) containing assets to fingerprint
+ASSET_DIRS = ("css", "js", "img", "pics")
+# images smaller than this (bytes) are inlined as data uris; 0 disables
+INLINE_ASSET_LIMIT = 2048
+# whether byte-identical assets are referenced through one canonical copy
+DEDUPLICATE_ASSETS = True
+# directories (relative to OUTPUT_DIR) of the content-addressed asset store
+ASSET_STORE_DIRS = ("img", "pics")
+# whether parsed trees are cached across builds
+TREE_CACHE = True
+# least recently used trees are evicted beyond this size (bytes)
+TREE_CACHE_BYTES = 64 * 1024 * 1024
+# whether content pages are built by splicing their content block into
+# the parsed layout of their template, rather than parsed whole
+TEMPLATE_TREES = True
+# whether converted content is kept in memory between builds, e.g. by the
+# build server; a single build converts each page once
+KEEP_CONTENT_HTML = False
+# changed output files are fsynced in batches of this many; 0 disables fsync
+FSYNC_BATCH = 64
+
+## Config overlapping file I/O with rendering, parsing and transforming
+# whether sources of upcoming pages are read ahead, and output is written on
+# a background thread; pays off when I/O is slow, e.g. on a network
+# filesystem or with cold caches. With files cached on a local disk,
+# switching threads costs more than it saves
+OVERLAP_IO = False
+# threads reading sources ahead
+READ_THREADS = 4
+# sources of at most this many pages are read ahead of the page being built
+READ_AHEAD = 8
+
+## Config search
+# whether a full-text index of content pages is written, for js/search.js;
+# see searchindex.py
+SEARCH_INDEX = True
+# directory of the index, relative to the output directory
+SEARCH_DIR = "search"
+# index shards hold the terms starting with the same this many characters
+SEARCH_PREFIX_LEN = 2
+
+## Config feeds and sitemap
+# whether atom feeds, of the site and of each section, and sitemap.xml
+# are written; see feeds.py
+FEEDS = True
+# url the site is served at, i.e. the domain in CNAME
+SITE_URL = "https://www.spandanbemby.com/"
+# title of the site's feed, and the author of all content
+SITE_AUTHOR = "Spandan Bemby"
+# entries in a feed, newest first; 0 for all
+FEED_ENTRIES = 20
+
+## Config related posts
+# whether content pages link to the most similar content, by tf-idf;
+# see related.py
+RELATED_POSTS = True
+# number of related posts linked from a content page
+RELATED_COUNT = 3
+
+## Config prefetch hints
+# pages a page hints the browser to fetch ahead, as <link rel=...> in its
+# head; hint -> rel, i.e. "prefetch" or "prerender". Hints are:
+#   prev, next: the previous and next posts, on a content page
+#   listed: the first PREFETCH_LISTED posts, on listing and archive pages
+# a section can set its own, with `prefetch` in sections.yaml
+PREFETCH_HINTS = {"prev": "prefetch", "next": "prefetch", "listed": "prefetch"}
+# number of posts a listing page hints
+PREFETCH_LISTED = 2
 """
 Notes
 the yaml files may be sensitive to tab characters
@@ -163,6 +267,7 @@ class LMetadata:
         template_id: str,
         subtext: str = "",
         image_content: bool = False,
+        prefetch: dict = None,
     ):
         # section has no whitespace - unique id
         self.section = section
@@ -171,6 +276,13 @@ class LMetadata:
         self.template_id = template_id
         self.subtext = subtext
         self.image_content = image_content
+        # hint -> rel; see PREFETCH_HINTS
+        self.prefetch = dict(PREFETCH_HINTS if prefetch is None else prefetch)
+        for hint, rel in self.prefetch.items():
+            if hint not in ("prev", "next", "listed"):
+                raise ValueError(f"{section}: unknown prefetch hint {hint}")
+            if rel not in ("prefetch", "prerender"):
+                raise ValueError(f"{section}: unknown rel {rel} of {hint} hint")
 
     def __repr__(self):
         return f"LM[{self.__dict__}]"
@@ -193,22 +305,72 @@ class LMetadata:
 
 ### Utils
 
+# caches kept for the life of the process; the build server (buildserver.py)
+# keeps them warm across builds
+# filepath -> (stat key, parsed yaml)
+_yaml_cache: dict = {}
+# template dir -> jinja environment; compiled templates are cached by jinja,
+# and recompiled when the template file changes
+_environments: dict = {}
+# content path -> (stat key, html block)
+_html_cache: dict = {}
+
+
+def stat_key(filepath: str) -> tuple:
+    """
+    key that changes whenever the file at `filepath` changes
+    """
+    stat = os.stat(filepath)
+    return (stat.st_mtime_ns, stat.st_size)
+
 
 def load_yaml(filepath: str):
     """
-    read yaml file
+    read yaml file; the parsed result is reused while the file is unchanged,
+    so callers must not mutate it
     """
+    key = stat_key(filepath)
+    cached = _yaml_cache.get(filepath)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    import yaml
+
     content = None
     with open(filepath) as fp:
         content = yaml.safe_load(fp)
+    _yaml_cache[filepath] = (key, content)
     return content
 
 
-def get_relpath(fpath: str, refpath=OUTPUT_DIR) -> str:
+def get_environment() -> Environment:
+    """
+    get the jinja environment for TEMPLATE_DIR
+    """
+    env = _environments.get(TEMPLATE_DIR)
+    if env is None:
+        from jinja2 import Environment, FileSystemLoader
+
+        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+        _environments[TEMPLATE_DIR] = env
+    # head.jinja.html includes the search box if there's an index
+    env.globals["search_dir"] = SEARCH_DIR if SEARCH_INDEX else None
+    return env
+
+
+def get_year(date) -> int:
+    """
+    year of a yaml date, e.g. 2020-12-25, or a string like "2021-1"
+    """
+    return int(str(date).split("-")[0])
+
+
+def get_relpath(fpath: str, refpath: str = None) -> str:
     """
-    get `fpath` relative to `refpath`
+    get `fpath` relative to `refpath`; defaults to OUTPUT_DIR
+    (looked up on call, so the output dir can be reconfigured)
     """
-    return os.path.relpath(fpath, refpath)
+    return os.path.relpath(fpath, refpath or OUTPUT_DIR)
 
 
 def decorate_path(filepath: str, dec: str) -> str:
@@ -253,6 +415,7 @@ def get_lines(content_path: str) -> List:
 
 ### Content Generation
 
+
 class FileManager:
     """
     file manager used to access files and get prev/next links
@@ -264,14 +427,26 @@ class FileManager:
     """
 
     def __init__(
-        self, content: dict, output_dir=OUTPUT_DIR
+        self,
+        content: dict,
+        output_dir=OUTPUT_DIR,
+        writer: outputwriter.OutputWriter = None,
     ):
         """"""
+        import outputwriter
+
         # content map: section -> CMetadata
         self.content = content
         self.output_dir = output_dir
 
         self.decoration = ""
+        # all output is written through this; see outputwriter.py
+        if writer is None:
+            if OVERLAP_IO:
+                writer = outputwriter.BackgroundWriter(FSYNC_BATCH)
+            else:
+                writer = outputwriter.OutputWriter(FSYNC_BATCH)
+        self.writer = writer
 
     def set_decoration(self, decoration: str):
         """
@@ -280,9 +455,57 @@ class FileManager:
         """
         self.decoration = decoration
 
-    def get_listing_filepath(self, section: str):
+    def get_listing_filepath(self, section: str, page: int = 0):
+        """
+        get path of the `page`th listing page of `section`
+        """
         decoration = f"-{self.decoration}" if self.decoration else ""
-        return os.path.join(self.output_dir, f"{section}-listing{decoration}.html")
+        number = f"-{page + 1}" if page else ""
+        return os.path.join(
+            self.output_dir, f"{section}-listing{number}{decoration}.html"
+        )
+
+    def get_archive_filepath(self, section: str, year: int):
+        decoration = f"-{self.decoration}" if self.decoration else ""
+        return os.path.join(
+            self.output_dir, f"{section}-archive-{year}{decoration}.html"
+        )
+
+    def listing_pages(self, section: str) -> int:
+        """
+        number of pages the listing of `section` is split into
+        """
+        count = len(self.content.get(section, ()))
+        if not LISTING_PAGE_SIZE or count <= LISTING_PAGE_SIZE:
+            return 1
+        return -(-count // LISTING_PAGE_SIZE)
+
+    def listing_slice(self, section: str, page: int) -> slice:
+        """
+        slice of the content of `section` listed on its `page`th listing page
+        """
+        if self.listing_pages(section) == 1:
+            return slice(None)
+        return slice(page * LISTING_PAGE_SIZE, (page + 1) * LISTING_PAGE_SIZE)
+
+    def archive_years(self, section: str) -> List[int]:
+        """
+        years with an archive page for `section`, newest first
+        """
+        if not ARCHIVE_YEARS or self.listing_pages(section) == 1:
+            return []
+        years = {get_year(item.date) for item in self.content[section]}
+        return sorted(years, reverse=True)
+
+    def archive_items(self, section: str, year: int) -> List[int]:
+        """
+        indices of the content of `section` from `year`
+        """
+        return [
+            idx
+            for idx, item in enumerate(self.content[section])
+            if get_year(item.date) == year
+        ]
 
     def content_filepath_from_metadata(self, metadata: CMetadata) -> str:
         """
@@ -318,25 +541,40 @@ class FileManager:
         return "#"
 
 
-def generate_content(metadata: CMetadata, file_manager: FileManager) -> str:
+def content_to_html(content_path: str, lines: List = None) -> str:
     """
-    generate content for file specified in `metadata`
-    and write output to output file. Returns output-filepath
+    convert text content at `content_path` to html block;
+    `lines` of the content, if already read.
+    with KEEP_CONTENT_HTML, reused while the file is unchanged
     """
-    # convert text content to html block
-    content_path = metadata.get_contentpath()
+    import textparser
 
-    text = get_lines(content_path)
-    block = textparser.text_to_html(text)
+    if not KEEP_CONTENT_HTML:
+        if lines is None:
+            lines = get_lines(content_path)
+        return textparser.text_to_html(lines)
 
-    # configure jinja environment
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-    # find template
-    template = env.get_template(metadata.template_id)
+    key = stat_key(content_path)
+    cached = _html_cache.get(content_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    block = textparser.text_to_html(get_lines(content_path))
+    _html_cache[content_path] = (key, block)
+    return block
+
+
+def content_variables(metadata: CMetadata, lines: List = None) -> dict:
+    """
+    variables the template of content `metadata` is rendered with;
+    `lines` of its content, if already read
+    """
+    # convert text content to html block
+    content_path = metadata.get_contentpath()
+    block = content_to_html(content_path, lines)
 
-    # render template
     image_location = get_relpath(os.path.join(IMG_DIR, metadata.image_id))
-    rendered = template.render(
+    return dict(
         title=metadata.title,
         date=metadata.date,
         body=block,
@@ -345,20 +583,56 @@ def generate_content(metadata: CMetadata, file_manager: FileManager) -> str:
         is_content_page=True,
     )
 
+
+def generate_content(metadata: CMetadata, file_manager: FileManager) -> str:
+    """
+    generate content for file specified in `metadata`
+    and write output to output file, if intermediate files are kept.
+    Returns output-filepath
+    """
     output_filepath = file_manager.content_filepath_from_metadata(metadata)
+    if not INTERMEDIATE_FILES:
+        # rendered as part of constructing its tree, and only written
+        # once transformed; see PageParser.content_tree
+        return output_filepath
+
+    # configure jinja environment
+    env = get_environment()
+    # find template
+    template = env.get_template(metadata.template_id)
+
+    # render template
+    rendered = template.render(**content_variables(metadata))
+
     print(f"writing {metadata.section} {metadata.content_id} to {output_filepath}")
-    with open(output_filepath, "w", encoding="utf-8") as fp:
-        fp.write(rendered)
+    with profiling.span("write"):
+        file_manager.writer.write(output_filepath, rendered)
     return output_filepath
 
 
-def generate_content_listing(
-    metadata: LMetadata, items: list, file_manager: FileManager
+def read_teaser(metadata: CMetadata) -> str:
+    """
+    first line of the content of `metadata`, as shown on its listing
+    """
+    return get_line(metadata.get_contentpath(), maxlen=PREVIEW_LINE_LIMIT)
+
+
+def render_content_listing(
+    metadata: LMetadata,
+    items: list,
+    teasers: List[str] = None,
+    page: int = 0,
+    pages: int = 1,
+    years: List[int] = (),
+    year: int = None,
 ) -> str:
     """
-    generate a specific listing page and return output filepath
+    render a specific listing page;
+    `teasers` are the first lines of the items' content, if already read.
+    `items` are on the `page`th of `pages` listing pages, or, with a `year`,
+    on its archive page; `years` are linked to their archive pages
     """
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+    env = get_environment()
     # find template
     template = env.get_template(metadata.template_id)
 
@@ -366,35 +640,30 @@ def generate_content_listing(
     ItemView = namedtuple("ItemView", "title teaser")
 
     # transform items into listings
-    listings = []
-    for item in items:
-        content_path = item.get_contentpath()
-        teaser = get_line(content_path, maxlen=PREVIEW_LINE_LIMIT)
-        listings.append(ItemView(item.title, teaser))
+    if teasers is None:
+        teasers = [read_teaser(item) for item in items]
+    listings = [ItemView(item.title, teaser) for item, teaser in zip(items, teasers)]
 
     # if subtext is unset, make it empty
     # TODO: maybe the subtext element in the listing should be ommitted?
     if not metadata.subtext:
         metadata.subtext = ""
 
-    rendered = template.render(
+    return template.render(
         section_title=metadata.section_title,
-        subtext=metadata.subtext,
+        subtext=metadata.subtext if year is None else year,
         listings=listings,
+        page=page,
+        pages=pages,
+        years=years,
     )
-    output_filepath = file_manager.get_listing_filepath(metadata.section)
-    with open(output_filepath, "w", encoding="utf-8") as fp:
-        fp.write(rendered)
-    return output_filepath
 
 
-def generate_image_listing(
-    metadata: LMetadata, items: list, file_manager: FileManager
-) -> str:
+def render_image_listing(metadata: LMetadata, items: list) -> str:
     """
-    similar to generate_listings, but handles images
+    similar to render_content_listing, but handles images
     """
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+    env = get_environment()
     template = env.get_template(metadata.template_id)
 
     ItemView = namedtuple("ItemView", "title subtext rel_location date")
@@ -408,12 +677,32 @@ def generate_image_listing(
     print(f"generate_image_listing {metadata.section} listing={listing}")
 
     section_subtext = metadata.subtext or ""
-    rendered = template.render(
+    return template.render(
         section_title=metadata.section_title, subtext=section_subtext, listing=listing
     )
+
+
+def generate_content_listing(
+    metadata: LMetadata, items: list, file_manager: FileManager
+) -> str:
+    """
+    generate a specific listing page and return output filepath
+    """
+    rendered = render_content_listing(metadata, items)
+    output_filepath = file_manager.get_listing_filepath(metadata.section)
+    file_manager.writer.write(output_filepath, rendered)
+    return output_filepath
+
+
+def generate_image_listing(
+    metadata: LMetadata, items: list, file_manager: FileManager
+) -> str:
+    """
+    similar to generate_listings, but handles images
+    """
+    rendered = render_image_listing(metadata, items)
     output_filepath = file_manager.get_listing_filepath(metadata.section)
-    with open(output_filepath, "w", encoding="utf-8") as fp:
-        fp.write(rendered)
+    file_manager.writer.write(output_filepath, rendered)
     return output_filepath
 
 
@@ -425,12 +714,32 @@ def generate_all_content(content_file: str, file_manager: FileManager) -> dict:
     content = CMetadata.from_file(content_file)
     for section, items in content.items():
         for metadata in items:
-            generated = generate_content(metadata, file_manager)
+            with profiling.span("generate_content", page=metadata.content_id):
+                generated = generate_content(metadata, file_manager)
             contentfiles[section].append(generated)
 
     return contentfiles
 
 
+def generate_listing(
+    section: str,
+    lmetadata: LMetadata,
+    content: dict,
+    img_content: dict,
+    file_manager: FileManager,
+) -> str:
+    """
+    generate the listing of `section` and return output filepath
+    """
+    if lmetadata.image_content:
+        img_listing = img_content.get(section, [])
+        with profiling.span("generate_image_listing", section=section):
+            return generate_image_listing(lmetadata, img_listing, file_manager)
+    content_listing = content.get(section, [])
+    with profiling.span("generate_content_listing", section=section):
+        return generate_content_listing(lmetadata, content_listing, file_manager)
+
+
 def generate_listings(
     listings_file: str,
     content_file: str,
@@ -447,61 +756,519 @@ def generate_listings(
 
     results = {}  # section -> filepath
     for section, lmetadata in listings.items():
+        results[section] = generate_listing(
+            section, lmetadata, content, img_content, file_manager
+        )
 
-        if lmetadata.image_content:
-            img_listing = img_content.get(section, [])
-            results[section] = generate_image_listing(
-                lmetadata, img_listing, file_manager
+    return results
+
+
+class PageParser:
+    """
+    makes trees of generated pages; trees of unchanged pages are loaded from
+    the tree cache, and content pages can be instantiated from template trees
+    """
+
+    def __init__(self):
+        import treeparser
+
+        self.tparser = treeparser.TreeParser()
+        self.tree_cache = None
+        if TREE_CACHE:
+            import treecache
+
+            self.tree_cache = treecache.TreeCache(TREE_CACHE_DIR, TREE_CACHE_BYTES)
+        # made on first use, e.g. validate only parses
+        self.template_trees = None
+
+    def parse_text(self, text: str) -> treeparser.Tree:
+        if self.tree_cache:
+            return self.tree_cache.parse(text, self.tparser)
+        self.tparser.feed(text)
+        return self.tparser.finalize()
+
+    def parse_file(self, filepath: str) -> treeparser.Tree:
+        """read file to tree"""
+        with profiling.span("parse", page=os.path.basename(filepath)):
+            return self.parse_text(read_all(filepath))
+
+    def content_tree(
+        self, metadata: CMetadata, filepath: str, lines: List = None
+    ) -> treeparser.Tree:
+        """
+        make tree of the content page of `metadata`, generated at `filepath`;
+        `lines` of its content, if already read
+        """
+        if INTERMEDIATE_FILES:
+            return self.parse_file(filepath)
+        if not TEMPLATE_TREES:
+            template = get_environment().get_template(metadata.template_id)
+            rendered = template.render(**content_variables(metadata, lines))
+            with profiling.span("parse", page=os.path.basename(filepath)):
+                return self.parse_text(rendered)
+        if self.template_trees is None:
+            import templatetrees
+
+            self.template_trees = templatetrees.TemplateTrees(
+                get_environment(), self.parse_text
             )
-        else:
-            content_listing = content.get(section, [])
-            results[section] = generate_content_listing(
-                lmetadata, content_listing, file_manager
+        with profiling.span("instantiate", page=os.path.basename(filepath)):
+            return self.template_trees.instantiate(
+                metadata.template_id, content_variables(metadata, lines)
             )
 
-    return results
+    def finish(self):
+        """
+        called after all trees are made
+        """
+        if self.tparser.fallbacks:
+            print(
+                f"parser: {self.tparser.fallbacks} page(s) not handled by"
+                " htmlscanner were parsed with HTMLParser"
+            )
+        if self.tree_cache:
+            print(
+                f"trees: {self.tree_cache.hits} cached, {self.tree_cache.misses} parsed"
+            )
+            self.tree_cache.evict()
+        if self.template_trees:
+            print(
+                f"template trees: {len(self.template_trees.layouts)} layouts,"
+                f" {self.template_trees.instantiated} pages instantiated,"
+                f" {self.template_trees.parsed} parsed whole"
+            )
+
+
+def listing_tree(
+    lmetadata: LMetadata,
+    items: list,
+    file_manager: FileManager,
+    page_parser: PageParser,
+    teasers: List[str] = None,
+    page: int = 0,
+    year: int = None,
+) -> tuple:
+    """
+    render the listing of `lmetadata`, of content or image `items`, and
+    return (filepath, tree); the rendered page is only written if
+    intermediate files are kept, since the transformed page replaces it.
+    `teasers` of content items, if already read.
+    content listings are the `page`th listing page, or the archive of `year`
+    """
+    section = lmetadata.section
+    if year is not None:
+        filepath = file_manager.get_archive_filepath(section, year)
+    else:
+        filepath = file_manager.get_listing_filepath(section, page)
+    if lmetadata.image_content:
+        with profiling.span("generate_image_listing", section=section):
+            rendered = render_image_listing(lmetadata, items)
+    else:
+        pages = 1 if year is not None else file_manager.listing_pages(section)
+        with profiling.span("generate_content_listing", section=section):
+            rendered = render_content_listing(
+                lmetadata,
+                items,
+                teasers,
+                page,
+                pages,
+                file_manager.archive_years(section),
+                year,
+            )
+    if INTERMEDIATE_FILES:
+        file_manager.writer.write(filepath, rendered)
+    with profiling.span("parse", page=os.path.basename(filepath)):
+        return filepath, page_parser.parse_text(rendered)
 
 
 def construct_trees(
-    listing_fpaths: dict, content_fpaths: dict, index_fpath: str
+    listing_fpaths: dict,
+    content_fpaths: dict,
+    index_fpath: str,
+    content: dict = None,
+    page_parser: PageParser = None,
 ) -> tuple:
     """
     Creates tree for each listing and content file.
     The return structure is same as the argument structure
+    `content` (section -> [CMetadata]) is needed to instantiate content pages
+    from template trees, else content files are parsed
+    `page_parser` is reused across builds when given
     """
     # section name -> tree
     ltrees = {}
     # section name -> [tree]
     ctrees = defaultdict(list)
     # parser
-    tparser = treeparser.TreeParser()
+    if page_parser is None:
+        page_parser = PageParser()
 
     # create trees for listing files
-    for (section, filepath) in listing_fpaths.items():
-        # read file to tree
-        tparser.feed(read_all(filepath))
-        tree = tparser.finalize()
-        ltrees[section] = tree
+    for section, filepath in listing_fpaths.items():
+        ltrees[section] = page_parser.parse_file(filepath)
 
     # create trees for content files
     for section, filepaths in content_fpaths.items():
         for idx, filepath in enumerate(filepaths):
-            tparser.feed(read_all(filepath))
-            tree = tparser.finalize()
+            if content is None:
+                tree = page_parser.parse_file(filepath)
+            else:
+                tree = page_parser.content_tree(content[section][idx], filepath)
             ctrees[section].append(tree)
 
     # create index.html tree
-    tparser.feed(read_all(index_fpath))
-    itree = tparser.finalize()
+    itree = page_parser.parse_file(index_fpath)
 
+    page_parser.finish()
     return ltrees, ctrees, itree
 
 
+# a page being transformed; what transform rules are called with
+# kind is "listing", "archive" or "content"; idx is the index of a content
+# page, the page number of a listing, or the year of an archive.
+# content_fpaths are the pages listed on listings and archives
+Page = namedtuple(
+    "Page", "kind section idx template_id tree file_manager content_fpaths"
+)
+
+
+def set_nav_active(node: treeparser.QMNode, page: Page, nth: int):
+    node.add_class("active")
+
+
+def set_listing_link(node: treeparser.QMNode, page: Page, nth: int):
+    """
+    enrich see more link on listing page by creating a link to the
+    referenced content page; this assumes content_fpaths are in
+    same order as on listing
+    """
+    node.set_attr("href", get_relpath(page.content_fpaths[nth]))
+
+
+def is_listed(page: Page) -> bool:
+    return page.kind in ("listing", "archive")
+
+
+def has_prev_page(page: Page) -> bool:
+    # page 0 lists the newest items
+    last = page.file_manager.listing_pages(page.section) - 1
+    return page.kind == "listing" and page.idx != last
+
+
+def set_prev_page(node: treeparser.QMNode, page: Page, nth: int):
+    prev_fpath = page.file_manager.get_listing_filepath(page.section, page.idx + 1)
+    node.set_attr("href", get_relpath(prev_fpath))
+
+
+def has_next_page(page: Page) -> bool:
+    return page.kind == "listing" and page.idx != 0
+
+
+def set_next_page(node: treeparser.QMNode, page: Page, nth: int):
+    next_fpath = page.file_manager.get_listing_filepath(page.section, page.idx - 1)
+    node.set_attr("href", get_relpath(next_fpath))
+
+
+def set_archive_link(node: treeparser.QMNode, page: Page, nth: int):
+    """
+    link the `nth` year on a listing to its archive page
+    """
+    year = page.file_manager.archive_years(page.section)[nth]
+    fpath = page.file_manager.get_archive_filepath(page.section, year)
+    node.set_attr("href", get_relpath(fpath))
+
+
+def has_prev(page: Page) -> bool:
+    # items are in reverse chronological order
+    # item at item 0 is the newest
+    last = len(page.file_manager.content[page.section]) - 1
+    return page.kind == "content" and page.idx != last
+
+
+def set_prev_link(node: treeparser.QMNode, page: Page, nth: int):
+    prev_fpath = page.file_manager.get_prev_content_path(page.section, page.idx)
+    node.set_attr("href", get_relpath(prev_fpath))
+
+
+def has_next(page: Page) -> bool:
+    return page.kind == "content" and page.idx != 0
+
+
+def set_next_link(node: treeparser.QMNode, page: Page, nth: int):
+    next_fpath = page.file_manager.get_next_content_path(page.section, page.idx)
+    node.set_attr("href", get_relpath(next_fpath))
+
+
+def is_content(page: Page) -> bool:
+    return page.kind == "content"
+
+
+def get_hints(page: Page, hints: dict) -> list:
+    """
+    return (rel, filepath) of the pages `page` hints, for `hints` of its
+    section, i.e. hint -> rel
+    """
+    result = []
+    if page.kind == "content":
+        if "prev" in hints and has_prev(page):
+            prev_fpath = page.file_manager.get_prev_content_path(page.section, page.idx)
+            result.append((hints["prev"], prev_fpath))
+        if "next" in hints and has_next(page):
+            next_fpath = page.file_manager.get_next_content_path(page.section, page.idx)
+            result.append((hints["next"], next_fpath))
+    elif "listed" in hints and is_listed(page):
+        for fpath in page.content_fpaths[:PREFETCH_LISTED]:
+            result.append((hints["listed"], fpath))
+    return result
+
+
+class PageTransforms:
+    """
+    transforms applied to every generated page, declared as rules that are
+    applied in a single traversal per page (see transformrules.py).
+    holds per-build state, i.e. critical css per template and the asset manifest;
+    this can be kept across builds, e.g. by the build server
+    """
+
+    def __init__(self, output_dir: str):
+        import assets
+        import criticalcss
+        import transformrules
+        import treeparser
+
+        self.printer = treeparser.TreePrinter()
+        # critical css is computed once per template
+        self.critical_css = None
+        if CRITICAL_CSS:
+            self.critical_css = criticalcss.CriticalCSS(
+                output_dir, ABOVE_THE_FOLD_ELEMENTS
+            )
+        # asset manifest is reused across builds
+        self.manifest = None
+        if FINGERPRINT_ASSETS or DEDUPLICATE_ASSETS or INLINE_ASSET_LIMIT:
+            self.manifest = assets.AssetManifest.load(
+                ASSET_MANIFEST, output_dir, ASSET_DIRS, FINGERPRINT_ASSETS
+            )
+        if DEDUPLICATE_ASSETS:
+            self.manifest.store = assets.AssetStore(self.manifest, ASSET_STORE_DIRS)
+            self.manifest.store.scan()
+        # section -> hint -> rel; see set_listings
+        self.prefetch = {}
+        # related posts are computed from all content, before pages are
+        # built; see SiteBuild.build_related
+        self.related = None
+        if RELATED_POSTS:
+            import related
+
+            self.related = related.RelatedPosts.load(RELATED_CACHE, RELATED_COUNT)
+
+        # rules run in this order
+        self.rules = transformrules.RuleSet()
+        self.rules.add("nav-active", set_nav_active, id="nav-item-{section}")
+        self.rules.add(
+            "listing-links",
+            set_listing_link,
+            selector="#listing-container a",
+            when=is_listed,
+        )
+        self.rules.add("prev-link", set_prev_link, id="prev_link", when=has_prev)
+        self.rules.add("next-link", set_next_link, id="next_link", when=has_next)
+        self.rules.add("prev-page", set_prev_page, id="prev_page", when=has_prev_page)
+        self.rules.add("next-page", set_next_page, id="next_page", when=has_next_page)
+        self.rules.add(
+            "archive-links",
+            set_archive_link,
+            selector="#archive-years a",
+            when=is_listed,
+        )
+        if self.related:
+            self.rules.add(
+                "related-posts",
+                self.insert_related,
+                id="related_posts",
+                when=is_content,
+            )
+        self.rules.add("prefetch-hints", self.insert_hints, tag="head")
+        if self.critical_css:
+            self.rules.add("critical-css", self.inline_critical_css, tag="head")
+        if self.manifest and INLINE_ASSET_LIMIT:
+            self.rules.add(
+                "inline-assets",
+                lambda node, page, nth: self.manifest.inline_node(
+                    node, INLINE_ASSET_LIMIT
+                ),
+                selector=assets.INLINE_SELECTOR,
+            )
+        if self.manifest:
+            self.rules.add(
+                "asset-urls",
+                lambda node, page, nth: self.manifest.rewrite_node(node),
+                selector=assets.ASSET_SELECTOR,
+            )
+
+    def inline_critical_css(self, node: treeparser.QMNode, page: Page, nth: int):
+        return self.critical_css.inline(page.template_id, page.tree)
+
+    def set_listings(self, listings: dict):
+        """
+        use the config of `listings`, i.e. section -> LMetadata
+        """
+        self.prefetch = {
+            section: lmetadata.prefetch for section, lmetadata in listings.items()
+        }
+
+    def insert_hints(self, node: treeparser.QMNode, page: Page, nth: int):
+        """
+        add links to the pages `page` hints to the end of its head
+        """
+        import treeparser
+
+        inserted = []
+        for rel, fpath in get_hints(page, self.prefetch.get(page.section, {})):
+            link = treeparser.ClosedNode(
+                "link", attrs=[("rel", rel), ("href", get_relpath(fpath))]
+            )
+            node.insert_child(link)
+            inserted.append(link)
+        return inserted
+
+    def insert_related(self, node: treeparser.QMNode, page: Page, nth: int):
+        """
+        list links to the posts related to content page `page`
+        """
+        import html
+
+        import treeparser
+
+        related = self.related.related.get((page.section, page.idx))
+        if not related:
+            return []
+        items = treeparser.OpenClosedNode("ul", [("class", "list-unstyled")])
+        for section, idx in related:
+            metadata = page.file_manager.content[section][idx]
+            fpath = page.file_manager.get_content_filepath(section, idx)
+            link = treeparser.OpenClosedNode("a", [("href", get_relpath(fpath))])
+            link.children.append(treeparser.DataNode(html.escape(metadata.title)))
+            item = treeparser.OpenClosedNode("li", [])
+            item.children.append(link)
+            items.children.append(item)
+        heading = treeparser.OpenClosedNode("h5", [])
+        heading.children.append(treeparser.DataNode("Related Posts"))
+        column = treeparser.OpenClosedNode("div", [("class", "col")])
+        column.children.extend([heading, items])
+        node.insert_child(column)
+        return [column]
+
+    def apply(self, page: Page):
+        """
+        apply all rules to `page`
+        """
+        self.rules.apply(page)
+
+    def write(
+        self,
+        tree: treeparser.Tree,
+        outfilepath: str,
+        writer: outputwriter.OutputWriter,
+    ):
+        with profiling.span("write"):
+            result = self.printer.mk_doc(tree.get_root(as_qmnode=False))
+            writer.write(outfilepath, result)
+
+    def finish(self):
+        """
+        called after all pages are transformed
+        """
+        if self.manifest:
+            print(f"assets: {self.manifest.hashed} hashed")
+            self.manifest.save()
+        # unless computed, e.g. by transform_html, which doesn't
+        if self.related and self.related.digests:
+            print(self.related.report())
+            self.related.save()
+        print(self.rules.report())
+
+
+def transform_listing(
+    section: str,
+    tree: treeparser.Tree,
+    content_fpaths: list,
+    file_manager: FileManager,
+    template_id: str,
+    transforms: PageTransforms,
+    page_number: int = 0,
+    year: int = None,
+):
+    """
+    transform and write the `page_number`th listing page of `section`,
+    or its archive page of `year`; `content_fpaths` are the pages listed
+    """
+    with profiling.span("transform_listing", section=section):
+        if year is not None:
+            page = Page(
+                "archive",
+                section,
+                year,
+                template_id,
+                tree,
+                file_manager,
+                content_fpaths,
+            )
+            outfilepath = file_manager.get_archive_filepath(section, year)
+        else:
+            page = Page(
+                "listing",
+                section,
+                page_number,
+                template_id,
+                tree,
+                file_manager,
+                content_fpaths,
+            )
+            outfilepath = file_manager.get_listing_filepath(section, page_number)
+        transforms.apply(page)
+
+        # write output
+        # print(f"transforming {section} at {filepath} to {outfilepath}")
+        transforms.write(tree, outfilepath, file_manager.writer)
+
+
+def transform_content(
+    section: str,
+    idx: int,
+    tree: treeparser.Tree,
+    file_manager: FileManager,
+    transforms: PageTransforms,
+):
+    """
+    transform and write the `idx`th content page of `section`
+    """
+    # get output filepath
+    outfilepath = file_manager.get_content_filepath(section, idx)
+    with profiling.span("transform_content", page=os.path.basename(outfilepath)):
+        metadata = file_manager.content[section][idx]
+        page = Page(
+            "content",
+            section,
+            idx,
+            metadata.template_id,
+            tree,
+            file_manager,
+            None,
+        )
+        transforms.apply(page)
+
+        print(f"transforming {section} to {outfilepath}")
+        transforms.write(tree, outfilepath, file_manager.writer)
+
+
 def transform_html(
     content_fpaths: dict,
     listing_trees: dict,
     content_trees: dict,
     file_manager: FileManager,
+    listings: dict,
+    transforms: PageTransforms = None,
 ):
     """
     express transformations on a DOM tree. Some transformations, e.g.
@@ -510,111 +1277,744 @@ def transform_html(
     Arguments:
         listing_fpaths(dict): dict[section]-> listing_path
         content_fpaths(dict): dict[section]-> [content_paths]
+        listings(dict): dict[section]-> LMetadata
+        transforms: state reused across builds; created if not given
     """
-    printer = treeparser.TreePrinter()
+    if transforms is None:
+        transforms = PageTransforms(file_manager.output_dir)
+    transforms.set_listings(listings)
 
     # handle listing files
     for section, tree in listing_trees.items():
-        # set active on nav item
-        node = tree.find_node_with_id(f"nav-item-{section}")
-        node.add_class("active")
-
-        # enrich see more link on listing page
-        # by creating a link to the referenced content page
-        # this assumes content_paths are in same order as on listing
-        node = tree.find_node_with_id("listing-container")
-        for i, desc_node in enumerate(node.descendents(tag="a")):
-            content_path = (content_fpaths.get(section, []))[i]
-            link = get_relpath(content_path)
-            desc_node.set_attr("href", link)
-
-        # write output
-        outfilepath = file_manager.get_listing_filepath(section)
-        # print(f"transforming {section} at {filepath} to {outfilepath}")
-        with open(outfilepath, "w", encoding="utf-8") as fp:
-            result = printer.mk_doc(tree.get_root(as_qmnode=False))
-            fp.write(result)
+        transform_listing(
+            section,
+            tree,
+            content_fpaths.get(section, []),
+            file_manager,
+            listings[section].template_id,
+            transforms,
+        )
 
     # handle content files
     for section, trees in content_trees.items():
         for idx, tree in enumerate(trees):
-            # lookup tree
-            tree = content_trees[section][idx]
-
-            # set navbar active
-            node = tree.find_node_with_id(f"nav-item-{section}")
-            node.add_class("active")
-
-            # set prev, next links
-            # set prev
-            # items are in reverse chronological order
-            # item at item 0 is the newest
-            if idx != len(trees) - 1:
-                prev_fpath = get_relpath(
-                    file_manager.get_prev_content_path(section, idx)
-                )
-                tree.find_node_with_id("prev_link").set_attr("href", prev_fpath)
-            # set next
-            if idx != 0:
-                next_fpath = get_relpath(
-                    file_manager.get_next_content_path(section, idx)
+            transform_content(section, idx, tree, file_manager, transforms)
+
+    transforms.finish()
+    file_manager.writer.finish()
+
+
+def read_ahead(read: Callable, items: Iterable, executor: Executor = None) -> Iterator:
+    """
+    yield read(item) for each of `items`, in order; with an `executor`,
+    up to READ_AHEAD reads run ahead of the item whose result is used
+    """
+    if executor is None:
+        yield from map(read, items)
+        return
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(read, item))
+        if len(pending) > READ_AHEAD:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ReadAhead:
+    """
+    read(key) for each of `keys`, read ahead in order; see read_ahead.
+    a key that isn't the next one is read when it's asked for
+    """
+
+    def __init__(self, read: Callable, keys: Iterable, executor: Executor = None):
+        self.read = read
+        self.keys = deque(keys)
+        self.results = read_ahead(read, list(self.keys), executor)
+
+    def get(self, key):
+        if self.keys and self.keys[0] == key:
+            self.keys.popleft()
+            return next(self.results)
+        return self.read(key)
+
+
+def template_files(template_id: str, found: set = None) -> set:
+    """
+    return paths of the files `template_id` is rendered from, i.e. its own
+    and those of the templates it extends, includes or imports
+    """
+    from jinja2 import meta
+
+    env = get_environment()
+    found = set() if found is None else found
+    source, filepath, _ = env.loader.get_source(env, template_id)
+    filepath = os.path.normpath(filepath)
+    if filepath in found:
+        return found
+    found.add(filepath)
+    for name in meta.find_referenced_templates(env.parse(source)):
+        if name is None:
+            # a computed name could be any template
+            for other in env.list_templates():
+                template_files(other, found)
+        else:
+            template_files(name, found)
+    return found
+
+
+class SiteBuild:
+    """
+    the pages of the site, as a graph of build targets (see buildgraph.py):
+        - listing:<section>[:<n>], archive:<section>:<year> and
+          content:<section>:<content_id>, one per page; its inputs are its
+          template files and the content it shows, e.g. a listing page only
+          reads the first lines of the items on it
+        - critical-css:<template_id>, computed from the first page built
+          with the template; the other pages with the template depend on it
+    The graph tells which targets a change invalidates, e.g. the build server
+    rebuilds only those.
+    A page is generated, parsed, transformed, written and checked by its
+    target, and its tree is dropped before the next page is built, so memory
+    use doesn't grow with the number of pages. Pages share the parser,
+    transforms and writer, so they're built one at a time, in the order
+    targets were added, i.e. listings, then content.
+    `source_manager` names generated (pre-transform) files, if they
+    differ from the output files, i.e. with intermediate files.
+    `search` indexes content pages as they're built
+    """
+
+    def __init__(
+        self,
+        listings: dict,
+        content: dict,
+        img_content: dict,
+        file_manager: FileManager,
+        transforms: PageTransforms,
+        page_parser: PageParser,
+        checks: validations.PageChecks,
+        source_manager: FileManager = None,
+        search: searchindex.SearchIndex = None,
+    ):
+        import buildgraph
+        import validations
+
+        self.listings = listings
+        self.content = content
+        self.img_content = img_content
+        self.file_manager = file_manager
+        self.source_manager = source_manager or file_manager
+        self.transforms = transforms
+        self.page_parser = page_parser
+        self.checks = checks
+        self.search = search
+        transforms.set_listings(listings)
+        # set while running; see run
+        self.executor = None
+        self.sources = None
+
+        # content pages are linked from listings, before they're generated
+        self.cfiles = {
+            section: [
+                self.source_manager.content_filepath_from_metadata(item)
+                for item in items
+            ]
+            for section, items in content.items()
+        }
+        validations.check_unique_filenames(self.cfiles)
+        self.lfiles = {
+            section: self.source_manager.get_listing_filepath(section)
+            for section in listings
+        }
+
+        self.graph = buildgraph.BuildGraph()
+        # template id -> its template files; see template_files
+        self.template_paths = {}
+        # page target name -> generated filepath
+        self.filepaths = {}
+        # content target name -> content path
+        self.content_paths = {}
+        for section, lmetadata in listings.items():
+            if lmetadata.image_content:
+                self.add_listing(section, f"listing:{section}", [])
+                continue
+            idxs = range(len(content.get(section, [])))
+            for page in range(self.source_manager.listing_pages(section)):
+                name = f"listing:{section}:{page + 1}" if page else f"listing:{section}"
+                slice_ = self.source_manager.listing_slice(section, page)
+                self.add_listing(section, name, idxs[slice_], page)
+            for year in self.source_manager.archive_years(section):
+                idxs = self.source_manager.archive_items(section, year)
+                self.add_listing(section, f"archive:{section}:{year}", idxs, year=year)
+        if self.transforms.related:
+            # similarities depend on all content
+            self.add_target(
+                "related",
+                self.build_related,
+                sorted(
+                    metadata.get_contentpath()
+                    for items in content.values()
+                    for metadata in items
+                ),
+            )
+        for section, items in content.items():
+            for idx, metadata in enumerate(items):
+                content_path = metadata.get_contentpath()
+                templates = self.template_files(metadata.template_id)
+                inputs = [content_path] + sorted(templates)
+                name = f"content:{section}:{metadata.content_id}"
+                deps = []
+                if self.transforms.related:
+                    # a page is only rebuilt if its own related posts changed
+                    deps.append(f"related:{section}:{metadata.content_id}")
+                    self.add_target(
+                        deps[0],
+                        functools.partial(self.get_related, section, idx),
+                        (),
+                        ["related"],
+                    )
+                self.add_page(
+                    name,
+                    functools.partial(self.build_content, section, idx),
+                    inputs,
+                    metadata.template_id,
+                    deps,
                 )
-                tree.find_node_with_id("next_link").set_attr("href", next_fpath)
+                self.filepaths[name] = self.cfiles[section][idx]
+                self.content_paths[name] = content_path
+        if FEEDS:
+            # only built by full builds, which read the metadata
+            self.add_target("feeds", self.build_feeds)
+            self.add_target("sitemap", self.build_sitemap)
+
+    def add_target(
+        self, name: str, action: Callable, inputs: Iterable = (), deps: Iterable = ()
+    ):
+        """
+        add target `name` to the graph; its action is timed in a span of its
+        kind, i.e. the prefix of the name, e.g. "content"
+        """
+        kind = name.split(":", 1)[0]
 
-            # get output filepath
-            outfilepath = file_manager.get_content_filepath(section, idx)
-            print(f"transforming {section} to {outfilepath}")
-            with open(outfilepath, "w", encoding="utf-8") as fp:
-                result = printer.mk_doc(tree.get_root(as_qmnode=False))
-                fp.write(result)
+        def run():
+            with profiling.span(kind, target=name):
+                return action()
 
+        self.graph.add(name, run, inputs, deps)
+
+    def template_files(self, template_id: str) -> set:
+        """
+        return a copy of the template files of `template_id`, which are
+        only found once per build
+        """
+        if template_id not in self.template_paths:
+            self.template_paths[template_id] = template_files(template_id)
+        return set(self.template_paths[template_id])
 
-def driver():
+    def add_listing(
+        self, section: str, name: str, idxs: list, page: int = 0, year: int = None
+    ):
+        """
+        add the target of a listing page of `section`, that lists content
+        items `idxs`; the `page`th listing page, or the archive of `year`
+        """
+        lmetadata = self.listings[section]
+        items = self.content.get(section, [])
+        # a listing shows the first line of each item
+        inputs = self.template_files(lmetadata.template_id)
+        inputs.update(items[idx].get_contentpath() for idx in idxs)
+        self.add_page(
+            name,
+            functools.partial(self.build_listing, section, idxs, page, year),
+            sorted(inputs),
+            lmetadata.template_id,
+        )
+        if year is not None:
+            self.filepaths[name] = self.source_manager.get_archive_filepath(
+                section, year
+            )
+        else:
+            self.filepaths[name] = self.source_manager.get_listing_filepath(
+                section, page
+            )
+
+    def add_page(
+        self,
+        name: str,
+        build: Callable,
+        inputs: list,
+        template_id: str,
+        deps: list = (),
+    ):
+        """
+        add the target of a page, rendered from `template_id`, that also
+        depends on targets `deps`
+        """
+        if self.transforms.critical_css is None:
+            self.add_target(name, build, inputs, deps)
+            return
+        css_name = f"critical-css:{template_id}"
+        if css_name in self.graph.targets:
+            self.add_target(name, build, inputs, [*deps, css_name])
+            return
+        # the first page with the template computes its critical css; the
+        # other pages are rebuilt when the css changes
+        self.add_target(
+            name,
+            functools.partial(self.build_sample, build, template_id),
+            inputs,
+            deps,
+        )
+        self.add_target(
+            css_name,
+            lambda: self.transforms.critical_css.templates.get(template_id),
+            (),
+            [name],
+        )
+
+    def build_sample(self, build: Callable, template_id: str) -> str:
+        """
+        build the page the critical css of `template_id` is computed from;
+        returns the css
+        """
+        self.transforms.critical_css.templates.pop(template_id, None)
+        build()
+        return self.transforms.critical_css.templates.get(template_id)
+
+    def build_related(self) -> dict:
+        """
+        compute the related posts of all content
+        """
+        documents = {
+            (section, idx): [
+                f"{metadata.title}\n",
+                *get_lines(metadata.get_contentpath()),
+            ]
+            for section, items in self.content.items()
+            for idx, metadata in enumerate(items)
+        }
+        return self.transforms.related.update(documents)
+
+    def get_related(self, section: str, idx: int) -> tuple:
+        return tuple(self.transforms.related.related.get((section, idx), ()))
+
+    def build_listing(self, section: str, idxs: list, page: int, year: int):
+        lmetadata = self.listings[section]
+        teasers = None
+        content_fpaths = []
+        if lmetadata.image_content:
+            items = self.img_content.get(section, [])
+        else:
+            items = [self.content[section][idx] for idx in idxs]
+            content_fpaths = [self.cfiles[section][idx] for idx in idxs]
+            teasers = list(read_ahead(read_teaser, items, self.executor))
+        _, tree = listing_tree(
+            lmetadata, items, self.source_manager, self.page_parser, teasers, page, year
+        )
+        transform_listing(
+            section,
+            tree,
+            content_fpaths,
+            self.file_manager,
+            lmetadata.template_id,
+            self.transforms,
+            page,
+            year,
+        )
+        if year is not None:
+            outfilepath = self.file_manager.get_archive_filepath(section, year)
+        else:
+            outfilepath = self.file_manager.get_listing_filepath(section, page)
+        self.file_manager.writer.submit(self.checks.check_page, outfilepath, tree)
+
+    def build_content(self, section: str, idx: int):
+        metadata = self.content[section][idx]
+        lines = self.sources.get(metadata.get_contentpath()) if self.sources else None
+        outfilepath = self.file_manager.get_content_filepath(section, idx)
+        if self.search:
+            import textparser
+
+            if lines is None:
+                lines = get_lines(metadata.get_contentpath())
+            with profiling.span("index", page=metadata.content_id):
+                # before the lines are converted, which modifies them
+                terms = textparser.tokenize([f"{metadata.title}\n"] + lines)
+                self.search.add(get_relpath(outfilepath), metadata.title, terms)
+        with profiling.span("generate_content", page=metadata.content_id):
+            filepath = generate_content(metadata, self.source_manager)
+        tree = self.page_parser.content_tree(metadata, filepath, lines)
+        transform_content(section, idx, tree, self.file_manager, self.transforms)
+        self.file_manager.writer.submit(self.checks.check_page, outfilepath, tree)
+
+    def get_url(self, filepath: str) -> str:
+        """
+        url a generated file is served at
+        """
+        return SITE_URL.rstrip("/") + "/" + get_relpath(filepath).replace(os.sep, "/")
+
+    def get_entries(self, section: str) -> list:
+        """
+        feed entries of the content of `section`, in listing order
+        """
+        import feeds
+
+        return [
+            feeds.Entry(
+                self.get_url(self.file_manager.content_filepath_from_metadata(item)),
+                item.title,
+                item.date,
+            )
+            for item in self.content.get(section, [])
+        ]
+
+    def build_feeds(self):
+        """
+        write the feed of the newest content, and a feed of each section
+        """
+        import feeds
+
+        def newest(entries: list) -> list:
+            # stable, so items of the same date keep their listing order
+            entries = sorted(entries, key=lambda e: feeds.to_date(e.date), reverse=True)
+            return entries[:FEED_ENTRIES] if FEED_ENTRIES else entries
+
+        output_dir = self.file_manager.output_dir
+        writer = self.file_manager.writer
+        entries = {section: self.get_entries(section) for section in self.content}
+        filepath = os.path.join(output_dir, "feed.xml")
+        feeds.write_feed(
+            filepath,
+            self.get_url(filepath),
+            SITE_URL,
+            SITE_AUTHOR,
+            SITE_AUTHOR,
+            newest([entry for items in entries.values() for entry in items]),
+            writer,
+        )
+        for section, lmetadata in self.listings.items():
+            if lmetadata.image_content:
+                continue
+            filepath = os.path.join(output_dir, f"{section}-feed.xml")
+            feeds.write_feed(
+                filepath,
+                self.get_url(filepath),
+                self.get_url(self.file_manager.get_listing_filepath(section)),
+                lmetadata.section_title,
+                SITE_AUTHOR,
+                newest(entries.get(section, [])),
+                writer,
+            )
+
+    def build_sitemap(self):
+        """
+        write sitemap.xml, of the index, listings, archives and content
+        """
+        import feeds
+
+        filepaths = [INDEX_FILE]
+        for section in self.listings:
+            filepaths.extend(
+                self.file_manager.get_listing_filepath(section, page)
+                for page in range(self.file_manager.listing_pages(section))
+            )
+            filepaths.extend(
+                self.file_manager.get_archive_filepath(section, year)
+                for year in self.file_manager.archive_years(section)
+            )
+        entries = [feeds.Entry(self.get_url(fpath), None, None) for fpath in filepaths]
+        for section in self.content:
+            entries.extend(self.get_entries(section))
+        feeds.write_sitemap(
+            os.path.join(self.file_manager.output_dir, "sitemap.xml"),
+            entries,
+            self.file_manager.writer,
+        )
+
+    def run(self, stale: Iterable[str] = None, executor: Executor = None) -> List[str]:
+        """
+        build the `stale` targets, all if None, and the targets their
+        changes invalidate; returns names of the targets built.
+        with an `executor`, sources of upcoming pages are read on its
+        threads while the current page is built; see read_ahead.
+        Pages are checked once the writer has written them
+        """
+        names = list(self.graph.targets) if stale is None else list(stale)
+        self.executor = executor
+        self.sources = ReadAhead(
+            get_lines,
+            [self.content_paths[name] for name in names if name in self.content_paths],
+            executor,
+        )
+        try:
+            with profiling.stage("pages"):
+                built = self.graph.run(names)
+        finally:
+            self.executor = None
+            self.sources = None
+        if self.search:
+            with profiling.stage("search"):
+                if stale is None:
+                    # pages not built are gone
+                    self.search.prune()
+                self.search.write(self.file_manager.writer)
+                if stale is None:
+                    self.search.remove_stale()
+        return built
+
+    def pages(self, names: Iterable[str]) -> List[str]:
+        """
+        return generated filepaths of the pages among targets `names`
+        """
+        return [self.filepaths[name] for name in names if name in self.filepaths]
+
+
+def get_config_files(config_dir: str = None) -> tuple:
     """
-    generate pages
-    handles config for:
-        - whether to write intermediate files by manipulating output filename
+    return paths of the listings, content and image content yaml files
+    `config_dir` contains the yaml files; defaults to this directory
     """
-    dir_path = os.path.dirname(os.path.realpath(__file__))
+    dir_path = config_dir or os.path.dirname(os.path.realpath(__file__))
     listings_file = os.path.join(dir_path, "./sections.yaml")
     content_file = os.path.join(dir_path, "./content.yaml")
     image_content_file = os.path.join(dir_path, "./image_content.yaml")
+    return listings_file, content_file, image_content_file
+
+
+def driver(
+    config_dir: str = None,
+    transforms: PageTransforms = None,
+    page_parser: PageParser = None,
+) -> SiteBuild:
+    """
+    generate pages
+    handles config for:
+        - whether to write intermediate files by manipulating output filename
+    `config_dir` contains the yaml files; defaults to this directory
+    `transforms` and `page_parser` are reused across builds when given
+    returns the SiteBuild, which can rebuild pages a change invalidates
+    """
+    import validations
+
+    listings_file, content_file, image_content_file = get_config_files(config_dir)
 
     # construct data maps
     content = CMetadata.from_file(content_file)
+    listings = LMetadata.from_file(listings_file)
+    img_content = ICMetadata.from_file(image_content_file)
 
     # construct file manager, which determines
     # the filenames used; this is intended to facilitate debugging
     # see design-decisions (settable filename)
-    file_manager = FileManager(content)
+    file_manager = FileManager(content, output_dir=OUTPUT_DIR)
+    source_manager = None
 
     if INTERMEDIATE_FILES:
-        file_manager.set_decoration("generated")
+        source_manager = FileManager(content, OUTPUT_DIR, file_manager.writer)
+        source_manager.set_decoration("generated")
+        file_manager.set_decoration("generated-mutated")
 
-    print(f"{os.linesep}Generating listings...")
-    # generate listings
-    lfiles = generate_listings(
-        listings_file, content_file, image_content_file, file_manager
-    )  # section -> filepath
+    if transforms is None:
+        transforms = PageTransforms(file_manager.output_dir)
+    if page_parser is None:
+        page_parser = PageParser()
+
+    # checks are applied as each page is written
+    with profiling.stage("validations"):
+        checks = validations.PageChecks(INDEX_FILE, page_parser.parse_file(INDEX_FILE))
+
+    executor = None
+    if OVERLAP_IO:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(READ_THREADS, thread_name_prefix="pagegen-read")
+
+    search = None
+    if SEARCH_INDEX:
+        import searchindex
+
+        search = searchindex.SearchIndex(
+            os.path.join(file_manager.output_dir, SEARCH_DIR), SEARCH_PREFIX_LEN
+        )
+
+    print(f"{os.linesep}Generating pages...")
+    site = SiteBuild(
+        listings,
+        content,
+        img_content,
+        file_manager,
+        transforms,
+        page_parser,
+        checks,
+        source_manager,
+        search,
+    )
+    try:
+        site.run(executor=executor)
+    finally:
+        if executor:
+            executor.shutdown()
 
-    print(f"{os.linesep}Generating content...")
-    # generate content
-    cfiles = generate_all_content(content_file, file_manager)  # section -> [filepaths]
+    page_parser.finish()
+    transforms.finish()
+    # pages are checked as they're written
+    file_manager.writer.finish()
+    checks.finish()
 
-    if INTERMEDIATE_FILES:
-        file_manager.set_decoration("generated-mutated")
+    return site
 
-    # construct trees
-    ltrees, ctrees, itree = construct_trees(lfiles, cfiles, INDEX_FILE)
 
-    print(f"{os.linesep}Applying transformations...")
-    # apply transform
-    transform_html(cfiles, ltrees, ctrees, file_manager)
+def validate(config_dir: str = None):
+    """
+    apply validations to previously generated pages, without generating them
+    """
+    import validations
+
+    listings_file, content_file, _ = get_config_files(config_dir)
+    content = CMetadata.from_file(content_file)
+    listings = LMetadata.from_file(listings_file)
+    file_manager = FileManager(content, output_dir=OUTPUT_DIR)
+
+    # the paths the driver generates
+    lfiles = [
+        file_manager.get_listing_filepath(section, page)
+        for section in listings
+        for page in range(file_manager.listing_pages(section))
+    ] + [
+        file_manager.get_archive_filepath(section, year)
+        for section in listings
+        for year in file_manager.archive_years(section)
+    ]
+    cfiles = {
+        section: [file_manager.content_filepath_from_metadata(item) for item in items]
+        for section, items in content.items()
+    }
 
-    # apply validations
     print(f"{os.linesep}Applying validations...")
-    validations.run_validations(lfiles, cfiles, INDEX_FILE, ltrees, ctrees, itree)
+    with profiling.stage("validations"):
+        validations.check_unique_filenames(cfiles)
+        page_parser = PageParser()
+        checks = validations.PageChecks(INDEX_FILE, page_parser.parse_file(INDEX_FILE))
+        for filepath in itertools.chain(lfiles, *cfiles.values()):
+            checks.check_page(filepath, page_parser.parse_file(filepath))
+        page_parser.finish()
+        checks.finish()
+
+
+def watch(interval: float):
+    """
+    rebuild whenever inputs change, every `interval` seconds; after the first
+    build only changed pages are rebuilt (see buildserver.Builder)
+    """
+    import time
+    import traceback
+
+    import buildserver
+
+    builder = buildserver.Builder()
+    print(f"watching for changes every {interval}s; ctrl-c to stop")
+    while True:
+        try:
+            summary = builder.build()
+        except Exception:
+            traceback.print_exc()
+        else:
+            if summary["pages"]:
+                print(
+                    f"{summary['mode']} build: {len(summary['pages'])} page(s)"
+                    f" in {1000 * summary['seconds']:.1f}ms"
+                )
+        time.sleep(interval)
+
+
+def main():
+    """
+    parse command line and run command; builds if no command given
+    """
+    parser = argparse.ArgumentParser(description="generate website pages")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each stage and page; write summary and collapsed stacks",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="with --profile, also run cProfile per stage",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=PROFILE_DIR,
+        help="where profile output is written",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write a chrome trace-event timeline of stages and pages to FILE",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("build", help="generate all pages (default)")
+    subparsers.add_parser(
+        "validate", help="validate previously generated pages, without generating"
+    )
+    watch_parser = subparsers.add_parser(
+        "watch", help="rebuild changed pages whenever inputs change"
+    )
+    watch_parser.add_argument(
+        "--interval", type=float, default=0.5, help="seconds between checks"
+    )
+    bench_parser = subparsers.add_parser(
+        "bench", help="time the pipeline on a fixed corpus; gate on regressions"
+    )
+    bench_parser.add_argument(
+        "--compare", metavar="BASELINE", help="fail if worse than BASELINE json"
+    )
+    bench_parser.add_argument("--save", metavar="FILE", help="save results as json")
+    bench_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="relative regression allowed per metric (default: 0.10)",
+    )
+    bench_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs, at least 3; the median of each metric is kept",
+    )
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        sys.path.insert(0, os.path.join(SELF_PATH, "benchmarks"))
+        import regression
+
+        if args.repeat < regression.MIN_REPEAT:
+            parser.error(f"--repeat must be at least {regression.MIN_REPEAT}")
+        sys.exit(regression.main(args))
+
+    if args.command == "watch":
+        try:
+            watch(args.interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.profile or args.trace:
+        # stack sampling is only needed for the profile output
+        profiler = profiling.enable(cprofile=args.cprofile, sample=args.profile)
+
+    if args.command == "validate":
+        validate()
+    else:
+        driver()
+
+    if args.profile:
+        print(f"{os.linesep}{profiler.summary()}")
+        profiler.write(args.profile_dir)
+        print(f"profile written to {args.profile_dir}")
+    if args.trace:
+        profiler.write_trace(args.trace)
+        print(f"trace written to {args.trace}")
 
 
 if __name__ == "__main__":
-    driver()
+    main()
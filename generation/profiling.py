@@ -0,0 +1,322 @@
+"""
+timing spans and per-stage profiling for the generation pipeline
+
+The pipeline is instrumented with `stage` (top level, e.g. "transform")
+and `span` (nested, e.g. each page within a stage). When profiling isn't
+enabled these are no-ops.
+
+When enabled, the profiler records every span, samples the call stack
+during each stage, and can write:
+    - a summary of time per stage and per span, and the slowest pages
+    - spans.folded; collapsed stacks of the span tree
+    - <stage>.folded; collapsed stacks of the sampled call stacks
+    - with cprofile: <stage>.pstats and <stage>.txt (hot function tables)
+
+The .folded files can be read by flamegraph tools, e.g. flamegraph.pl, speedscope.
+
+The spans can also be written as a chrome trace-event timeline, to
+see per-page time and stragglers.
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+# cProfile and pstats are only imported when used; the stages import this module
+if TYPE_CHECKING:
+    import cProfile
+    import pstats
+
+# number of rows in hot function tables, and slowest spans listed
+TOP_N = 30
+# seconds between stack samples
+SAMPLE_INTERVAL = 0.001
+
+
+class Span:
+    """
+    a timed span; `stack` is the names of the enclosing spans and this span
+    """
+
+    def __init__(self, name: str, stack: tuple, args: dict):
+        self.name = name
+        self.stack = stack
+        self.args = args
+        self.start = 0.0
+        self.duration = 0.0
+        # time spent in child spans
+        self.child_time = 0.0
+        # where the span ran; distinguishes threads in traces
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+
+class Profiler:
+    """
+    records spans and samples call stacks per stage; optionally runs cProfile per stage
+    """
+
+    def __init__(self, cprofile: bool = False, sample: bool = True):
+        self.cprofile = cprofile
+        self.sample = sample
+        # all finished spans, in order of completion
+        self.spans: List[Span] = []
+        # stack of open spans, per thread
+        self._local = threading.local()
+        # stage name -> cProfile.Profile
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        # stage name -> StackSampler
+        self.samplers: Dict[str, StackSampler] = {}
+
+    @property
+    def open(self) -> List[Span]:
+        if not hasattr(self._local, "open"):
+            self._local.open = []
+        return self._local.open
+
+    @contextlib.contextmanager
+    def span(self, name: str, args: dict):
+        stack = tuple(span.name for span in self.open) + (name,)
+        span = Span(name, stack, args)
+        self.open.append(span)
+        span.start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self.open.pop()
+            if self.open:
+                self.open[-1].child_time += span.duration
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, args: dict):
+        if self.cprofile:
+            import cProfile
+
+        with self.span(name, args):
+            sampler = StackSampler() if self.sample else None
+            profile = cProfile.Profile() if self.cprofile else None
+            if sampler:
+                self.samplers[name] = sampler
+                sampler.start()
+            if profile:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile:
+                    profile.disable()
+                    self.profiles[name] = profile
+                if sampler:
+                    sampler.stop()
+
+    def trace_events(self) -> List[dict]:
+        """
+        return spans as chrome trace events, i.e. complete ("X") events
+        with timestamps in microseconds
+        """
+        return [
+            {
+                "name": span.name,
+                "cat": span.stack[0],
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": span.pid,
+                "tid": span.tid,
+                "args": span.args,
+            }
+            for span in self.spans
+        ]
+
+    def write_trace(self, filepath: str):
+        """
+        write chrome trace-event json; viewable in chrome://tracing or perfetto
+        """
+        events = self.trace_events()
+        with open(filepath, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+    def summary(self) -> str:
+        """
+        return human-readable summary of span timings
+        """
+        # stack -> [durations]
+        totals: Dict[tuple, List[float]] = defaultdict(list)
+        for span in self.spans:
+            totals[span.stack].append(span.duration)
+
+        lines = [
+            f"{'span':<50} {'count':>7} {'total(s)':>10} {'mean(ms)':>10} {'max(ms)':>10}"
+        ]
+        for stack in sorted(totals):
+            durations = totals[stack]
+            name = "  " * (len(stack) - 1) + stack[-1]
+            lines.append(
+                f"{name:<50} {len(durations):>7} {sum(durations):>10.3f}"
+                f" {1000 * sum(durations) / len(durations):>10.2f}"
+                f" {1000 * max(durations):>10.2f}"
+            )
+
+        # slowest nested spans, e.g. pages
+        nested = [span for span in self.spans if len(span.stack) > 1]
+        nested.sort(key=lambda span: span.duration, reverse=True)
+        if nested:
+            lines.append("")
+            lines.append("slowest spans:")
+        for span in nested[:TOP_N]:
+            args = " ".join(f"{key}={value}" for key, value in span.args.items())
+            lines.append(
+                f"  {1000 * span.duration:>10.2f}ms {'/'.join(span.stack)} {args}"
+            )
+        return "\n".join(lines)
+
+    def write(self, profile_dir: str):
+        """
+        write summary, collapsed stacks and per-stage cProfile output to `profile_dir`
+        """
+        os.makedirs(profile_dir, exist_ok=True)
+        with open(os.path.join(profile_dir, "summary.txt"), "w") as fp:
+            fp.write(self.summary())
+
+        # collapsed stacks of self time per span, in microseconds
+        folded: Dict[tuple, float] = defaultdict(float)
+        for span in self.spans:
+            folded[span.stack] += span.duration - span.child_time
+        write_folded(os.path.join(profile_dir, "spans.folded"), folded)
+
+        for stage, sampler in self.samplers.items():
+            write_folded(os.path.join(profile_dir, f"{stage}.folded"), sampler.folded())
+
+        if self.profiles:
+            import pstats
+
+        for stage, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(profile_dir, f"{stage}.pstats"))
+            with open(os.path.join(profile_dir, f"{stage}.txt"), "w") as fp:
+                fp.write(hot_functions(pstats.Stats(profile)))
+
+
+def write_folded(filepath: str, folded: Dict[tuple, float]):
+    """
+    write collapsed stacks, i.e. lines of "frame;frame;frame <microseconds>"
+    """
+    with open(filepath, "w") as fp:
+        for stack, seconds in sorted(folded.items()):
+            micros = int(seconds * 1e6)
+            if micros > 0:
+                fp.write(f"{';'.join(stack)} {micros}\n")
+
+
+def hot_functions(stats: pstats.Stats) -> str:
+    """
+    return tables of the hottest functions, by own and by cumulative time
+    """
+    result = io.StringIO()
+    stats.stream = result
+    for key, title in (("tottime", "own time"), ("cumulative", "cumulative time")):
+        result.write(f"### sorted by {title}\n")
+        stats.sort_stats(key).print_stats(TOP_N)
+    return result.getvalue()
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class StackSampler:
+    """
+    samples the call stack of a thread at a fixed interval, from a
+    background thread; this gives real stacks (cProfile only records
+    caller -> callee edges) at low overhead, and works on any platform
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        # stack (root first) -> number of samples
+        self.samples: Dict[tuple, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        target_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(target_id,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self, target_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def folded(self) -> Dict[tuple, float]:
+        """
+        return stack -> (estimated) seconds
+        """
+        return {stack: count * self.interval for stack, count in self.samples.items()}
+
+
+### module level hooks
+
+# the active profiler; None when profiling is disabled
+_profiler: Optional[Profiler] = None
+
+
+def enable(cprofile: bool = False, sample: bool = True) -> Profiler:
+    """
+    enable profiling for subsequent stages and spans
+    """
+    global _profiler
+    _profiler = Profiler(cprofile=cprofile, sample=sample)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+@contextlib.contextmanager
+def stage(name: str, **args):
+    """
+    time a top-level pipeline stage
+    """
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name, args):
+        yield
+
+
+@contextlib.contextmanager
+def span(name: str, **args):
+    """
+    time a unit of work within a stage, e.g. a page
+    """
+    if _profiler is None:
+        yield
+        return
+    with _profiler.span(name, args):
+        yield
@@ -0,0 +1,240 @@
+"""
+related posts, by tf-idf similarity of content
+
+Each content file is tokenized (see textparser.tokenize) into a vector of
+term counts. Counts are weighted by tf-idf, i.e. (1 + log count) * log(N /
+number of documents with the term), and normalized, so the similarity of two
+documents is the dot product of their vectors, i.e. their cosine.
+
+Vectors are sparse, i.e. dicts of their nonzero terms. The similarities of
+all documents are computed at once, as the product of the document-term
+matrix with its transpose: for each term, every pair of documents that have
+it adds the product of their weights. Terms in every document weigh 0, and
+are skipped, so common words, which have the longest postings, cost nothing.
+
+Term counts are cached by a hash of the text, across builds (in a json
+file), so only added or changed files are tokenized. The weights, postings
+and rows of similarities are kept between updates, e.g. by the build server.
+When documents change, the documents whose weights change are reweighted:
+the changed ones, and those with a term whose document frequency changed.
+Only their rows are recomputed, from the postings, along with their entries
+in the other rows. Adding or removing a document changes N, and so every
+weight; all rows are recomputed.
+
+Weights are kept in term order, and a similarity sums the products of the
+terms two documents share in that order, so it's the same float whichever
+row it's computed for; an update gives exactly the result of computing all
+rows from scratch.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List
+
+import textparser
+
+
+def text_digest(lines: List[str]) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        hasher.update(line.encode("utf-8", "surrogatepass"))
+    return hasher.hexdigest()
+
+
+class RelatedPosts:
+    """
+    the `count` most similar documents of each document; term counts are
+    cached in `cache_path`
+    """
+
+    def __init__(self, cache_path: str, count: int = 3):
+        self.cache_path = cache_path
+        self.count = count
+        # text digest -> term -> count
+        self.vectors: Dict[str, Dict[str, int]] = {}
+        # document key -> text digest
+        self.digests: Dict[Hashable, str] = {}
+        # term -> keys of the documents with it
+        self.docs_with: Dict[str, set] = {}
+        # document key -> term -> normalized weight
+        self.weights: Dict[Hashable, Dict[str, float]] = {}
+        # term -> document key -> weight, i.e. the columns of the matrix
+        self.postings: Dict[str, Dict[Hashable, float]] = defaultdict(dict)
+        # document key -> document key -> similarity, i.e. the rows
+        self.rows: Dict[Hashable, Dict[Hashable, float]] = {}
+        # document key -> position, for ties
+        self.order: Dict[Hashable, int] = {}
+        # document key -> keys of the most similar documents, most similar first
+        self.related: Dict[Hashable, List] = {}
+        # vectors tokenized, and rows computed, by the last update
+        self.tokenized = 0
+        self.computed = 0
+
+    @classmethod
+    def load(cls, cache_path: str, count: int = 3):
+        """
+        load term counts cached by a previous build, if any
+        """
+        related = cls(cache_path, count)
+        try:
+            with open(cache_path, encoding="utf-8") as fp:
+                related.vectors = json.load(fp)
+        except (OSError, ValueError):
+            pass
+        return related
+
+    def save(self):
+        """
+        persist the term counts of the current documents, for the next build
+        """
+        current = set(self.digests.values())
+        vectors = {
+            digest: vector
+            for digest, vector in self.vectors.items()
+            if digest in current
+        }
+        with open(self.cache_path, "w", encoding="utf-8") as fp:
+            json.dump(vectors, fp, ensure_ascii=False, sort_keys=True)
+
+    def vector(self, lines: List[str]) -> str:
+        """
+        return the digest of `lines`, tokenizing them if not cached
+        """
+        digest = text_digest(lines)
+        if digest not in self.vectors:
+            self.vectors[digest] = dict(Counter(textparser.tokenize(lines)))
+            self.tokenized += 1
+        return digest
+
+    def update(self, documents: Dict[Hashable, List[str]]) -> Dict[Hashable, List]:
+        """
+        compute the related documents of `documents`, key -> lines of text;
+        the corpus is these documents only. returns `related`
+        """
+        self.tokenized = 0
+        digests = {key: self.vector(lines) for key, lines in documents.items()}
+        self.order = {key: pos for pos, key in enumerate(digests)}
+        if digests.keys() != self.digests.keys():
+            self.digests = digests
+            self.rebuild()
+            return self.related
+
+        changed = [
+            key for key, digest in digests.items() if digest != self.digests[key]
+        ]
+        # terms whose document frequency, and so idf, changed
+        terms = set()
+        for key in changed:
+            old = self.vectors[self.digests[key]].keys()
+            new = self.vectors[digests[key]].keys()
+            for term in old - new:
+                self.docs_with[term].discard(key)
+                if not self.docs_with[term]:
+                    del self.docs_with[term]
+            for term in new - old:
+                self.docs_with.setdefault(term, set()).add(key)
+            terms.update(old ^ new)
+        self.digests = digests
+
+        reweighed = set(changed)
+        for term in terms:
+            reweighed.update(self.docs_with.get(term, ()))
+        for key in reweighed:
+            for term in self.weights.pop(key):
+                del self.postings[term][key]
+        for key in reweighed:
+            self.add_weights(key)
+
+        # the other rows only change in the columns of reweighed documents
+        affected = set(reweighed)
+        for key in reweighed:
+            for other in self.rows[key]:
+                self.rows[other].pop(key, None)
+                affected.add(other)
+        for key in reweighed:
+            self.rows[key] = self.row(key)
+        for key in reweighed:
+            for other, score in self.rows[key].items():
+                self.rows[other][key] = score
+                affected.add(other)
+        self.computed = len(reweighed)
+
+        for key in affected:
+            self.related[key] = self.most_similar(key)
+        return self.related
+
+    def add_weights(self, key: Hashable):
+        """
+        weigh the term counts of document `key`, by the current idf
+        """
+        ndocs = len(self.digests)
+        vector = self.vectors[self.digests[key]]
+        weights = {}
+        for term in sorted(vector):
+            df = len(self.docs_with[term])
+            if df < ndocs:
+                weights[term] = (1 + math.log(vector[term])) * math.log(ndocs / df)
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        self.weights[key] = {term: weight / norm for term, weight in weights.items()}
+        for term, weight in self.weights[key].items():
+            self.postings[term][key] = weight
+
+    def row(self, key: Hashable) -> Dict[Hashable, float]:
+        """
+        return the similarities of document `key` to the others
+        """
+        row = defaultdict(float)
+        for term, weight in self.weights[key].items():
+            for other, other_weight in self.postings[term].items():
+                if other != key:
+                    row[other] += weight * other_weight
+        return row
+
+    def rebuild(self):
+        """
+        recompute the weights and similarities of all documents
+        """
+        self.docs_with = {}
+        for key, digest in self.digests.items():
+            for term in self.vectors[digest]:
+                self.docs_with.setdefault(term, set()).add(key)
+        self.weights = {}
+        self.postings = defaultdict(dict)
+        for key in self.digests:
+            self.add_weights(key)
+
+        # each pair adds the products of its shared terms in term order, as `row`
+        self.rows = {key: defaultdict(float) for key in self.digests}
+        for term in sorted(self.postings):
+            column = list(self.postings[term].items())
+            for i, (key, weight) in enumerate(column):
+                row = self.rows[key]
+                for other, other_weight in column[:i]:
+                    product = weight * other_weight
+                    row[other] += product
+                    self.rows[other][key] += product
+        self.computed = len(self.rows)
+        self.related = {key: self.most_similar(key) for key in self.digests}
+
+    def most_similar(self, key: Hashable) -> List:
+        """
+        return the keys of the `count` documents most similar to `key`;
+        ties go to the document added first
+        """
+        return [
+            other
+            for other, _ in heapq.nlargest(
+                self.count,
+                self.rows[key].items(),
+                key=lambda item: (item[1], -self.order[item[0]]),
+            )
+        ]
+
+    def report(self) -> str:
+        return (
+            f"related posts: {len(self.digests)} documents, {self.tokenized} tokenized,"
+            f" {self.computed} rows computed"
+        )
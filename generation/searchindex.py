@@ -0,0 +1,199 @@
+"""
+full-text search index of content pages
+
+Content is tokenized into terms as pages are built (see textparser.tokenize),
+and the index maps each term to its postings: the pages it occurs in, with
+its positions in each. It's written as json shards by term prefix, i.e.
+<index dir>/shards/<prefix>.json, so the client (js/search.js) only loads
+the shards of the terms it looks up; <index dir>/docs.json lists the pages,
+by id, and the shards. Shards are in their own directory, so no prefix can
+name the same file as docs.json.
+
+A shard is {term: [[page id, position, delta, delta, ...], ...]}; positions
+are delta encoded, to keep numbers short. Postings are kept as these json
+fragments, which take a fraction of the memory of lists of ints.
+
+Page ids are kept across builds, by reading the last docs.json, so a changed
+page only changes the shards of the terms it adds, removes or moves; only
+those are rewritten.
+"""
+
+import json
+import operator
+import os
+from collections import defaultdict
+from typing import Dict, List
+
+import outputwriter
+
+DOCS_FILE = "docs.json"
+# directory of the shards, within the index directory
+SHARD_DIR = "shards"
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def encode_posting(doc: int, positions: List[int]) -> str:
+    """
+    json of the posting of page `doc`, with its `positions` delta encoded
+    """
+    deltas = map(operator.sub, positions, [0] + positions)
+    return f"[{doc},{','.join(map(str, deltas))}]"
+
+
+class SearchIndex:
+    """
+    index of pages, written to `index_dir` in shards by the first
+    `prefix_len` characters of terms
+    """
+
+    def __init__(self, index_dir: str, prefix_len: int = 2):
+        self.index_dir = index_dir
+        self.shard_dir = os.path.join(index_dir, SHARD_DIR)
+        self.prefix_len = prefix_len
+        # url -> page id
+        self.ids: Dict[str, int] = {}
+        # page id -> [url, title]; None if unused
+        self.docs: List = []
+        # unused page ids, below len(docs)
+        self.free: List[int] = []
+        # page ids added since the last prune
+        self.added = set()
+        # page id -> term -> posting
+        self.pages: Dict[int, Dict[str, str]] = {}
+        # prefix -> term -> page id -> posting
+        self.shards: Dict[str, Dict[str, Dict[int, str]]] = defaultdict(
+            lambda: defaultdict(dict)
+        )
+        # prefixes of shards changed since they were written
+        self.dirty = set()
+        self.load_ids()
+
+    def load_ids(self):
+        """
+        reuse the page ids of the last written index
+        """
+        try:
+            with open(os.path.join(self.index_dir, DOCS_FILE), encoding="utf-8") as fp:
+                docs = json.load(fp)["docs"]
+        except (OSError, ValueError, KeyError):
+            return
+        for doc, entry in enumerate(docs):
+            if entry:
+                self.ids[entry[0]] = doc
+            else:
+                self.free.append(doc)
+        self.docs = [None] * len(docs)
+
+    def get_id(self, url: str) -> int:
+        doc = self.ids.get(url)
+        if doc is None:
+            if self.free:
+                doc = self.free.pop(0)
+            else:
+                doc = len(self.docs)
+                self.docs.append(None)
+            self.ids[url] = doc
+        return doc
+
+    def add(self, url: str, title: str, terms: List[str]):
+        """
+        index the page at `url`, replacing its postings if already indexed
+        """
+        doc = self.get_id(url)
+        self.docs[doc] = [url, title]
+        self.added.add(doc)
+        positions = {}
+        for position, term in enumerate(terms):
+            term_positions = positions.get(term)
+            if term_positions is None:
+                positions[term] = [position]
+            else:
+                term_positions.append(position)
+        postings = {
+            term: encode_posting(doc, term_positions)
+            for term, term_positions in positions.items()
+        }
+        self.update(doc, postings)
+
+    def update(self, doc: int, postings: Dict[str, str]):
+        """
+        replace the postings of page `doc`, term -> posting
+        """
+        old = self.pages.get(doc, {})
+        for term in old.keys() - postings.keys():
+            prefix = term[: self.prefix_len]
+            term_postings = self.shards[prefix][term]
+            del term_postings[doc]
+            if not term_postings:
+                del self.shards[prefix][term]
+            self.dirty.add(prefix)
+        for term, posting in postings.items():
+            if old.get(term) != posting:
+                prefix = term[: self.prefix_len]
+                self.shards[prefix][term][doc] = posting
+                self.dirty.add(prefix)
+        if postings:
+            self.pages[doc] = postings
+        else:
+            self.pages.pop(doc, None)
+
+    def prune(self):
+        """
+        remove pages that weren't added since the last prune, e.g. after a
+        full build, pages that no longer exist
+        """
+        for url, doc in list(self.ids.items()):
+            if doc not in self.added:
+                self.update(doc, {})
+                del self.ids[url]
+                self.docs[doc] = None
+                self.free.append(doc)
+        while self.docs and self.docs[-1] is None:
+            self.docs.pop()
+        self.free = sorted(doc for doc in self.free if doc < len(self.docs))
+        self.added = set()
+
+    def write(self, writer: outputwriter.OutputWriter):
+        """
+        write changed shards, and docs.json, with `writer`; removes
+        shards that no longer have terms
+        """
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for prefix in sorted(self.dirty):
+            filepath = os.path.join(self.shard_dir, f"{prefix}.json")
+            terms = self.shards.get(prefix)
+            if not terms:
+                self.shards.pop(prefix, None)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                continue
+            # the same as dumps, of the decoded postings
+            entries = []
+            for term in sorted(terms):
+                postings = ",".join(
+                    posting for _, posting in sorted(terms[term].items())
+                )
+                entries.append(f"{dumps(term)}:[{postings}]")
+            writer.write(filepath, "{" + ",".join(entries) + "}")
+        self.dirty = set()
+
+        docs = {
+            "prefix": self.prefix_len,
+            "shards": sorted(self.shards),
+            "docs": self.docs,
+        }
+        writer.write(os.path.join(self.index_dir, DOCS_FILE), dumps(docs))
+
+    def remove_stale(self):
+        """
+        remove shard files left by earlier builds, e.g. of removed pages
+        """
+        if not os.path.isdir(self.shard_dir):
+            return
+        for filename in os.listdir(self.shard_dir):
+            prefix, ext = os.path.splitext(filename)
+            if ext == ".json" and prefix not in self.shards:
+                os.remove(os.path.join(self.shard_dir, filename))
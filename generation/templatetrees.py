@@ -0,0 +1,213 @@
+"""
+template-tree instantiation
+
+Every content page extends head.jinja.html, so parsing whole pages parses
+the same head, navbar and footer once per page. Instead, the layout of each
+content template, i.e. the page with its content block replaced by a marker,
+is rendered and parsed once. A page's content block is rendered and parsed
+on its own, and spliced into a copy-on-write clone of the layout tree (see
+treeparser.Tree.clone). So the parse cost of a page scales with its content,
+not the size of the page.
+
+The result is the same tree as parsing the whole rendered page. Where that
+can't be ensured, e.g. a template without a content block, or a layout that
+depends on variables that can't be determined, the whole page is rendered
+and parsed.
+"""
+from typing import Callable, Optional
+
+from jinja2 import Environment, meta, nodes
+
+import treeparser as tp
+
+# the block that holds a page's content
+CONTENT_BLOCK = "content"
+# stands in for the content block in the layout
+MARKER = "pagegen:content"
+LAYOUT_SOURCE = (
+    "{% extends layout_template %}"
+    f"{{% block {CONTENT_BLOCK} %}}<!--{MARKER}-->{{% endblock %}}"
+)
+
+
+def is_marker(node: tp.Node) -> bool:
+    return isinstance(node, tp.CommentNode) and node.comment == MARKER
+
+
+class Layout:
+    """
+    parsed layout of a template, with the position of the content marker
+    """
+
+    def __init__(self, tree: tp.Tree, marker: tp.CommentNode):
+        self.tree = tree
+        # shared by all clones
+        self.shared = tree.node_set()
+        self.marker = marker
+        self.parent = tree.parent_idx.get(marker, tree.root)
+
+        # a whole page parse indexes ids as elements close, and a later
+        # duplicate id wins; these are ids of elements that close after the
+        # content, i.e. enclose or follow it
+        ancestors = set()
+        node = marker
+        while node in tree.parent_idx:
+            node = tree.parent_idx[node]
+            ancestors.add(node)
+        following = set()
+        seen_marker = False
+        stack = [tree.root]
+        while stack:
+            node = stack.pop()
+            seen_marker = seen_marker or node is marker
+            if seen_marker:
+                following.add(node)
+            stack.extend(reversed(node.children))
+        self.late_ids = {
+            objectid
+            for objectid, node in tree.id_idx.items()
+            if node in ancestors or node in following
+        }
+
+
+class TemplateTrees:
+    """
+    instantiates trees of content pages from parsed layouts
+    `parse` parses html text to a tree, e.g. through the tree cache
+    """
+
+    def __init__(self, env: Environment, parse: Callable[[str], tp.Tree]):
+        self.env = env
+        self.parse = parse
+        self.layout_template = env.from_string(LAYOUT_SOURCE)
+        # template_id -> names of variables used outside the content block;
+        # None if they can't be determined
+        self.variables: dict = {}
+        # (template_id, values of layout variables) -> Layout; None if unusable
+        self.layouts: dict = {}
+        # counts for the build summary
+        self.instantiated = 0
+        self.parsed = 0
+
+    def layout_variables(self, template_id: str) -> Optional[frozenset]:
+        """
+        return names of the variables that the layout of `template_id`
+        depends on, following extends, includes and imports
+        """
+        names = set()
+        pending = [template_id]
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            ast = self.env.parse(source)
+            for block in ast.find_all(nodes.Block):
+                if block.name == CONTENT_BLOCK:
+                    block.body = []
+            names |= meta.find_undeclared_variables(ast)
+            for referenced in meta.find_referenced_templates(ast):
+                if referenced is None:
+                    # dynamic, e.g. {% extends name %}
+                    return None
+                pending.append(referenced)
+        return frozenset(names)
+
+    def get_layout(self, template_id: str, variables: dict) -> Optional[Layout]:
+        if template_id not in self.variables:
+            self.variables[template_id] = self.layout_variables(template_id)
+        names = self.variables[template_id]
+        if names is None:
+            return None
+
+        key = (template_id, tuple(repr(variables.get(name)) for name in sorted(names)))
+        if key not in self.layouts:
+            text = self.layout_template.render(**variables, layout_template=template_id)
+            tree = self.parse(text)
+            markers = tp.find_nodes_with_fn(is_marker, tree.root)
+            # e.g. the block is within <title>; the marker isn't a comment
+            self.layouts[key] = Layout(tree, markers[0]) if len(markers) == 1 else None
+        return self.layouts[key]
+
+    def instantiate(self, template_id: str, variables: dict) -> tp.Tree:
+        """
+        return tree of `template_id` rendered with `variables`
+        """
+        template = self.env.get_template(template_id)
+        layout = None
+        if CONTENT_BLOCK in template.blocks:
+            layout = self.get_layout(template_id, variables)
+        if layout is not None:
+            context = template.new_context(variables)
+            content = "".join(template.blocks[CONTENT_BLOCK](context))
+            try:
+                fragment = self.parse(content)
+            except tp.MissingStartTag:
+                # closes elements opened by the layout
+                fragment = None
+            if fragment is not None:
+                self.instantiated += 1
+                return splice(layout, fragment)
+
+        self.parsed += 1
+        return self.parse(template.render(**variables))
+
+
+def splice(layout: Layout, fragment: tp.Tree) -> tp.Tree:
+    """
+    return a clone of `layout`, with the nodes of `fragment` in place of the marker
+    """
+    tree = layout.tree.clone(layout.shared)
+    parent = tree.own(layout.parent)
+    pos = parent.children.index(layout.marker)
+    # the marker itself is dropped
+    end = pos + 1
+    before, after = parent.children[:pos], parent.children[end:]
+
+    # in a whole page, these are closed by the element that encloses the content
+    children = []
+    for node in fragment.root.children:
+        if isinstance(node, tp.UndeterminedNode):
+            node = tp.ClosedNode(tag=node.tag, attrs=node.attrs)
+            for key, value in node.attrs:
+                if key == "id":
+                    fragment.id_idx[value] = node
+        children.append(node)
+
+    # the whole page parser sees text on either side of the marker, and at the
+    # start and end of the content, as one run of text
+    removed = [layout.marker]
+    if children:
+        if before and isinstance(before[-1], tp.DataNode):
+            if isinstance(children[0], tp.DataNode):
+                removed.append(before.pop())
+                children[0] = tp.DataNode(removed[-1].data + children[0].data)
+        if after and isinstance(after[0], tp.DataNode):
+            if isinstance(children[-1], tp.DataNode):
+                removed.append(after.pop(0))
+                children[-1] = tp.DataNode(children[-1].data + removed[-1].data)
+    elif before and after:
+        if isinstance(before[-1], tp.DataNode) and isinstance(after[0], tp.DataNode):
+            removed.extend([before.pop(), after.pop(0)])
+            children = [tp.DataNode(removed[-2].data + removed[-1].data)]
+
+    parent.children = before + children + after
+    for node in removed:
+        tree.parent_idx.pop(node, None)
+    if parent is not tree.root:
+        for node in children:
+            tree.parent_idx[node] = parent
+    tree.parent_idx.update(fragment.parent_idx)
+
+    id_idx = {
+        objectid: node
+        for objectid, node in tree.id_idx.items()
+        if objectid not in layout.late_ids
+    }
+    id_idx.update(fragment.id_idx)
+    for objectid in layout.late_ids:
+        id_idx[objectid] = tree.id_idx[objectid]
+    tree.id_idx = id_idx
+    return tree
@@ -0,0 +1,103 @@
+import os
+from collections import namedtuple
+
+import assets
+import transformrules
+import treeparser as tp
+
+Page = namedtuple("Page", "tree")
+
+
+def make_tree(text):
+    parser = tp.TreeParser()
+    parser.feed(text)
+    return parser.finalize()
+
+
+def rewrite(manifest, tree):
+    rules = transformrules.RuleSet()
+    rules.add(
+        "asset-urls",
+        lambda node, page, nth: manifest.rewrite_node(node),
+        selector=assets.ASSET_SELECTOR,
+    )
+    rules.apply(Page(tree))
+
+
+def inline(manifest, tree, limit):
+    rules = transformrules.RuleSet()
+    rules.add(
+        "inline-assets",
+        lambda node, page, nth: manifest.inline_node(node, limit),
+        selector=assets.INLINE_SELECTOR,
+    )
+    rules.apply(Page(tree))
+
+
+def test_fingerprint_rewrite(tmp_path):
+    os.mkdir(tmp_path / "css")
+    (tmp_path / "css" / "style.css").write_text("body {}")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    manifest = assets.AssetManifest.load(manifest_path, str(tmp_path), ("css",))
+    tree = make_tree(
+        '<head><link href="css/style.css?v=1" rel="stylesheet">'
+        '<link href="https://example.com/a.css"><a href="index.html"></a></head>'
+    )
+    rewrite(manifest, tree)
+    manifest.save()
+
+    fingerprinted = manifest.entries["css/style.css"]["path"]
+    assert fingerprinted.startswith("css/style.") and fingerprinted.endswith(".css")
+    assert os.path.exists(tmp_path / fingerprinted)
+    html = tp.TreePrinter().mk_doc(tree.get_root(as_qmnode=False))
+    assert f'href="{fingerprinted}?v=1"' in html
+    assert 'href="https://example.com/a.css"' in html
+    assert 'href="index.html"' in html
+
+    # unchanged asset is not rehashed on the next build
+    manifest = assets.AssetManifest.load(manifest_path, str(tmp_path), ("css",))
+    assert manifest.lookup("css/style.css") == fingerprinted
+    assert manifest.hashed == 0
+
+
+def test_store_deduplicates(tmp_path):
+    for dirname in ("img", "pics"):
+        os.mkdir(tmp_path / dirname)
+        (tmp_path / dirname / "a.jpg").write_bytes(b"same")
+    (tmp_path / "pics" / "b.jpg").write_bytes(b"other")
+
+    manifest = assets.AssetManifest.load(
+        str(tmp_path / "manifest.json"), str(tmp_path), ("img", "pics"), False
+    )
+    manifest.store = assets.AssetStore(manifest, ("img", "pics"))
+    manifest.store.scan()
+    assert manifest.store.unique() == ["img/a.jpg", "pics/b.jpg"]
+
+    tree = make_tree('<p><img src="pics/a.jpg"><img src="pics/b.jpg"></p>')
+    rewrite(manifest, tree)
+    html = tp.TreePrinter().mk_doc(tree.get_root(as_qmnode=False))
+    assert html == '<p><img src="img/a.jpg"><img src="pics/b.jpg"></p>'
+
+
+def test_inline_small_assets(tmp_path):
+    os.mkdir(tmp_path / "img")
+    (tmp_path / "img" / "logo.png").write_bytes(b"tiny")
+    (tmp_path / "img" / "big.png").write_bytes(b"x" * 100)
+
+    manifest = assets.AssetManifest.load(
+        str(tmp_path / "manifest.json"), str(tmp_path), ("img",), False
+    )
+    tree = make_tree(
+        '<p><img src="img/logo.png"><img src="img/big.png">'
+        '<link rel="icon" href="img/logo.png"><link href="img/logo.png"></p>'
+    )
+    inline(manifest, tree, limit=10)
+    html = tp.TreePrinter().mk_doc(tree.get_root(as_qmnode=False))
+    uri = "data:image/png;base64,dGlueQ=="
+    expected = (
+        f'<p><img src="{uri}"><img src="img/big.png">'
+        f'<link rel="icon" href="{uri}"><link href="img/logo.png"></p>'
+    )
+    assert html == expected
+    assert len(manifest.data_uris) == 1
@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import buildgraph
+
+
+def make_graph(results: dict, log: list) -> buildgraph.BuildGraph:
+    """
+    css <- a.txt; page-1, page-2 <- css; index <- page-1
+    each target's result is results[name]
+    """
+
+    def action(name):
+        def build():
+            log.append(name)
+            return results.get(name)
+
+        return build
+
+    graph = buildgraph.BuildGraph()
+    graph.add("css", action("css"), ["a.txt"])
+    graph.add("page-1", action("page-1"), ["1.txt", "t.html"], ["css"])
+    graph.add("page-2", action("page-2"), ["2.txt", "t.html"], ["css"])
+    graph.add("index", action("index"), [], ["page-1"])
+    return graph
+
+
+def test_add():
+    graph = buildgraph.BuildGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("b", lambda: None, deps=["c"])
+
+
+def test_invalidation():
+    graph = make_graph({}, [])
+    assert graph.inputs() == {"a.txt", "1.txt", "2.txt", "t.html"}
+    assert graph.stale(["t.html"]) == ["page-1", "page-2"]
+    assert graph.stale(["b.txt"]) == []
+    assert graph.invalidated(["1.txt"]) == ["page-1", "index"]
+    assert graph.invalidated(["a.txt"]) == ["css", "page-1", "page-2", "index"]
+
+
+def test_run():
+    results, log = {"css": "x"}, []
+    graph = make_graph(results, log)
+    assert graph.run() == ["css", "page-1", "page-2", "index"]
+    assert log == ["css", "page-1", "page-2", "index"]
+
+    # unchanged result; dependents aren't built
+    assert graph.run(graph.stale(["a.txt"])) == ["css"]
+    # page-1's result is unchanged, so index isn't built
+    results["css"] = "y"
+    assert graph.run(graph.stale(["a.txt"])) == ["css", "page-1", "page-2"]
+    assert graph.run(graph.stale(["2.txt"])) == ["page-2"]
+
+
+def test_run_parallel():
+    # page-1 and page-2 only finish if they run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    log = []
+    graph = buildgraph.BuildGraph()
+    graph.add("css", lambda: log.append("css"))
+    for name in ("page-1", "page-2"):
+        graph.add(name, barrier.wait, deps=["css"])
+    graph.add("index", lambda: log.append("index"), deps=["page-1", "page-2"])
+    with ThreadPoolExecutor(2) as executor:
+        built = graph.run(executor=executor)
+    assert built[0] == "css" and built[-1] == "index"
+    assert sorted(built[1:3]) == ["page-1", "page-2"]
+    assert log == ["css", "index"]
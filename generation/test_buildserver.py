@@ -0,0 +1,221 @@
+import glob
+import os
+import threading
+
+import pytest
+
+import buildclient
+import buildserver
+import outputwriter
+import pagegen
+import profiling
+
+
+def test_incremental_builds(site_builder, monkeypatch):
+    corpus_dir, builder = site_builder
+    # the generated pages are all about as related, so an edit reorders
+    # the related posts of others; see test_related_posts
+    monkeypatch.setattr(pagegen, "RELATED_POSTS", False)
+    # the fold is above the content, so edits to it don't change the css
+    monkeypatch.setattr(pagegen, "ABOVE_THE_FOLD_ELEMENTS", 50)
+    summary = builder.build()
+    assert summary["mode"] == "full" and len(summary["pages"]) == 8 + 4
+    feed = pagegen.read_all(os.path.join(corpus_dir, "essays-feed.xml"))
+    assert feed.count("<entry>") == 2
+    assert builder.build()["mode"] == "noop"
+    # converted content is only kept during the builder's builds
+    assert not pagegen.KEEP_CONTENT_HTML
+
+    with open(os.path.join(corpus_dir, "content", "essays", "page-1.txt"), "a") as fp:
+        fp.write("an edit\n")
+    summary = builder.build()
+    assert summary["mode"] == "incremental"
+    # listings are built first; other pages' critical css didn't change
+    assert [os.path.basename(page) for page in summary["pages"]] == [
+        "essays-listing.html",
+        "page-1.html",
+    ]
+    assert "an edit" in pagegen.read_all(os.path.join(corpus_dir, "page-1.html"))
+    shard = pagegen.read_all(os.path.join(corpus_dir, "search", "shards", "ed.json"))
+    assert '"edit":' in shard
+
+    # a template affects the pages rendered from it
+    template = "content-image.jinja.html"
+    with open(os.path.join(corpus_dir, "templates", template), "a") as fp:
+        fp.write("\n")
+    summary = builder.build()
+    assert summary["mode"] == "incremental"
+    assert summary["pages"] == [
+        filepath
+        for section, items in builder.site.content.items()
+        for metadata, filepath in zip(items, builder.site.cfiles[section])
+        if metadata.template_id == template
+    ]
+
+    # head.jinja.html is extended by all templates
+    head = os.path.normpath(os.path.join(corpus_dir, "templates", "head.jinja.html"))
+    assert builder.site.graph.stale([head]) == list(builder.site.filepaths)
+
+
+def test_listing_pages(site_builder, monkeypatch):
+    corpus_dir, builder = site_builder
+    monkeypatch.setattr(pagegen, "LISTING_PAGE_SIZE", 1)
+    monkeypatch.setattr(pagegen, "RELATED_POSTS", False)
+    summary = builder.build()
+    # 2 items per section, 1 per page; tech-writings spans 2 years
+    assert len(summary["pages"]) == 8 + 4 * 2 + 5
+
+    def page(name):
+        return pagegen.read_all(os.path.join(corpus_dir, name))
+
+    first = page("tech-writings-listing.html")
+    assert 'id="prev_page" href="tech-writings-listing-2.html"' in first
+    # the listed posts are prefetched
+    assert '<link rel="prefetch" href="page-0.html">' in first
+    assert 'href="tech-writings-archive-2020.html">2020' in first
+    assert 'href="page-0.html">Read more' in first
+    second = page("tech-writings-listing-2.html")
+    assert 'id="next_page" href="tech-writings-listing.html"' in second
+    assert "prev_page" not in second and 'href="page-4.html">Read more' in second
+    assert "page-4.html" in page("tech-writings-archive-2020.html")
+
+    # only the listing pages of the edited item are rebuilt
+    with open(os.path.join(corpus_dir, "content", "tech-writings", "page-4.txt")) as fp:
+        text = fp.read()
+    with open(
+        os.path.join(corpus_dir, "content", "tech-writings", "page-4.txt"), "w"
+    ) as fp:
+        fp.write("A new first line.\n" + text)
+    summary = builder.build()
+    assert [os.path.basename(page) for page in summary["pages"]] == [
+        "tech-writings-listing-2.html",
+        "tech-writings-archive-2020.html",
+        "page-4.html",
+    ]
+    assert "A new first line." in page("tech-writings-listing-2.html")
+
+
+def test_related_posts(site_builder, monkeypatch):
+    corpus_dir, builder = site_builder
+    monkeypatch.setattr(pagegen, "RELATED_COUNT", 1)
+    builder.build()
+    assert "Related Posts" in pagegen.read_all(os.path.join(corpus_dir, "page-1.html"))
+
+    # page-1 and page-3 have terms no other page has, so they're most related
+    content_dir = os.path.join(corpus_dir, "content")
+    for filepath in ("essays/page-1.txt", "random-thoughts/page-3.txt"):
+        with open(os.path.join(content_dir, filepath), "a") as fp:
+            fp.write("Quokkas and narwhals.\n")
+    summary = builder.build()
+    related = builder.transforms.related
+    # only the edited pages are tokenized again
+    assert related.tokenized == 2
+    assert related.related[("random-thoughts", 0)] == [("essays", 0)]
+    assert related.related[("essays", 0)] == [("random-thoughts", 0)]
+    # pages whose related posts changed are rebuilt
+    pages = {os.path.basename(page) for page in summary["pages"]}
+    assert {"page-1.html", "page-3.html"} <= pages
+    assert '<a href="page-3.html">' in pagegen.read_all(
+        os.path.join(corpus_dir, "page-1.html")
+    )
+
+
+def test_prefetch_hints(site_builder, monkeypatch):
+    corpus_dir, builder = site_builder
+    monkeypatch.setattr(pagegen, "PREFETCH_HINTS", {"next": "prerender"})
+    builder.build()
+
+    def page(name):
+        return pagegen.read_all(os.path.join(corpus_dir, name))
+
+    # page-0 is the newest tech-writings post
+    assert '<link rel="prerender" href="page-0.html"></head>' in page("page-4.html")
+    assert "prerender" not in page("page-0.html")
+    assert "prefetch" not in page("tech-writings-listing.html")
+
+    with pytest.raises(ValueError):
+        pagegen.LMetadata("essays", "Essays", "t.html", prefetch={"last": "prefetch"})
+
+
+def test_overlap_io(site_builder, monkeypatch):
+    corpus_dir, _ = site_builder
+    pagegen.driver(corpus_dir)
+    pages = sorted(glob.glob(os.path.join(corpus_dir, "*.html")))
+    expected = [pagegen.read_all(filepath) for filepath in pages]
+
+    monkeypatch.setattr(pagegen, "OVERLAP_IO", True)
+    monkeypatch.setattr(pagegen, "READ_AHEAD", 2)
+    result = pagegen.driver(corpus_dir)
+    assert isinstance(result.file_manager.writer, outputwriter.BackgroundWriter)
+    assert [pagegen.read_all(filepath) for filepath in pages] == expected
+
+
+def test_server_requests(site_builder, tmp_path):
+    _, builder = site_builder
+    socket_path = str(tmp_path / "server.sock")
+    server = buildserver.BuildServer(socket_path, builder)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+
+    response = buildclient.request("build", socket_path)
+    assert response["ok"] and response["mode"] == "full"
+    response = buildclient.request("build", socket_path)
+    assert response["ok"] and response["mode"] == "noop"
+    assert buildclient.request("status", socket_path)["builds"] == 2
+
+    assert buildclient.request("stop", socket_path)["ok"]
+    thread.join()
+    assert not os.path.exists(socket_path)
+
+
+def test_target_spans(site_builder):
+    corpus_dir, builder = site_builder
+    profiler = profiling.enable(sample=False)
+    try:
+        builder.build()
+    finally:
+        profiling.disable()
+    # each kind of target is timed within the pages stage
+    stacks = {span.stack[:2] for span in profiler.spans}
+    for kind in ("listing", "content", "critical-css", "related", "feeds"):
+        assert ("pages", kind) in stacks
+    assert ("pages", "content", "transform_content") in {
+        span.stack[:3] for span in profiler.spans
+    }
+
+
+def test_critical_css_changes(site_builder, monkeypatch):
+    corpus_dir, builder = site_builder
+    monkeypatch.setattr(pagegen, "RELATED_POSTS", False)
+    # the whole page is above the fold, so its content affects the css
+    monkeypatch.setattr(pagegen, "ABOVE_THE_FOLD_ELEMENTS", 100000)
+    builder.build()
+    # essays/page-1 is the first page of its template, i.e. its css sample
+    (sample,) = [
+        metadata
+        for metadata in builder.site.content["essays"]
+        if metadata.content_id == "page-1.txt"
+    ]
+    css_target = builder.site.graph.targets[f"critical-css:{sample.template_id}"]
+    assert css_target.deps == ("content:essays:page-1.txt",)
+    siblings = [
+        filepath
+        for section, items in builder.site.content.items()
+        for metadata, filepath in zip(items, builder.site.cfiles[section])
+        if metadata.template_id == sample.template_id and metadata is not sample
+    ]
+    sibling = os.path.join(corpus_dir, siblings[0])
+    assert ".table" not in pagegen.read_all(sibling)
+
+    with open(os.path.join(corpus_dir, "content", "essays", "page-1.txt"), "a") as fp:
+        fp.write('<table class="table"><tr><td>a</td></tr></table>\n')
+    summary = builder.build()
+    # the other pages of the template get the new css
+    assert set(siblings) <= set(summary["pages"])
+    assert ".table" in pagegen.read_all(sibling)
+
+    # an edit that doesn't change the css rebuilds only the page and its listing
+    with open(os.path.join(corpus_dir, "content", "essays", "page-1.txt"), "a") as fp:
+        fp.write("another edit\n")
+    summary = builder.build()
+    assert len(summary["pages"]) == 2
@@ -0,0 +1,67 @@
+import criticalcss as cc
+import treeparser as tp
+
+
+def make_tree(text):
+    parser = tp.TreeParser()
+    parser.feed(text)
+    return parser.finalize()
+
+
+def test_parse_stylesheet():
+    text = """
+    /* comment */
+    a { color: red; }
+    @media (min-width: 576px) { .row, .col > p { margin: 0; } }
+    @font-face { font-family: foo; }
+    """
+    rules = cc.parse_stylesheet(text)
+    assert len(rules) == 2
+    assert rules[0].selectors == ["a"]
+    assert rules[1].selectors == [".row", ".col > p"]
+    assert rules[1].conditions == ("@media (min-width: 576px)",)
+
+
+def test_rule_matching():
+    tree = make_tree(
+        '<html><body><div class="row"><p id="x">a</p><span>b</span></div></body></html>'
+    )
+    elements = cc.above_the_fold(tree.get_root(as_qmnode=False), limit=100)
+
+    def matches(selector):
+        rule = cc.CSSRule([selector], "", ())
+        return cc.rule_matches(rule, elements)
+
+    assert matches(".row > p")
+    assert matches("body p#x:hover")
+    assert matches("p + span")
+    assert not matches("span + p")
+    assert not matches(".col p")
+    assert not matches("[type=button]")
+
+
+def test_above_the_fold_limit():
+    tree = make_tree("<html><body><p>a</p><span>b</span></body></html>")
+    elements = cc.above_the_fold(tree.get_root(as_qmnode=False), limit=3)
+    assert [elem.node.tag for elem in elements] == ["html", "body", "p"]
+
+
+def test_rebase_urls():
+    declarations = 'background: url("../img/a.jpg"), url(data:image/png;base64,AA)'
+    rebased = cc.rebase_urls(declarations, "/site/css", "/site")
+    assert rebased == 'background: url("img/a.jpg"), url(data:image/png;base64,AA)'
+
+
+def test_inline_nested_link(tmp_path):
+    (tmp_path / "a.css").write_text("p { color: red; }")
+    tree = make_tree(
+        '<html><head><title>t</title><template><link rel="stylesheet" href="a.css">'
+        "</template></head><body><p>a</p></body></html>"
+    )
+    critical = cc.CriticalCSS(str(tmp_path), limit=10)
+    style, noscript = critical.inline("t", tree)
+    head = tree.get_root().descendent(tag="head").node
+    # the style goes before the head child the link is nested in
+    assert [child.tag for child in head.children] == ["title", "style", "template"]
+    assert style.children[0].data == "p{color: red;}"
+    assert tree.get_parent(noscript).tag == "template"
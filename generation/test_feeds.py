@@ -0,0 +1,59 @@
+import datetime
+import os
+import xml.dom.minidom
+
+import feeds
+import outputwriter
+
+ENTRIES = [
+    feeds.Entry("https://a.b/new.html", "New & <Shiny>", datetime.date(2021, 8, 14)),
+    feeds.Entry("https://a.b/old.html", "Old", "2019-1"),
+]
+
+
+def test_to_date():
+    assert feeds.to_date("2021-1-26") == datetime.date(2021, 1, 26)
+    assert feeds.to_date("2019-1") == datetime.date(2019, 1, 1)
+    assert feeds.timestamp(datetime.date(2020, 7, 14)) == "2020-07-14T00:00:00Z"
+
+
+def test_feed(tmp_path):
+    filepath = str(tmp_path / "feed.xml")
+    writer = outputwriter.OutputWriter(fsync_batch=0)
+    args = ("https://a.b/feed.xml", "https://a.b/", "Site", "Author")
+    assert feeds.write_feed(filepath, *args, ENTRIES, writer)
+    doc = xml.dom.minidom.parse(filepath)
+    titles = [node.firstChild.data for node in doc.getElementsByTagName("title")]
+    assert titles == ["Site", "New & <Shiny>", "Old"]
+    updated = doc.getElementsByTagName("updated")[0].firstChild.data
+    assert updated == "2021-08-14T00:00:00Z"
+
+    # the same items aren't regenerated
+    os.utime(filepath, ns=(0, 0))
+    assert not feeds.write_feed(filepath, *args, ENTRIES, writer)
+    assert os.stat(filepath).st_mtime_ns == 0
+    # a change in order is
+    assert feeds.write_feed(filepath, *args, ENTRIES[::-1], writer)
+    assert writer.written == 2
+    assert os.listdir(tmp_path) == ["feed.xml"]
+
+
+def test_sitemap(tmp_path):
+    filepath = str(tmp_path / "sitemap.xml")
+    writer = outputwriter.OutputWriter(fsync_batch=0)
+    entries = [feeds.Entry("https://a.b/index.html", None, None)] + ENTRIES
+    assert feeds.write_sitemap(filepath, entries, writer)
+    doc = xml.dom.minidom.parse(filepath)
+    locs = [node.firstChild.data for node in doc.getElementsByTagName("loc")]
+    assert locs == [entry.url for entry in entries]
+    lastmods = [node.firstChild.data for node in doc.getElementsByTagName("lastmod")]
+    assert lastmods == ["2021-08-14", "2019-01-01"]
+
+    # an identical stream leaves the file alone
+    with open(filepath, encoding="utf-8") as fp:
+        text = fp.read()
+    os.utime(filepath, ns=(0, 0))
+    with writer.stream(filepath) as fp:
+        fp.write(text)
+    assert os.stat(filepath).st_mtime_ns == 0
+    assert (writer.written, writer.unchanged) == (1, 1)
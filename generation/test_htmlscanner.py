@@ -0,0 +1,59 @@
+import glob
+import os
+
+import pytest
+
+import treeparser as tp
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+PAGES = sorted(
+    [
+        *glob.glob(os.path.join(REPO_DIR, "*.html")),
+        *glob.glob(os.path.join(REPO_DIR, "templates", "*.html")),
+    ]
+)
+# each is tokenized the same by both backends; some by falling back
+DOCUMENTS = [
+    "<!DOCTYPE html><html><head><title>a &amp; b</title></head></html>",
+    "<p CLASS='x' hidden data-a=1 title=\"&lt;b&gt;\" e=''>text</p>",
+    "<div><br><img src=a.png alt=''/><br /><input x=y ></div>",
+    "<script>if (a < b && c) { x = '</div>'; }</script ><style></style>",
+    "<!-- note --><!--x--><p>1 < 2</p>",
+    "<p>fish &amp; chips &</p>tail &amp",
+    "<?xml version='1.0'?><p>pi</p>",
+    "<![CDATA[x]]><p>a</p>",
+    '<p title="unterminated>',
+    "<a href=foo/>x</a><a href=https://a.b/c?d=e&amp;f=g>y</a><a x=1 />",
+    "<!-- a -- b --><p>x</p>",
+    "text < more",
+]
+
+
+def summarize(parser: tp.TreeParser, text: str) -> tuple:
+    parser.feed(text)
+    tree = parser.finalize()
+    ids = {objectid: (node.tag, node.attrs) for objectid, node in tree.id_idx.items()}
+    return tp.TreePrinter().mk_doc(tree.root), ids, len(tree.parent_idx)
+
+
+@pytest.mark.parametrize("text", DOCUMENTS)
+def test_same_as_htmlparser(text):
+    assert summarize(tp.TreeParser(), text) == summarize(tp.TreeParser(False), text)
+
+
+def test_fallbacks():
+    parser = tp.TreeParser()
+    for text in DOCUMENTS:
+        summarize(parser, text)
+    assert (parser.scanned, parser.fallbacks) == (5, 7)
+
+
+@pytest.mark.parametrize("filepath", PAGES, ids=os.path.basename)
+def test_repo_pages(filepath):
+    with open(filepath, encoding="utf-8") as fp:
+        text = fp.read()
+    parser = tp.TreeParser()
+    assert summarize(parser, text) == summarize(tp.TreeParser(False), text)
+    # generated pages don't need the fallback
+    if os.path.dirname(filepath) != os.path.join(REPO_DIR, "templates"):
+        assert parser.scanned == 1
@@ -0,0 +1,48 @@
+import os
+
+import outputwriter
+
+
+def test_skips_unchanged(tmp_path):
+    filepath = str(tmp_path / "page.html")
+    writer = outputwriter.OutputWriter(fsync_batch=2)
+    assert writer.write(filepath, "<p>a</p>\n")
+    assert writer.write(str(tmp_path / "other.html"), "x")
+    # synced once the batch is full
+    assert writer.pending == []
+    os.utime(filepath, ns=(0, 0))
+
+    assert not writer.write(filepath, "<p>a</p>\n")
+    assert os.stat(filepath).st_mtime_ns == 0
+    # same size, different content
+    assert writer.write(filepath, "<p>b</p>\n")
+    # no file is held open until the sync
+    assert writer.pending == [filepath]
+    with open(filepath, encoding="utf-8") as fp:
+        assert fp.read() == "<p>b</p>\n"
+
+    assert (writer.written, writer.unchanged) == (3, 1)
+    assert writer.bytes_written == 2 * len(f"<p>a</p>{os.linesep}") + 1
+    writer.finish()
+    assert writer.pending == [] and writer.written == 0
+    assert sorted(os.listdir(tmp_path)) == ["other.html", "page.html"]
+
+    # a file removed before the sync is skipped
+    writer.write(str(tmp_path / "gone.html"), "x")
+    os.remove(tmp_path / "gone.html")
+    writer.sync()
+    assert writer.pending == []
+
+
+def test_background_writer(tmp_path):
+    writer = outputwriter.BackgroundWriter(fsync_batch=0, max_queued=2)
+    sizes = []
+    for idx in range(5):
+        filepath = str(tmp_path / f"{idx}.html")
+        writer.write(filepath, "x" * idx)
+        # runs once the file is written
+        writer.submit(lambda path=filepath: sizes.append(os.path.getsize(path)))
+        assert len(writer.queued) <= 2
+    writer.drain()
+    assert sizes == [0, 1, 2, 3, 4]
+    assert writer.written == 5
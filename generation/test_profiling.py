@@ -0,0 +1,41 @@
+import json
+
+import profiling
+
+
+def test_spans_and_trace(tmp_path):
+    profiler = profiling.enable(sample=False)
+    try:
+        with profiling.stage("transform"):
+            with profiling.span("transform_content", page="a.html"):
+                with profiling.span("write"):
+                    pass
+    finally:
+        profiling.disable()
+
+    stacks = [span.stack for span in profiler.spans]
+    assert stacks == [
+        ("transform", "transform_content", "write"),
+        ("transform", "transform_content"),
+        ("transform",),
+    ]
+
+    filepath = tmp_path / "trace.json"
+    profiler.write_trace(str(filepath))
+    events = json.loads(filepath.read_text())["traceEvents"]
+    complete = [event for event in events if event["ph"] == "X"]
+    assert [event["name"] for event in complete] == [
+        "write",
+        "transform_content",
+        "transform",
+    ]
+    assert complete[1]["args"] == {"page": "a.html"}
+    # spans nest in time
+    assert complete[2]["ts"] <= complete[1]["ts"]
+    assert complete[1]["dur"] <= complete[2]["dur"]
+
+
+def test_disabled_is_noop():
+    with profiling.stage("listings"):
+        with profiling.span("generate_content_listing"):
+            pass
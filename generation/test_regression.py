@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+
+import profiling  # noqa: E402
+import regression  # noqa: E402
+
+
+def test_compare():
+    baseline = {
+        "corpus": regression.CORPUS_PARAMS,
+        "wall_seconds": 2.0,
+        "bytes_written": 1000,
+        "stages": {"parse": 1.0, "validations": 0.001},
+    }
+    current = {
+        "corpus": regression.CORPUS_PARAMS,
+        "wall_seconds": 2.1,
+        "bytes_written": 1000,
+        # tiny stages are noise, even at +100%
+        "stages": {"parse": 1.0, "validations": 0.002},
+    }
+    report, passed = regression.compare(baseline, current, threshold=0.10)
+    assert passed and report.endswith("PASS")
+
+    current["bytes_written"] = 1200
+    current["stages"]["parse"] = 0.5
+    report, passed = regression.compare(baseline, current, threshold=0.10)
+    assert not passed
+    assert "REGRESSION" in report and "improved" in report
+
+
+def test_noise_floor():
+    baseline = {"wall_seconds": 2.0, "stages": {"pages": 1.0}}
+    current = {"wall_seconds": 2.0, "stages": {"pages": 1.2}}
+    report, passed = regression.compare(baseline, current, threshold=0.10)
+    assert not passed
+    # within the spread of the runs, a stage's change is noise
+    current["spread"] = {"stage:pages": 0.3}
+    report, passed = regression.compare(baseline, current, threshold=0.10)
+    assert passed
+
+
+def test_summarize():
+    runs = [
+        {"wall_seconds": wall, "peak_rss_kb": 1, "bytes_written": 10, "stages": {}}
+        for wall in (3.0, 1.0, 1.2)
+    ]
+    runs[0]["stages"]["pages"] = 2.0
+    runs[1]["stages"]["pages"] = 0.5
+    runs[2]["stages"]["pages"] = 0.6
+    results = regression.summarize(runs)
+    # the slow run doesn't move the median
+    assert results["wall_seconds"] == 1.2
+    assert results["stages"] == {"pages": 0.6}
+    assert results["spread"] == {"wall_seconds": 2.0, "stage:pages": 1.5}
+    with pytest.raises(ValueError):
+        regression.run(repeat=2)
+
+
+def test_stage_times():
+    spans = []
+    for stack, duration in [
+        (("pages", "content"), 0.5),
+        (("pages", "content"), 0.25),
+        (("pages", "listing"), 0.125),
+        (("pages",), 1.0),
+        (("validations", "parse"), 0.5),
+        (("validations",), 0.75),
+    ]:
+        span = profiling.Span(stack[-1], stack, {})
+        span.duration = duration
+        spans.append(span)
+    assert regression.stage_times(spans) == {
+        "pages/content": 0.75,
+        "pages/listing": 0.125,
+        "pages": 1.0,
+        "validations": 0.75,
+    }
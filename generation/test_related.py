@@ -0,0 +1,87 @@
+import related
+
+
+def test_related(tmp_path):
+    cache_path = str(tmp_path / "related.json")
+    documents = {
+        "a": ["Moral imperative, and freedom\n"],
+        "b": ["moral choice and freedom\n"],
+        "c": ["a database parser\n"],
+        "d": ["the database parser, and freedom\n"],
+    }
+    posts = related.RelatedPosts(cache_path, count=2)
+    # c only shares terms with d; d is as related to a as to b, and ties
+    # go to the first document
+    assert posts.update(documents) == {
+        "a": ["b", "d"],
+        "b": ["a", "d"],
+        "c": ["d"],
+        "d": ["c", "a"],
+    }
+    assert posts.tokenized == 4
+    posts.save()
+
+    # cached counts are reused; only the new document is tokenized
+    posts = related.RelatedPosts.load(cache_path, count=1)
+    documents["e"] = ["a parser of database trees\n"]
+    assert posts.update(documents)["c"] == ["e"]
+    assert posts.tokenized == 1
+
+
+def test_incremental_rows(tmp_path):
+    documents = {
+        "a": ["moral imperative, and freedom\n"],
+        "b": ["moral choice and freedom\n"],
+        "c": ["a database parser\n"],
+        "d": ["the database parser, and freedom\n"],
+    }
+    posts = related.RelatedPosts(str(tmp_path / "related.json"), count=2)
+    posts.update(documents)
+    assert posts.computed == 4
+
+    # with the same terms, no idf changes: only the row of the changed
+    # document is recomputed, and its entries in the other rows
+    documents["c"] = ["a database parser, parser\n"]
+    posts.update(documents)
+    assert posts.computed == 1 and posts.tokenized == 1
+
+    # new terms change the weights of the documents that have them
+    documents["c"] = ["a moral imperative\n"]
+    result = posts.update(documents)
+    assert posts.computed == 4
+    assert result["c"] == ["a", "b"]
+    assert posts.rows["a"]["c"] == posts.rows["c"]["a"]
+
+    # a new document changes every idf; all rows are recomputed
+    documents["e"] = ["a parser of database trees\n"]
+    posts.update(documents)
+    assert posts.computed == 5
+
+
+def test_incremental_is_exact(tmp_path):
+    documents = {
+        key: [f"{text}\n"]
+        for key, text in [
+            ("a", "moral imperative and freedom of choice"),
+            ("b", "moral choice, freedom and the database"),
+            ("c", "a database parser of trees"),
+            ("d", "the database parser, and freedom"),
+            ("e", "parser trees and the freedom of trees"),
+            ("f", "imperative programming of a parser"),
+        ]
+    }
+    posts = related.RelatedPosts(str(tmp_path / "related.json"), count=3)
+    posts.update(documents)
+
+    edits = [
+        ("c", "a moral database of choice"),
+        ("a", "imperative trees"),
+        ("f", "imperative programming of a parser, a parser of parsers"),
+        ("g", "freedom of the database parser"),
+        ("b", "programming trees of choice"),
+    ]
+    for key, text in edits:
+        documents[key] = [f"{text}\n"]
+        fresh = related.RelatedPosts(str(tmp_path / "fresh.json"), count=3)
+        assert posts.update(documents) == fresh.update(documents)
+        assert posts.rows == fresh.rows
@@ -0,0 +1,67 @@
+import json
+import os
+
+import outputwriter
+import searchindex
+import textparser
+
+
+def read_json(dirpath, filename):
+    with open(os.path.join(dirpath, filename), encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def test_tokenize():
+    lines = ["The Layers of_Freedom [1]\n", "see https://a.b/c-d\n"]
+    terms = "the layers of freedom 1 see https a b c d".split()
+    assert textparser.tokenize(lines) == terms
+
+
+def test_index(tmp_path):
+    index_dir = str(tmp_path)
+    shard_dir = str(tmp_path / "shards")
+    writer = outputwriter.OutputWriter(fsync_batch=0)
+    index = searchindex.SearchIndex(index_dir, prefix_len=2)
+    index.add("a.html", "A", ["moral", "imperative", "moral"])
+    index.add("b.html", "B", ["moral", "freedom"])
+    index.prune()
+    index.write(writer)
+    assert read_json(shard_dir, "mo.json") == {"moral": [[0, 0, 2], [1, 0]]}
+    assert read_json(index_dir, "docs.json") == {
+        "docs": [["a.html", "A"], ["b.html", "B"]],
+        "prefix": 2,
+        "shards": ["fr", "im", "mo"],
+    }
+
+    # only the shards of changed postings are written
+    writer.written = 0
+    index.add("b.html", "B", ["moral", "freedoms"])
+    index.write(writer)
+    assert writer.written == 1 and writer.unchanged == 1
+    assert "freedoms" in read_json(shard_dir, "fr.json")
+
+    # ids are kept by the next build; removed pages are pruned
+    index = searchindex.SearchIndex(index_dir, prefix_len=2)
+    index.add("b.html", "B", ["imperative"])
+    index.add("c.html", "C", ["moral"])
+    index.prune()
+    index.write(writer)
+    index.remove_stale()
+    # a.html's id is only free once pruned
+    docs = read_json(index_dir, "docs.json")["docs"]
+    assert docs == [None, ["b.html", "B"], ["c.html", "C"]]
+    assert read_json(shard_dir, "im.json") == {"imperative": [[1, 0]]}
+    assert sorted(os.listdir(index_dir)) == ["docs.json", "shards"]
+    assert sorted(os.listdir(shard_dir)) == ["im.json", "mo.json"]
+
+
+def test_docs_prefix(tmp_path):
+    # a shard of terms starting with "docs" doesn't overwrite docs.json
+    index_dir = str(tmp_path)
+    writer = outputwriter.OutputWriter(fsync_batch=0)
+    index = searchindex.SearchIndex(index_dir, prefix_len=4)
+    index.add("a.html", "A", ["docs", "documents"])
+    index.write(writer)
+    index.remove_stale()
+    assert read_json(index_dir, "docs.json")["shards"] == ["docs", "docu"]
+    assert read_json(str(tmp_path / "shards"), "docs.json") == {"docs": [[0, 0]]}
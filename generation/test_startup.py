@@ -0,0 +1,64 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+
+SELF_PATH = os.path.dirname(os.path.realpath(__file__))
+# cumulative import time of pagegen, in microseconds; with everything
+# imported eagerly this was ~180ms, lazily ~30ms. generous since machines vary
+IMPORT_BUDGET_US = 100_000
+# only imported by the stages that use them
+BUILD_MODULES = {"jinja2", "textparser", "criticalcss", "assets"}
+LAZY_MODULES = BUILD_MODULES | {"yaml", "treeparser", "validations", "cProfile"}
+
+
+def run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SELF_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_times(stderr: str) -> dict:
+    """
+    parse -X importtime output into module -> cumulative microseconds
+    """
+    times = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_budget():
+    times = import_times(run_python("import pagegen").stderr)
+    assert times["pagegen"] < IMPORT_BUDGET_US
+    assert not LAZY_MODULES & set(times)
+
+
+def test_validate_skips_build_modules(site_builder, tmp_path):
+    corpus_dir, builder = site_builder
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.build()
+
+    code = "; ".join(
+        [
+            "import pagegen",
+            f"pagegen.TEMPLATE_DIR = {os.path.join(corpus_dir, 'templates')!r}",
+            f"pagegen.OUTPUT_DIR = {corpus_dir!r}",
+            f"pagegen.CONTENT_DIR = {os.path.join(corpus_dir, 'content')!r}",
+            f"pagegen.INDEX_FILE = {os.path.join(corpus_dir, 'index.html')!r}",
+            f"pagegen.TREE_CACHE_DIR = {str(tmp_path / 'tree-cache')!r}",
+            f"pagegen.validate({corpus_dir!r})",
+        ]
+    )
+    times = import_times(run_python(code).stderr)
+    assert "validations" in times
+    assert not BUILD_MODULES & set(times)
@@ -0,0 +1,85 @@
+import os
+
+import jinja2
+import pytest
+
+import templatetrees
+import treeparser as tp
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "..", "templates")
+TEMPLATES = {
+    "head.html": (
+        "<!DOCTYPE html><html><head><title>{{ title }}</title></head><body>"
+        '<div id="nav">nav</div><div id="main">before {% block content %}'
+        '{% endblock %} after</div><div id="foot"><p id="nav">dup</p></div>'
+        "</body></html>"
+    ),
+    "page.html": (
+        '{% extends "head.html" %}{% block content %}{{ body }}'
+        '<p id="nav">in content</p>{% endblock %}'
+    ),
+}
+PAGES = [
+    {"title": "a", "body": "text <br> more"},
+    {"title": "a", "body": "<img src='x.png'/>"},
+    {"title": "b", "body": ""},
+]
+
+
+def parse(text: str) -> tp.Tree:
+    parser = tp.TreeParser()
+    parser.feed(text)
+    return parser.finalize()
+
+
+def summarize(tree: tp.Tree) -> tuple:
+    ids = {objectid: (node.tag, node.attrs) for objectid, node in tree.id_idx.items()}
+    return tp.TreePrinter().mk_doc(tree.root), ids, len(tree.parent_idx)
+
+
+def check_instantiate(env: jinja2.Environment, template_id: str, pages: list):
+    template_trees = templatetrees.TemplateTrees(env, parse)
+    for variables in pages:
+        whole = parse(env.get_template(template_id).render(**variables))
+        tree = template_trees.instantiate(template_id, variables)
+        assert summarize(tree) == summarize(whole)
+    return template_trees
+
+
+def test_instantiate_matches_whole_page():
+    env = jinja2.Environment(loader=jinja2.DictLoader(TEMPLATES))
+    template_trees = check_instantiate(env, "page.html", PAGES)
+    # the title is a layout variable
+    assert len(template_trees.layouts) == 2
+    assert (template_trees.instantiated, template_trees.parsed) == (3, 0)
+
+
+@pytest.mark.parametrize(
+    "template_id", ["content-image.jinja.html", "content-no-image.jinja.html"]
+)
+def test_instantiate_site_templates(template_id):
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR))
+    page = {
+        "title": "t",
+        "date": "2020-01-01",
+        "body": "<p>one</p>\n<p>two <a href='#x'>x</a></p>",
+        "image_location": "img/x.jpg",
+        "image_attribution": "someone",
+        "is_content_page": True,
+    }
+    template_trees = check_instantiate(env, template_id, [page])
+    assert template_trees.instantiated == 1
+
+
+def test_clones_are_copy_on_write():
+    env = jinja2.Environment(loader=jinja2.DictLoader(TEMPLATES))
+    template_trees = templatetrees.TemplateTrees(env, parse)
+    first = template_trees.instantiate("page.html", PAGES[0])
+    second = template_trees.instantiate("page.html", PAGES[0])
+    (layout,) = template_trees.layouts.values()
+    expected = tp.TreePrinter().mk_doc(layout.tree.root)
+
+    first.find_node_with_id("foot").set_attr("class", "changed")
+    assert 'class="changed"' in tp.TreePrinter().mk_doc(first.root)
+    assert 'class="changed"' not in tp.TreePrinter().mk_doc(second.root)
+    assert tp.TreePrinter().mk_doc(layout.tree.root) == expected
@@ -1,4 +1,7 @@
-from textparser import enrich_links, enrich_subheadings
+import random
+import re
+
+from textparser import enrich_links, enrich_subheadings, find_urls
 
 
 def test():
@@ -12,3 +15,22 @@ def test():
     expected = ["foo", "<h3>subheading</h3>", "bar"]
 
     assert lines == expected, "enrich subheadings result doesn't match"
+
+
+def test_find_urls():
+    # the pattern enrich_links used to match with
+    pattern = re.compile(
+        r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
+    )
+    parts = ["http://", "https://", "www.", ".", "a", "9", "(", ")", "_", "/", " "]
+    parts += ["é", "½", "?", "#", "x.io", "a" * 250]
+    rng = random.Random(0)
+    lines = ["".join(rng.choices(parts, k=rng.randint(1, 20))) for _ in range(5000)]
+    # hosts about the length limit
+    lines += [
+        f"http://{prefix}{'h' * n}.com/"
+        for prefix in ("", "www.")
+        for n in (255, 256, 257)
+    ]
+    for line in lines:
+        assert list(find_urls(line)) == [m.span() for m in pattern.finditer(line)]
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+import pytest
+
+import transformrules
+import treeparser as tp
+
+Page = namedtuple("Page", "tree section")
+HTML = (
+    "<html><head><link rel='icon' href='a.ico'></head><body>"
+    '<ul id="nav"><li id="nav-item-essays" class="item">e</li>'
+    '<li id="nav-item-poetry" class="item">p</li></ul>'
+    '<div id="main"><a href="1.html">1</a><p><a href="2.html">2</a></p></div>'
+    "<a href='3.html'>3</a></body></html>"
+)
+
+
+def make_page(section="essays"):
+    parser = tp.TreeParser()
+    parser.feed(HTML)
+    return Page(parser.finalize(), section)
+
+
+def test_matches():
+    rules = transformrules.RuleSet()
+    seen = []
+    record = lambda name: lambda node, page, nth: seen.append(
+        (name, nth, node.get_attr("id") or node.get_attr("href") or node.node.tag)
+    )
+    rules.add("id", record("id"), id="nav-item-{section}")
+    rules.add("tag", record("tag"), tag="head")
+    rules.add("class", record("class"), cls="item")
+    rules.add("selector", record("selector"), selector="#main a, link[rel~=icon]")
+    rules.add("never", record("never"), tag="a", when=lambda page: False)
+    rules.apply(make_page())
+
+    assert seen == [
+        ("id", 0, "nav-item-essays"),
+        ("tag", 0, "head"),
+        ("class", 0, "nav-item-essays"),
+        ("class", 1, "nav-item-poetry"),
+        ("selector", 0, "a.ico"),
+        ("selector", 1, "1.html"),
+        ("selector", 2, "2.html"),
+    ]
+    hits = {rule.name: rule.hits for rule in rules.rules}
+    assert hits == {"id": 1, "tag": 1, "class": 2, "selector": 3, "never": 0}
+    assert "matching: 1 pages" in rules.report()
+
+
+def test_inserted_nodes_are_matched_by_later_rules():
+    rules = transformrules.RuleSet()
+
+    def insert(node, page, nth):
+        link = tp.ClosedNode("a", attrs=[("href", "4.html")])
+        node.insert_child(link)
+        return [link]
+
+    rules.add("activate", lambda node, page, nth: node.add_class("active"), id="nav")
+    # matching is done before any action runs
+    rules.add("insert", insert, selector="ul.active")
+    rules.add("rewrite", lambda node, page, nth: node.set_attr("href", "x"), tag="a")
+    page = make_page()
+    rules.apply(page)
+
+    html = tp.TreePrinter().mk_doc(page.tree.root)
+    assert [rule.hits for rule in rules.rules] == [1, 0, 3]
+    assert html.count('href="x"') == 3
+
+    rules = transformrules.RuleSet()
+    rules.add("insert", insert, id="nav")
+    rules.add("rewrite", lambda node, page, nth: node.set_attr("href", "x"), tag="a")
+    page = make_page()
+    rules.apply(page)
+    assert [rule.hits for rule in rules.rules] == [1, 4]
+    assert 'href="4.html"' not in tp.TreePrinter().mk_doc(page.tree.root)
+
+
+def test_one_match_per_rule():
+    with pytest.raises(ValueError):
+        transformrules.RuleSet().add("r", print, id="a", tag="b")
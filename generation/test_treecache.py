@@ -0,0 +1,40 @@
+import os
+
+import treecache
+import treeparser as tp
+
+HTML = (
+    "<!DOCTYPE html><html><head><meta charset='utf-8'><title>t</title></head>"
+    '<body><!-- note --><div id="main"><p>a <br> b<img src="x.png"/></p>'
+    '<a id="link" href="#">c</a></div></body></html>'
+)
+
+
+def test_roundtrip():
+    parser = tp.TreeParser()
+    parser.feed(HTML)
+    tree = parser.finalize()
+    loaded = treecache.decode(treecache.encode(tree))
+
+    printer = tp.TreePrinter()
+    assert printer.mk_doc(loaded.root) == printer.mk_doc(tree.root)
+    assert sorted(loaded.id_idx) == ["link", "main"]
+    link = loaded.find_node_with_id("link")
+    assert loaded.get_parent(link.node) is loaded.id_idx["main"]
+    assert len(loaded.parent_idx) == len(tree.parent_idx)
+
+
+def test_cache_hits_and_eviction(tmp_path):
+    cache = treecache.TreeCache(str(tmp_path), max_bytes=1)
+    parser = tp.TreeParser()
+    cache.parse(HTML, parser)
+    tree = cache.parse(HTML, parser)
+    assert (cache.hits, cache.misses) == (1, 1)
+    # trees loaded from the cache are independent copies
+    tree.find_node_with_id("main").set_attr("class", "x")
+    assert 'class="x"' not in tp.TreePrinter().mk_doc(cache.parse(HTML, parser).root)
+
+    cache.parse(HTML.replace("t</title>", "u</title>"), parser)
+    assert len(os.listdir(tmp_path)) == 2
+    cache.evict()
+    assert len(os.listdir(tmp_path)) == 0
@@ -27,3 +27,31 @@ def test_malformed_html_missing_starttag():
     with pytest.raises(tp.MissingStartTag):
         parser.feed("<html>foo</body></html>")
         parser.finalize()
+
+
+def test_comment_roundtrip():
+    text = '<p><!-- a class="navbar-brand"--></p>'
+    parser = tp.TreeParser()
+    parser.feed(text)
+    tree = parser.finalize()
+    assert tp.TreePrinter().mk_doc(tree.get_root(as_qmnode=False)) == text
+
+
+def test_text_nodes_share_storage():
+    parser = tp.TreeParser()
+    parser.feed("<ul>\n  <li>a</li>\n  <li>b</li>\n</ul>")
+    first = parser.finalize()
+    parser.feed("<p>\n  <b>c</b>\n  </p>")
+    second = parser.finalize()
+    runs = [
+        node.data
+        for tree in (first, second)
+        for node in tp.find_nodes_with_fn(
+            lambda node: isinstance(node, tp.DataNode) and node.data == "\n  ",
+            tree.root,
+        )
+    ]
+    assert len(runs) == 4 and all(run is runs[0] for run in runs)
+    # data nodes don't allocate per node fields
+    data = tp.find_nodes_with_fn(lambda node: isinstance(node, tp.DataNode), first.root)
+    assert vars(data[0]) == {"data": data[0].data}
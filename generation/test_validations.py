@@ -0,0 +1,43 @@
+import pytest
+
+import treeparser as tp
+import validations
+
+NAV = (
+    '<html><body><nav><a id="nav-item-essays" class="{cls}" href="e.html">e</a>'
+    '<a id="nav-item-poetry" class="item" href="{href}">p</a></nav>'
+    "<p>page</p></body></html>"
+)
+
+
+def write_page(tmp_path, name: str, cls: str = "item", href: str = "p.html"):
+    filepath = str(tmp_path / name)
+    text = NAV.format(cls=cls, href=href)
+    with open(filepath, "w") as fp:
+        fp.write(text)
+    parser = tp.TreeParser()
+    parser.feed(text)
+    return filepath, parser.finalize()
+
+
+def test_page_checks(tmp_path):
+    checks = validations.PageChecks(*write_page(tmp_path, "index.html"))
+    checks.check_page(*write_page(tmp_path, "a.html", cls="item active"))
+    checks.check_page(*write_page(tmp_path, "b.html", cls="active item"))
+    assert checks.pages == 2
+
+    with pytest.raises(validations.ValidationError):
+        checks.check_page(*write_page(tmp_path, "c.html", href="q.html"))
+    with pytest.raises(validations.ValidationError):
+        checks.check_page(*write_page(tmp_path, "d.html", cls="item other"))
+
+    filepath, tree = write_page(tmp_path, "e.html")
+    open(filepath, "w").close()
+    with pytest.raises(validations.ValidationError):
+        checks.check_page(filepath, tree)
+
+
+def test_unique_filenames():
+    validations.check_unique_filenames({"a": ["1.html", "2.html"], "b": ["3.html"]})
+    with pytest.raises(validations.ValidationError):
+        validations.check_unique_filenames({"a": ["1.html"], "b": ["1.html"]})
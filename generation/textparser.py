@@ -2,8 +2,27 @@
 handle all the custom text transformations to convert
 text content into
 """
+
 import re
-from typing import List
+from typing import Iterator, List, Tuple
+
+# a search term; letters and digits
+TERM_PATTERN = re.compile(r"[^\W_]+")
+# ascii characters that separate terms
+ASCII_SEPARATORS = str.maketrans(
+    {chr(code): " " for code in range(128) if not chr(code).isalnum()}
+)
+
+# urls are linked as matched by the pattern (source:
+# https://stackoverflow.com/a/3809435)
+#   https?://(www\.)?[host]{1,256}\.[tld]{1,6}\b[path]*
+# which is matched by find_urls, rather than by backtracking over the whole
+# pattern. These are its parts; each is a run of a single character class,
+# so can't backtrack, but for the tld, which backtracks at most 6 characters
+URL_SCHEME = re.compile(r"https?://")
+URL_HOST = re.compile(r"[-a-zA-Z0-9@:%._\+~#=]{0,256}")
+URL_TLD = re.compile(r"\.[a-zA-Z0-9()]{1,6}\b")
+URL_PATH = re.compile(r"[-a-zA-Z0-9()@:%_\+.~#?&/=]*")
 
 
 def insert_footnote_links(lines: List[str]) -> List[str]:
@@ -72,14 +91,57 @@ def insert_footnote_links(lines: List[str]) -> List[str]:
     return lines
 
 
+def has_domain(line: str, start: int) -> bool:
+    """
+    whether a domain starts at `start`, i.e. 1-256 host characters, then
+    a tld
+    """
+    # the dot is a host character too, so it's in the run, unless it's
+    # the 257th character
+    end = URL_HOST.match(line, start).end()
+    # a tld's boundary is at most 7 characters on from its dot
+    match = URL_TLD.search(line, start + 1, end + 8)
+    return match is not None and match.start() <= end
+
+
+def match_url(line: str, host: int) -> int:
+    """
+    return the end of the url whose host starts at `host`, i.e. after its
+    scheme, or 0 if there's none
+    """
+    # the pattern prefers a host after www., but the url ends at the same
+    # place either way; www. only makes a difference to a 256 character host
+    if not has_domain(line, host):
+        if not (line.startswith("www.", host) and has_domain(line, host + 4)):
+            return 0
+    # the domain is made of path characters, so the path runs from the host
+    return URL_PATH.match(line, host).end()
+
+
+def find_urls(line: str) -> Iterator[Tuple[int, int]]:
+    """
+    yield (start, end) of the urls in `line`, in order; the same as the
+    spans of re.finditer with the url pattern, in linear time.
+    A domain is looked for after each http(s):// that isn't in a url.
+    It's at most 256 characters on, and ends before the next scheme, since
+    / isn't a host character; so each character is looked at a bounded
+    number of times
+    """
+    scheme = URL_SCHEME.search(line)
+    while scheme:
+        end = match_url(line, scheme.end())
+        if end:
+            yield scheme.start(), end
+            scheme = URL_SCHEME.search(line, end)
+        else:
+            scheme = URL_SCHEME.search(line, scheme.start() + 1)
+
+
 def enrich_links(lines: List[str]) -> List[str]:
     """
     convert all http(s) text to self link
     i.e. foo bar https... car -> foo bar <a href="#https...">https...</a>
     """
-    # url regex pattern source: https://stackoverflow.com/a/3809435
-    URL_PATTERN = r"https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
-
     lineidx = 0
     while lineidx < len(lines):
         line = lines[lineidx]
@@ -89,8 +151,7 @@ def enrich_links(lines: List[str]) -> List[str]:
         prevend = 0
         # collect all chunks
         bucket = []
-        for match in re.finditer(URL_PATTERN, line):
-            start, end = match.start(), match.end()
+        for start, end in find_urls(line):
             # print(f'match found: {line[start:end]}')
             # append content before match
             bucket.append(line[prevend:start])
@@ -170,3 +231,15 @@ def text_to_html(lines: List[str]) -> str:
     lines = enrich_subheadings(lines)
     # call this last; all the rest manipulate text as unmarked text
     return lines_to_chunks(lines)
+
+
+def tokenize(lines: List[str]) -> List[str]:
+    """
+    split text content into lower case terms, for the search index;
+    call before text_to_html, which modifies `lines`
+    """
+    text = "".join(lines).lower()
+    if text.isascii():
+        # same terms as TERM_PATTERN, several times faster
+        return text.translate(ASCII_SEPARATORS).split()
+    return TERM_PATTERN.findall(text)
@@ -0,0 +1,243 @@
+"""
+declarative transform rules, applied in a single traversal
+
+Each transform of a generated page is a rule: a match, i.e. an id, tag,
+class or css selector, and an action called with every matching node.
+Previously each transform searched the tree on its own, so the number of
+traversals per page grew with the number of transforms.
+
+A RuleSet walks a tree once, matching every element against all its rules;
+rules are indexed by the rightmost part of their selector (id, class or
+tag), so an element is only checked against rules that could match it.
+Matching is done before any action runs. Actions then run rule by rule,
+in the order the rules were added, so an action sees the changes of the
+rules before it. An action may return nodes it inserted; these are matched
+against the rules after it.
+
+Pages are namedtuples with at least a `tree` field; matches are formatted
+with the page's fields, e.g. id="nav-item-{section}".
+Selectors are the subset of css supported by criticalcss.
+"""
+import time
+from collections import defaultdict
+from typing import Callable, List, Optional
+
+import treeparser
+from criticalcss import (
+    Element,
+    UnsupportedSelector,
+    is_element,
+    parse_selector,
+    selector_matches,
+    split_toplevel,
+)
+
+
+class Rule:
+    """
+    `action(node: QMNode, page, nth: int)` is called with the `nth` matching
+    node of a page, if `when(page)`; returns inserted nodes, if any
+    """
+
+    def __init__(
+        self,
+        name: str,
+        action: Callable,
+        selector: str,
+        when: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.action = action
+        self.selector = selector
+        self.when = when
+        # totals across pages, for the report
+        self.hits = 0
+        self.seconds = 0.0
+
+
+def to_selector(
+    objectid: str = None, tag: str = None, cls: str = None, selector: str = None
+) -> str:
+    """
+    return the selector for exactly one of the match arguments
+    """
+    given = [arg for arg in (objectid, tag, cls, selector) if arg is not None]
+    if len(given) != 1:
+        raise ValueError("a rule matches exactly one of id, tag, cls or selector")
+    if objectid is not None:
+        return f"[id='{objectid}']"
+    if tag is not None:
+        return tag
+    if cls is not None:
+        return f"[class~='{cls}']"
+    return selector
+
+
+def index_key(compound) -> tuple:
+    """
+    return the index key of the rightmost `compound` of a selector
+    """
+    if compound.ids:
+        return ("id", compound.ids[0])
+    if compound.classes:
+        return ("class", compound.classes[0])
+    for attr, op, val in compound.attrs:
+        if attr == "id" and op == "=":
+            return ("id", val)
+        if attr == "class" and op == "~=":
+            return ("class", val)
+    if compound.tag not in (None, "*"):
+        return ("tag", compound.tag)
+    if compound.attrs:
+        return ("attr", compound.attrs[0][0])
+    return ("any", None)
+
+
+class RuleSet:
+    """
+    ordered rules, applied to a tree in one traversal
+    """
+
+    def __init__(self):
+        self.rules: List[Rule] = []
+        # time spent matching, across pages
+        self.match_seconds = 0.0
+        self.pages = 0
+        # formatted selector text -> [parts]
+        self._selectors: dict = {}
+
+    def add(
+        self,
+        name: str,
+        action: Callable,
+        id: str = None,
+        tag: str = None,
+        cls: str = None,
+        selector: str = None,
+        when: Callable = None,
+    ):
+        """
+        add a rule; it runs after the rules already added
+        """
+        self.rules.append(Rule(name, action, to_selector(id, tag, cls, selector), when))
+
+    def compile(self, text: str) -> list:
+        """
+        return parsed selectors of a comma separated selector list
+        """
+        if text not in self._selectors:
+            try:
+                self._selectors[text] = [
+                    parse_selector(part) for part in split_toplevel(text, ",")
+                ]
+            except UnsupportedSelector:
+                raise ValueError(f"unsupported selector: {text}")
+        return self._selectors[text]
+
+    def build_index(self, rules: list, page: tuple) -> dict:
+        """
+        return key -> [(position of rule, parts)] for `rules`
+        """
+        index = defaultdict(list)
+        for pos, rule in rules:
+            for parts in self.compile(rule.selector.format(**page._asdict())):
+                index[index_key(parts[-1])].append((pos, parts))
+        return dict(index)
+
+    def match(
+        self, node: treeparser.Node, parent: Optional[Element], index: dict, hits: dict
+    ):
+        """
+        match `node` and its descendents, in document order, against `index`;
+        appends matching nodes to `hits`, rule position -> [node]
+        """
+        # stack of (node, parent element)
+        stack = [(node, parent)]
+        # parent element -> its last child element seen
+        prev_siblings = {}
+        while stack:
+            node, parent = stack.pop()
+            if not is_element(node):
+                stack.extend((child, parent) for child in reversed(node.children))
+                continue
+            elem = Element(node, parent, prev_siblings.get(parent))
+            prev_siblings[parent] = elem
+
+            keys = [("tag", node.tag), ("any", None)]
+            keys.extend(("attr", attr) for attr in elem.attrs)
+            if "id" in elem.attrs:
+                keys.append(("id", elem.attrs["id"]))
+            keys.extend(("class", classname) for classname in elem.classes)
+            matched = set()
+            for key in keys:
+                for pos, parts in index.get(key, ()):
+                    if pos in matched:
+                        continue
+                    if selector_matches(parts, len(parts) - 1, elem):
+                        matched.add(pos)
+                        hits[pos].append(node)
+            stack.extend((child, elem) for child in reversed(node.children))
+
+    def context(
+        self, tree: treeparser.Tree, node: treeparser.Node
+    ) -> Optional[Element]:
+        """
+        return the element of `node`'s parent, for matching nodes inserted into
+        `tree`; sibling combinators don't match across its ancestors
+        """
+        parent = tree.parent_idx.get(node)
+        if parent is None or not is_element(parent):
+            return None
+        return Element(parent, self.context(tree, parent), None)
+
+    def apply(self, page: tuple):
+        """
+        apply all rules to `page.tree`
+        """
+        tree = page.tree
+        rules = [
+            (pos, rule)
+            for pos, rule in enumerate(self.rules)
+            if rule.when is None or rule.when(page)
+        ]
+        start = time.perf_counter()
+        index = self.build_index(rules, page)
+        hits = defaultdict(list)
+        self.match(tree.root, None, index, hits)
+        self.match_seconds += time.perf_counter() - start
+        self.pages += 1
+
+        for pos, rule in rules:
+            nodes = hits[pos]
+            if not nodes:
+                continue
+            start = time.perf_counter()
+            inserted = []
+            for nth, node in enumerate(nodes):
+                # an earlier action may have copied a node shared with other trees
+                qmnode = treeparser.QMNode(tree.copies.get(node, node), tree)
+                inserted.extend(rule.action(qmnode, page, nth) or [])
+            rule.hits += len(nodes)
+            rule.seconds += time.perf_counter() - start
+
+            # match inserted nodes against the remaining rules
+            if inserted:
+                start = time.perf_counter()
+                later = self.build_index(
+                    [item for item in rules if item[0] > pos], page
+                )
+                for node in inserted:
+                    self.match(node, self.context(tree, node), later, hits)
+                self.match_seconds += time.perf_counter() - start
+
+    def report(self) -> str:
+        """
+        return per rule hit counts and timings
+        """
+        lines = [f"{'rule':<24} {'hits':>8} {'ms':>10}"]
+        for rule in self.rules:
+            lines.append(f"{rule.name:<24} {rule.hits:>8} {1000 * rule.seconds:>10.2f}")
+        lines.append(
+            f"matching: {self.pages} pages in {1000 * self.match_seconds:.2f}ms"
+        )
+        return "\n".join(lines)
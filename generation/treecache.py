@@ -0,0 +1,212 @@
+"""
+persistent cache of parsed trees
+
+construct_trees parses every page on every build, though most pages are
+byte-identical to the last build. Parsed trees are stored on disk, keyed by
+a hash of the html text, so unchanged pages are loaded rather than parsed.
+
+A tree is stored as the list of its nodes in document order, each a tuple of
+(kind, ...fields, number of children), plus the id index as node positions;
+this is serialized with marshal and compressed. The parent index is rebuilt
+on load. Loading is several times faster than parsing.
+
+Entries are files <cache_dir>/<hash>.tree. A hit refreshes the entry's
+mtime; when the cache exceeds its size cap, the least recently used
+entries are evicted.
+"""
+import hashlib
+import marshal
+import os
+import zlib
+from typing import Optional
+
+import treeparser as tp
+
+# part of the key; bump when the encoding changes
+FORMAT_VERSION = 1
+# zlib level; favours speed, the encoding compresses ~3x even at 1
+COMPRESS_LEVEL = 1
+
+# node kinds
+ROOT, UNDETERMINED, OPEN_CLOSED, CLOSED, DATA, COMMENT = range(6)
+
+# whitespace run -> the str shared by all loaded data nodes with that text
+_whitespace: dict = {}
+
+
+def encode(tree: tp.Tree) -> bytes:
+    """
+    serialize `tree`
+    """
+    records = []
+    # node -> position in records
+    positions = {}
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        positions[node] = len(records)
+        nchildren = len(node.children)
+        if isinstance(node, tp.RootNode):
+            record = (ROOT, node.doctype, nchildren)
+        elif isinstance(node, tp.DataNode):
+            record = (DATA, node.data)
+        elif isinstance(node, tp.CommentNode):
+            record = (COMMENT, node.comment)
+        elif isinstance(node, tp.ClosedNode):
+            record = (CLOSED, node.tag, tuple(node.attrs), node.closing_marker)
+        elif isinstance(node, tp.OpenClosedNode):
+            record = (OPEN_CLOSED, node.tag, tuple(node.attrs), nchildren)
+        else:
+            # standalone tags at the root are never coalesced
+            record = (UNDETERMINED, node.tag, tuple(node.attrs), nchildren)
+        records.append(record)
+        stack.extend(reversed(node.children))
+
+    ids = tuple((objectid, positions[node]) for objectid, node in tree.id_idx.items())
+    return zlib.compress(marshal.dumps((tuple(records), ids)), COMPRESS_LEVEL)
+
+
+def decode(blob: bytes) -> tp.Tree:
+    """
+    deserialize a tree serialized by `encode`
+    """
+    records, ids = marshal.loads(zlib.decompress(blob))
+    new = object.__new__
+    nodes = []
+    # stack of [node, number of children still to be read]
+    open_nodes = []
+    parent_idx = {}
+    for record in records:
+        kind = record[0]
+        # nodes are built without calling __init__, i.e. setting attributes
+        # directly; this is the bulk of the load time. Attributes are set
+        # one by one, in __init__'s order, so nodes of a class share their
+        # dict keys, rather than each holding a full dict
+        if kind == DATA:
+            node = new(tp.DataNode)
+            data = record[1]
+            if data.isspace() and len(_whitespace) < tp.MAX_SHARED_WHITESPACE:
+                # as in TreeParser, indentation runs are shared
+                data = _whitespace.setdefault(data, data)
+            node.data = data
+            nchildren = 0
+        elif kind == OPEN_CLOSED:
+            node = new(tp.OpenClosedNode)
+            node.tag = record[1]
+            node.attrs = list(record[2])
+            node.children = []
+            nchildren = record[3]
+        elif kind == CLOSED:
+            node = new(tp.ClosedNode)
+            node.closing_marker = record[3]
+            node.tag = record[1]
+            node.attrs = list(record[2])
+            node.children = []
+            nchildren = 0
+        elif kind == COMMENT:
+            node = new(tp.CommentNode)
+            node.comment = record[1]
+            nchildren = 0
+        elif kind == ROOT:
+            node = tp.RootNode()
+            node.doctype = record[1]
+            nchildren = record[2]
+        else:
+            node = new(tp.UndeterminedNode)
+            node.tag = record[1]
+            node.attrs = list(record[2])
+            node.children = []
+            nchildren = record[3]
+
+        if open_nodes:
+            parent = open_nodes[-1]
+            parent[0].children.append(node)
+            # children of the root aren't in the parent index
+            if parent[0] is not nodes[0]:
+                parent_idx[node] = parent[0]
+            parent[1] -= 1
+            if parent[1] == 0:
+                open_nodes.pop()
+        if nchildren:
+            open_nodes.append([node, nchildren])
+        nodes.append(node)
+
+    id_idx = {objectid: nodes[position] for objectid, position in ids}
+    return tp.Tree(nodes[0], id_idx, parent_idx)
+
+
+class TreeCache:
+    """
+    cache of parsed trees in `cache_dir`, capped at `max_bytes`
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # counts for the build summary
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, text: str) -> str:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+        digest.update(str(FORMAT_VERSION).encode())
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.tree")
+
+    def load(self, filepath: str) -> Optional[tp.Tree]:
+        """
+        return the tree stored at `filepath`; None if missing or unreadable
+        """
+        try:
+            with open(filepath, "rb") as fp:
+                tree = decode(fp.read())
+        except FileNotFoundError:
+            return None
+        except (ValueError, EOFError, TypeError, IndexError, zlib.error):
+            # e.g. a truncated entry; it's overwritten
+            return None
+        # mark as recently used
+        os.utime(filepath)
+        return tree
+
+    def store(self, filepath: str, tree: tp.Tree):
+        # write then rename, so a concurrent reader never sees a partial entry
+        tmppath = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmppath, "wb") as fp:
+            fp.write(encode(tree))
+        os.replace(tmppath, filepath)
+
+    def parse(self, text: str, tparser: tp.TreeParser) -> tp.Tree:
+        """
+        return tree of html `text`; loaded from the cache if present,
+        else parsed with `tparser` and stored
+        """
+        filepath = self.entry_path(text)
+        tree = self.load(filepath)
+        if tree is not None:
+            self.hits += 1
+            return tree
+
+        self.misses += 1
+        tparser.feed(text)
+        tree = tparser.finalize()
+        self.store(filepath, tree)
+        return tree
+
+    def evict(self):
+        """
+        remove least recently used entries until the cache is within its cap
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, filepath in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(filepath)
+            total -= size
@@ -9,13 +9,20 @@ ideally preserve comments in generated html
 I realize that I'm going to end up implementing a really crude
 DOM and jquery, but that's kind of the point
 """
+import copy
 from typing import List, Optional, Tuple, Union
 from html.parser import HTMLParser
 from collections import deque, namedtuple, defaultdict
 
+import htmlscanner
+
 ### Data structs
 
 
+# bound on the distinct whitespace runs shared by a TreeParser
+MAX_SHARED_WHITESPACE = 4096
+
+
 class MissingStartTag(Exception):
     """malformed html- missing start tag"""
 
@@ -74,8 +81,14 @@ class DataNode(ClosedNode):
     handle these like self-enclosing tags
     """
 
+    # most nodes are data nodes; these are the same for all, so they're
+    # class attributes rather than allocated per node
+    tag = "DATA"
+    attrs = None
+    closing_marker = False
+    children = ()
+
     def __init__(self, data):
-        super().__init__("DATA")
         self.data = data
 
 
@@ -84,8 +97,12 @@ class CommentNode(ClosedNode):
     represents a comment
     """
 
+    tag = "COMMENT"
+    attrs = None
+    closing_marker = False
+    children = ()
+
     def __init__(self, comment):
-        super().__init__("COMMENT")
         self.comment = comment
 
 
@@ -197,7 +214,7 @@ class QMNode:
         """
         return parent node
         """
-        return QMNode(self._tree.get_parent(self.node))
+        return QMNode(self._tree.get_parent(self.node), self._tree)
 
     def child(self, tag: str = None, attr: str = None, attrval: str = None):
         """return first matching child"""
@@ -251,6 +268,7 @@ class QMNode:
         """
         set attr
         """
+        self.node = self._tree.own(self.node)
         attridx = self.get_attr_index(attr)
         # if attr not found, add it
         if attridx == -1:
@@ -258,6 +276,22 @@ class QMNode:
         else:
             self.node.attrs[attridx] = (attr, attrval)
 
+    def insert_child(self, child: Node, pos: int = -1):
+        """
+        insert `child` at position `pos` among children
+        by default, `child` is appended
+        """
+        self.node = self._tree.own(self.node)
+        if pos == -1:
+            self.node.children.append(child)
+        else:
+            self.node.children.insert(pos, child)
+        # keep tree indices consistent
+        self._tree.parent_idx[child] = self.node
+        for key, value in child.attrs or []:
+            if key == "id":
+                self._tree.id_idx[value] = child
+
     def set_class(self, classname: str):
         """
         this will remove any existing classes
@@ -269,6 +303,7 @@ class QMNode:
         """
         this will add a class to existing classes
         """
+        self.node = self._tree.own(self.node)
         attridx = self.get_attr_index("class")
         if attridx == -1:
             self.node.attrs.append(("class", classname))
@@ -292,6 +327,68 @@ class Tree:
         self.root = root
         self.id_idx = id_idx
         self.parent_idx = parent_idx
+        # copy-on-write state, see `clone`
+        # nodes shared with the tree this was cloned from; None if not a clone
+        self.shared: Optional[set] = None
+        # shared node -> this tree's copy of it
+        self.copies: dict = {}
+
+    def node_set(self) -> set:
+        """
+        return all nodes in the tree
+        """
+        result = set()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            result.add(node)
+            stack.extend(node.children)
+        return result
+
+    def clone(self, shared: set = None) -> "Tree":
+        """
+        return a copy-on-write clone of this tree. The clone shares nodes with
+        this tree; a shared node is copied (along with its ancestors) the
+        first time it's modified through a QMNode, see `own`.
+        `shared` is this tree's `node_set`; pass it to avoid recomputing it per clone
+        """
+        clone = Tree(self.root, dict(self.id_idx), dict(self.parent_idx))
+        clone.shared = self.node_set() if shared is None else shared
+        return clone
+
+    def own(self, node: Node) -> Node:
+        """
+        return `node`, or if `node` is shared with another tree, this tree's
+        copy of it; which is made on first call
+        """
+        if self.shared is None or node not in self.shared:
+            return node
+        if node in self.copies:
+            return self.copies[node]
+
+        node_copy = copy.copy(node)
+        node_copy.children = list(node.children)
+        if node.attrs is not None:
+            node_copy.attrs = list(node.attrs)
+        self.copies[node] = node_copy
+
+        if node is self.root:
+            self.root = node_copy
+        else:
+            # the root's children aren't in parent_idx
+            parent = self.own(self.parent_idx.get(node, self.root))
+            siblings = parent.children
+            siblings[siblings.index(node)] = node_copy
+            if node in self.parent_idx:
+                del self.parent_idx[node]
+                self.parent_idx[node_copy] = parent
+            for child in node_copy.children:
+                self.parent_idx[child] = node_copy
+
+        for key, value in node_copy.attrs or []:
+            if key == "id" and self.id_idx.get(value) is node:
+                self.id_idx[value] = node_copy
+        return node_copy
 
     def get_parent(self, node: Node):
         """
@@ -370,10 +467,21 @@ class TreeParser(HTMLParser):
         - nodes in between are children, which are coalesced in `coalesce`
           i.e. added as children
         - at the end, any remaining children must be children of root
+
+    Documents fed whole are tokenized by htmlscanner, which is several times
+    faster; input it can't handle is parsed by HTMLParser. `fast=False`
+    always uses HTMLParser.
     """
 
-    def __init__(self):
+    def __init__(self, fast: bool = True):
         super().__init__()
+        self.fast = fast
+        # number of documents tokenized by htmlscanner, and by HTMLParser
+        # since htmlscanner couldn't handle them
+        self.scanned = 0
+        self.fallbacks = 0
+        # whitespace run -> the str shared by all data nodes with that text
+        self.whitespace: dict = {}
         self._init()
 
     def _init(self):
@@ -396,6 +504,23 @@ class TreeParser(HTMLParser):
         self.parent_idx = {}
         self.output_tree = None  # the DOM tree that the parser produces
 
+    def feed(self, data: str):
+        """
+        parse `data`; a whole document, or part of one
+        """
+        # htmlscanner only tokenizes from the start of a document
+        fresh = not (self.rawdata or self.nodes or self.root.doctype)
+        if self.fast and fresh and self.cdata_elem is None:
+            try:
+                htmlscanner.scan(data, self)
+                self.scanned += 1
+                return
+            except htmlscanner.Unsupported:
+                # discard the partial tree
+                self._init()
+                self.fallbacks += 1
+        super().feed(data)
+
     def update_indices(self, node: Node):
         # index id
         for key, value in node.attrs:
@@ -425,7 +550,8 @@ class TreeParser(HTMLParser):
         node = self.nodes[starttag_idx]
         # construct specific node
         node = OpenClosedNode(tag, node.attrs)
-        node.children = self.coalesce(self.nodes[starttag_idx + 1 :])
+        start = starttag_idx + 1
+        node.children = self.coalesce(self.nodes[start:])
         # drop everything upto starttag_idx
         self.nodes = self.nodes[:starttag_idx]
         self.nodes.append(node)
@@ -442,6 +568,9 @@ class TreeParser(HTMLParser):
 
     def handle_data(self, data: str):
         """handle data, i.e. the non-tag body of a tag"""
+        if data.isspace() and len(self.whitespace) < MAX_SHARED_WHITESPACE:
+            # most text nodes are indentation; share one copy of each run
+            data = self.whitespace.setdefault(data, data)
         node = DataNode(data)
         self.nodes.append(node)
 
@@ -468,7 +597,8 @@ class TreeParser(HTMLParser):
             # this node hasn't been closed; we can definitively say this is
             # stanalone, i.e. ClosedNode
             if isinstance(node, UndeterminedNode):
-                result.append(ClosedNode(tag=node.tag, attrs=node.attrs))
+                node = ClosedNode(tag=node.tag, attrs=node.attrs)
+                result.append(node)
                 self.update_indices(node)
             else:
                 result.append(node)
@@ -486,11 +616,15 @@ class TreeParser(HTMLParser):
 
         # condition makes operation idempotent
         # Note: this operation can only be called once
+        # handle text HTMLParser buffered, e.g. a trailing "&amp"
+        self.close()
         for node in self.nodes:
             self.root.children.append(node)
         result = Tree(self.root, self.id_idx, self.parent_idx)
-        # reset all internal data structure
+        # reset all internal data structure, including HTMLParser's, so
+        # an incomplete document doesn't carry over to the next one
         self._init()
+        self.reset()
         return result
 
 
@@ -517,7 +651,8 @@ class TreePrinter:
         if isinstance(node, RootNode):
             return f"<!{node.doctype}>" if node.doctype else ""
         if isinstance(node, CommentNode):
-            return f"<!-- { node.comment} -->"
+            # the comment is printed verbatim, so printing and re-parsing is lossless
+            return f"<!--{node.comment}-->"
         if isinstance(node, DataNode):
             return node.data
 
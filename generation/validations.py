@@ -1,3 +1,4 @@
+import hashlib
 import itertools
 import os
 
@@ -25,6 +26,118 @@ class ValidationError(Exception):
     Generic exception raised on validation failure
     """
 
+
+def compare_navs(idx_nav: treeparser.QMNode, gen_nav: treeparser.QMNode):
+    """
+    raise ValidationError unless the navbars only differ in 'active' class
+    """
+    # get diff
+    navdiff = treediff.compare(idx_nav, gen_nav)
+    # uncomment to pretty print diff
+    # treediff.pretty_print_diff(navdiff)
+    for subdiff in navdiff:
+        if isinstance(subdiff, treediff.UpdateAttrib):
+            attrname = subdiff.path.tail().node
+            if attrname == "class":
+                classdiff = set(subdiff.old_value.split()).symmetric_difference(
+                    set(subdiff.new_value.split())
+                )
+                # check that the only class is `active`
+                if len(classdiff) != 1 or next(iter(classdiff)) != "active":
+                    raise ValidationError(f"Unexpected change {subdiff}")
+            else:
+                raise ValidationError(f"Unexpected change {subdiff}")
+
+        else:
+            # this indicates something isn't as expected
+            raise ValidationError(f"Unexpected change {subdiff}")
+
+
+def check_unique_filenames(content_fpaths: dict):
+    """
+    raise ValidationError if content pages would clobber each other
+    """
+    counter: Dict[str, int] = defaultdict(int)
+    for section, filepaths in content_fpaths.items():
+        for filepath in filepaths:
+            counter[filepath] += 1
+            if counter[filepath] > 1:
+                raise ValidationError(f"Non-unique filename '{filepath}'")
+
+
+def find_nav(tree: treeparser.Tree) -> treeparser.QMNode:
+    """
+    return the navbar of `tree`; None if it has none
+    """
+    # assuming there is one navbar; stops there, unlike QMNode.descendent
+    stack = [tree.root]
+    while stack:
+        node = stack.pop()
+        if node.tag == "nav":
+            return treeparser.QMNode(node, tree)
+        stack.extend(reversed(node.children))
+    return None
+
+
+def nav_fingerprint(nav: treeparser.QMNode) -> bytes:
+    """
+    digest of navbar `nav`, with the 'active' class removed;
+    navbars with the same fingerprint only differ in 'active' class
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    stack = [nav.node]
+    while stack:
+        node = stack.pop()
+        attrs = []
+        for key, value in node.attrs or ():
+            if key == "class" and value and "active" in value.split():
+                value = " ".join(name for name in value.split() if name != "active")
+            attrs.append((key, value))
+        data = getattr(node, "data", None) or getattr(node, "comment", None)
+        digest.update(repr((node.tag, attrs, data, len(node.children))).encode())
+        stack.extend(reversed(node.children))
+    return digest.digest()
+
+
+class PageChecks:
+    """
+    validations applied to each page as it's written, so a build needn't
+    keep every tree; the same checks as run_validations, except unique
+    filenames, which only needs the filepaths (see check_unique_filenames).
+    Navbars are compared by fingerprint, so only the index tree is kept
+    """
+
+    def __init__(self, index_fpath: str, index_tree: treeparser.Tree):
+        if os.path.getsize(index_fpath) == 0:
+            raise ValidationError(f"file {index_fpath} is empty")
+        self.index_fpath = index_fpath
+        # the index tree is kept for a detailed diff on mismatch
+        self.index_tree = index_tree
+        self.index_nav = nav_fingerprint(find_nav(index_tree))
+        self.pages = 0
+
+    def check_page(self, filepath: str, tree: treeparser.Tree):
+        """
+        check the page written at `filepath` from `tree`
+        """
+        # validation: ensure files are not empty
+        if os.path.getsize(filepath) == 0:
+            raise ValidationError(f"file {filepath} is empty")
+
+        # validation: index and generated should have identical navbar, except for active
+        nav = find_nav(tree)
+        if nav is not None and nav_fingerprint(nav) != self.index_nav:
+            print(f"comparing {filepath}, {self.index_fpath}")
+            compare_navs(find_nav(self.index_tree), nav)
+        self.pages += 1
+
+    def finish(self):
+        """
+        called after all pages are checked
+        """
+        print(f"validations: {self.pages} pages checked")
+
+
 ### Run Validations
 
 
@@ -90,36 +203,12 @@ def run_validations(
     gen_page = next(iter(listing_fpaths.values()))
 
     print(f"comparing {gen_page}, {index_fpath}")
-    # get diff
-    navdiff = treediff.compare(idx_nav, gen_nav)
-    # uncomment to pretty print diff
-    # treediff.pretty_print_diff(navdiff)
-    for subdiff in navdiff:
-        if isinstance(subdiff, treediff.UpdateAttrib):
-            attrname = subdiff.path.tail().node
-            if attrname == "class":
-                classdiff = set(subdiff.old_value.split()).symmetric_difference(
-                    set(subdiff.new_value.split())
-                )
-                # check that the only class is `active`
-                if len(classdiff) != 1 or next(iter(classdiff)) != "active":
-                    raise ValidationError(f"Unexpected change {subdiff}")
-            else:
-                raise ValidationError(f"Unexpected change {subdiff}")
-
-        else:
-            # this indicates something isn't as expected
-            raise ValidationError(f"Unexpected change {subdiff}")
+    compare_navs(idx_nav, gen_nav)
 
     # validation: no files being clobbered because of non-unique file names
     vname = "file names are unique"
     print(f"Applying validation: {vname}")
-    counter: Dict[str, int] = defaultdict(int)
-    for section, filepaths in content_fpaths.items():
-        for filepath in filepaths:
-            counter[filepath] += 1
-            if counter[filepath] > 1:
-                raise ValidationError(f"Non-unique filename '{filepath}'")
+    check_unique_filenames(content_fpaths)
 
     # validations: all sections should have a reverse-chronological order
 #    vname = "content order reverse chronological"
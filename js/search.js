@@ -0,0 +1,158 @@
+/*
+ * client for the search index written by generation/searchindex.py
+ *
+ * search/docs.json lists the pages and the index shards; a shard,
+ * search/shards/<prefix>.json, holds the terms starting with the same
+ * `prefix` characters, and is only fetched when a query has a term starting
+ * with them.
+ *
+ * usage, on a page next to the search directory (see templates/head.jinja.html):
+ *     <input id="search-input" type="search">
+ *     <ul id="search-results"></ul>
+ *     <script src="js/search.js" data-search-dir="search/"></script>
+ *
+ * or from script: siteSearch("query").then(function (results) { ... })
+ * results are [{url, title, score}], best first. A query matches pages that
+ * have all its terms; a quoted query, e.g. "moral imperative", matches the
+ * terms as a phrase.
+ */
+(function () {
+    "use strict";
+
+    // the index directory, pagegen.SEARCH_DIR, is set by the including page
+    var script = document.currentScript;
+    var SEARCH_DIR = (script && script.dataset.searchDir) || "search/";
+    // same as textparser.TERM_PATTERN, i.e. letters and digits
+    var TERM = /[\p{L}\p{N}]+/gu;
+
+    var docs = null;
+    // prefix -> promise of shard
+    var shards = {};
+
+    function fetchJSON(url) {
+        return fetch(url).then(function (response) {
+            if (!response.ok) {
+                throw new Error(url + ": " + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function loadDocs() {
+        if (docs === null) {
+            docs = fetchJSON(SEARCH_DIR + "docs.json");
+        }
+        return docs;
+    }
+
+    function loadShard(index, prefix) {
+        if (index.shards.indexOf(prefix) < 0) {
+            return Promise.resolve({});
+        }
+        if (!(prefix in shards)) {
+            shards[prefix] = fetchJSON(SEARCH_DIR + "shards/" + prefix + ".json");
+        }
+        return shards[prefix];
+    }
+
+    function tokenize(text) {
+        return text.toLowerCase().match(TERM) || [];
+    }
+
+    // page id -> [positions], from a posting [id, position, delta, ...]
+    function decode(postings) {
+        var pages = {};
+        (postings || []).forEach(function (posting) {
+            var positions = [];
+            var position = 0;
+            for (var i = 1; i < posting.length; i++) {
+                position += posting[i];
+                positions.push(position);
+            }
+            pages[posting[0]] = positions;
+        });
+        return pages;
+    }
+
+    // number of times the terms occur in order, on a page
+    function phraseCount(positions) {
+        var following = positions.slice(1).map(function (list) {
+            return new Set(list);
+        });
+        return positions[0].filter(function (start) {
+            return following.every(function (set, i) {
+                return set.has(start + i + 1);
+            });
+        }).length;
+    }
+
+    function siteSearch(query) {
+        var terms = tokenize(query);
+        var phrase = /^\s*".*"\s*$/.test(query);
+        if (!terms.length) {
+            return Promise.resolve([]);
+        }
+        return loadDocs().then(function (index) {
+            return Promise.all(terms.map(function (term) {
+                return loadShard(index, term.slice(0, index.prefix));
+            })).then(function (loaded) {
+                var matches = terms.map(function (term, i) {
+                    return decode(loaded[i][term]);
+                });
+                var results = [];
+                Object.keys(matches[0]).forEach(function (id) {
+                    var positions = matches.map(function (pages) {
+                        return pages[id];
+                    });
+                    if (positions.some(function (list) { return !list; })) {
+                        return;
+                    }
+                    var score = phrase ? phraseCount(positions) : positions.reduce(
+                        function (sum, list) { return sum + list.length; }, 0);
+                    if (score && index.docs[id]) {
+                        results.push({
+                            url: index.docs[id][0],
+                            title: index.docs[id][1],
+                            score: score
+                        });
+                    }
+                });
+                return results.sort(function (a, b) { return b.score - a.score; });
+            });
+        });
+    }
+
+    function bind() {
+        var input = document.getElementById("search-input");
+        var list = document.getElementById("search-results");
+        if (!input || !list) {
+            return;
+        }
+        var latest = 0;
+        input.addEventListener("input", function () {
+            var request = ++latest;
+            siteSearch(input.value).then(function (results) {
+                // a later query may have finished first
+                if (request !== latest) {
+                    return;
+                }
+                list.textContent = "";
+                results.forEach(function (result) {
+                    var item = document.createElement("li");
+                    var link = document.createElement("a");
+                    link.href = result.url;
+                    link.textContent = result.title;
+                    item.appendChild(link);
+                    list.appendChild(item);
+                });
+            });
+        });
+    }
+
+    window.siteSearch = siteSearch;
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", bind);
+    } else {
+        bind();
+    }
+})();